@@ -47,7 +47,29 @@ Usage::
     >>> quads.visualize(tree)
 
 """
+from array import array
+import asyncio
+import bisect
+import contextlib
+import copy
+import csv
+import heapq
+import io
+import itertools
+import json
 import math
+import mmap
+import multiprocessing
+import operator
+import os
+import pickle
+import random
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import zlib
 
 
 __author__ = "Daniel Lindsley"
@@ -55,6 +77,67 @@ __license__ = "New BSD"
 __version__ = (1, 1, 0)
 
 
+# The binary layout used by `QuadTree.dump` & `QuadTree.load`. All values
+# are little-endian & every section starts on an 8-byte boundary.
+#
+# * The header (`_HEADER`).
+# * The node table: one `_NODE` record per node, in pre-order (a node,
+#   then it's `ul`, `ur`, `ll` & `lr` subtrees). Each record holds the
+#   node's cell, depth, flags, where it's own points start, how many it
+#   has, the size of it's whole subtree & the indexes of it's children
+#   (`-1` if missing). A subtree's points are contiguous.
+# * The X coordinates of every point, as doubles, in the same order.
+# * The Y coordinates, likewise.
+# * One byte per point, flagging which of it's coordinates were `int`s
+#   (so they come back as `int`s), padded to 8 bytes. Node records carry
+#   the same flags for their cell.
+# * The payload index: `point_count + 1` offsets into the payloads.
+# * The payloads: each point's pickled `data`. `None` is stored as an
+#   empty payload.
+FORMAT_MAGIC = b"QUADTREE"
+FORMAT_VERSION = 1
+_HEADER = struct.Struct("<8sHHIqqqqqqqqqq")
+_NODE = struct.Struct("<4dqqqqq4q")
+_FLAG_INDEX = 1
+_FLAG_AUTO_EXPAND = 2
+_FLAG_COMPRESSED = 4
+_NODE_SUBDIVIDED = 1
+# Node flags for `int` cell values start here, one bit each for the center
+# X/Y, width & height.
+_NODE_INT_SHIFT = 1
+# Bits (once shifted back down) for a node's `int` cell values. See
+# `_cell_int_flags`.
+_CELL_X_INT = 1
+_CELL_Y_INT = 2
+_CELL_WIDTH_INT = 4
+_CELL_HEIGHT_INT = 8
+# Bits in the per-point kinds, for `int` coordinates.
+_X_INT = 1
+_Y_INT = 2
+
+
+# The sorted runs written by `build_file` hold a Morton key (as big-endian
+# bytes), then a `_RUN_RECORD` (the input order, the coordinates, their
+# `int` flags & the payload length), then the pickled payload.
+_RUN_RECORD = struct.Struct("<qddBI")
+# How many runs get merged at once. More runs than this are merged in
+# several passes, so the number of open files stays bounded.
+_MERGE_FAN_IN = 64
+# Quadrants, in the order their Morton key digits sort (& nodes are dumped).
+_QUADRANTS = ("ul", "ur", "ll", "lr")
+_QUADRANT_CODES = {"ul": 0, "ur": 1, "ll": 2, "lr": 3}
+
+# The records appended to a `DurableQuadTree` log. Each is a CRC32 of the
+# rest of the record, a `_LOG_RECORD` (the payload length, the operation,
+# the `int` flags for the coordinates & the coordinates themselves), then
+# the pickled payload (the point's data, or the key for `remove_by_key`).
+_LOG_CHECKSUM = struct.Struct("<I")
+_LOG_RECORD = struct.Struct("<IBBdd")
+_LOG_INSERT = 1
+_LOG_REMOVE = 2
+_LOG_REMOVE_BY_KEY = 3
+
+
 def euclidean_compare(ref_point, check_point):
     """
     Calculates a raw euclidean value for comparison with other raw values.
@@ -93,6 +176,283 @@ def euclidean_distance(ref_point, check_point):
     return math.sqrt(euclidean_compare(ref_point, check_point))
 
 
+_get_x = operator.attrgetter("x")
+_get_y = operator.attrgetter("y")
+
+
+def _quadrant_of(center_x, center_y, x, y):
+    # Which quadrant of a cell centered on `(center_x, center_y)` the
+    # coordinates fall into. Shared by the nodes so routing is identical.
+    if x < center_x:
+        return "ul" if y >= center_y else "ll"
+
+    return "ur" if y >= center_y else "lr"
+
+
+def _child_cell(center_x, center_y, width, height, quadrant):
+    # Computes `(center_x, center_y, width, height)` of one quadrant of a
+    # cell. Always derive child cells through here, so the float math
+    # matches no matter how a cell was reached.
+    half_width = width / 2
+    half_height = height / 2
+    quarter_width = half_width / 2
+    quarter_height = half_height / 2
+
+    if quadrant in ("ul", "ll"):
+        center_x = center_x - quarter_width
+    else:
+        center_x = center_x + quarter_width
+
+    if quadrant in ("ul", "ur"):
+        center_y = center_y + quarter_height
+    else:
+        center_y = center_y - quarter_height
+
+    return center_x, center_y, half_width, half_height
+
+
+def _segment_compare(x, y, x0, y0, x1, y1):
+    # The squared distance from `(x, y)` to the segment `(x0, y0)-(x1, y1)`.
+    dx, dy = x1 - x0, y1 - y0
+    length = dx * dx + dy * dy
+
+    if length:
+        t = max(0, min(1, ((x - x0) * dx + (y - y0) * dy) / length))
+        x0, y0 = x0 + t * dx, y0 + t * dy
+
+    return (x - x0) ** 2 + (y - y0) ** 2
+
+
+def _ray_entry(bb, origin_x, origin_y, dx, dy, pad=0):
+    # Where (as a distance along the normalized direction) the ray enters
+    # the bounding box, grown by `pad` on all sides. `None` if it misses.
+    t_min, t_max = 0, math.inf
+
+    for start, step, low, high in (
+        (origin_x, dx, bb.min_x - pad, bb.max_x + pad),
+        (origin_y, dy, bb.min_y - pad, bb.max_y + pad),
+    ):
+        if step == 0:
+            if not low <= start <= high:
+                return None
+
+            continue
+
+        t0, t1 = (low - start) / step, (high - start) / step
+
+        if t0 > t1:
+            t0, t1 = t1, t0
+
+        t_min, t_max = max(t_min, t0), min(t_max, t1)
+
+        if t_min > t_max:
+            return None
+
+    return t_min
+
+
+def _segment_bb_compare(bb, x0, y0, x1, y1):
+    # The squared distance between a segment & a bounding box (`0` if they
+    # touch).
+    dx, dy = x1 - x0, y1 - y0
+    length = math.sqrt(dx * dx + dy * dy)
+
+    if length:
+        entry = _ray_entry(bb, x0, y0, dx / length, dy / length)
+
+        if entry is not None and entry <= length:
+            return 0
+    elif bb.min_x <= x0 <= bb.max_x and bb.min_y <= y0 <= bb.max_y:
+        return 0
+
+    # Otherwise, the closest approach involves an end of the segment or a
+    # corner of the box.
+    nearest = min(
+        _segment_compare(corner_x, corner_y, x0, y0, x1, y1)
+        for corner_x in (bb.min_x, bb.max_x)
+        for corner_y in (bb.min_y, bb.max_y)
+    )
+
+    for x, y in ((x0, y0), (x1, y1)):
+        nearest_x = max(bb.min_x, min(x, bb.max_x))
+        nearest_y = max(bb.min_y, min(y, bb.max_y))
+        nearest = min(nearest, (x - nearest_x) ** 2 + (y - nearest_y) ** 2)
+
+    return nearest
+
+
+def _read_header(data):
+    # Unpacks & checks the header of the binary format.
+    if len(data) < _HEADER.size:
+        raise ValueError("Not a dumped quadtree (too short).")
+
+    fields = _HEADER.unpack_from(data, 0)
+
+    if fields[0] != FORMAT_MAGIC:
+        raise ValueError("Not a dumped quadtree.")
+
+    if fields[1] > FORMAT_VERSION:
+        raise ValueError(
+            "Unsupported format version {} (expected {} or older).".format(
+                fields[1], FORMAT_VERSION
+            )
+        )
+
+    return dict(
+        zip(
+            (
+                "magic",
+                "version",
+                "flags",
+                "reserved",
+                "capacity",
+                "max_depth",
+                "node_count",
+                "point_count",
+                "nodes_offset",
+                "xs_offset",
+                "ys_offset",
+                "kinds_offset",
+                "payload_index_offset",
+                "payload_offset",
+            ),
+            fields,
+        )
+    )
+
+
+def _read_array(data, typecode, offset, length):
+    # Reads a little-endian `array` out of the binary format.
+    values = array(typecode)
+    values.frombytes(data[offset:offset + 8 * length])
+
+    if sys.byteorder != "little":  # pragma: no cover
+        values.byteswap()
+
+    return values
+
+
+def _cell_bounds(record):
+    # The bounds of a node record from the binary format, computed the same
+    # way as `QuadNode._calc_bounding_box`.
+    half_width = record[2] / 2
+    half_height = record[3] / 2
+    return (
+        record[0] - half_width,
+        record[1] - half_height,
+        record[0] + half_width,
+        record[1] + half_height,
+    )
+
+
+def _cell_contains(record, x, y):
+    min_x, min_y, max_x, max_y = _cell_bounds(record)
+    return min_x <= x <= max_x and min_y <= y <= max_y
+
+
+def _morton_key(center_x, center_y, width, height, x, y, depth):
+    # The quadrants a point routes through from a cell, `depth` levels
+    # deep, as base-4 digits. Sorting by these puts the points in the same
+    # order as a pre-order walk of the tree.
+    key = 0
+
+    for _ in range(depth):
+        quadrant = _quadrant_of(center_x, center_y, x, y)
+        key = key << 2 | _QUADRANT_CODES[quadrant]
+        center_x, center_y, width, height = _child_cell(
+            center_x, center_y, width, height, quadrant
+        )
+
+    return key
+
+
+def _partition_cells(center_x, center_y, width, height, depth):
+    # The cells of every node `depth` levels down, in Morton order (so a
+    # point's `_morton_key` to that depth is the offset of it's cell).
+    cells = [(center_x, center_y, width, height)]
+
+    for _ in range(depth):
+        cells = [
+            _child_cell(*cell, quadrant=quadrant)
+            for cell in cells
+            for quadrant in _QUADRANTS
+        ]
+
+    return cells
+
+
+def _write_run(records, path):
+    # Writes sorted `(key, order, x, y, kind, payload)` records to a file.
+    with open(path, "wb") as run_file:
+        for key, order, x, y, kind, payload in records:
+            run_file.write(key)
+            run_file.write(_RUN_RECORD.pack(order, x, y, kind, len(payload)))
+            run_file.write(payload)
+
+
+def _read_run(path, key_size):
+    # Reads back (lazily) the records written by `_write_run`.
+    record_size = key_size + _RUN_RECORD.size
+
+    with open(path, "rb") as run_file:
+        while True:
+            head = run_file.read(record_size)
+
+            if not head:
+                return
+
+            order, x, y, kind, length = _RUN_RECORD.unpack_from(
+                head, key_size
+            )
+            yield head[:key_size], order, x, y, kind, run_file.read(length)
+
+
+def _int_flags(*values):
+    # One bit per value, set if it's an `int`.
+    flags = 0
+
+    for offset, value in enumerate(values):
+        if isinstance(value, int):
+            flags |= 1 << offset
+
+    return flags
+
+
+def _cell_int_flags(center_x, center_y, width, height):
+    # The `_CELL_*_INT` bits for a node's cell, before shifting them up past
+    # the other node flags.
+    flags = 0
+
+    for value, bit in (
+        (center_x, _CELL_X_INT),
+        (center_y, _CELL_Y_INT),
+        (width, _CELL_WIDTH_INT),
+        (height, _CELL_HEIGHT_INT),
+    ):
+        if isinstance(value, int):
+            flags |= bit
+
+    return flags
+
+
+def _restore_int(value, flags, bit):
+    # Turns a double back into an `int` if it started out as one.
+    return int(value) if flags & bit else value
+
+
+def _unwind_removal(searched, point):
+    # `point` was just removed from the last node of the `searched` path.
+    # Update the cached counts, sums & aggregates, from the leaf up.
+    # (Min/max style aggregates can't be "subtracted", so those get rebuilt.)
+    for node in reversed(searched):
+        node.count -= 1
+        node.sum_x -= point.x
+        node.sum_y -= point.y
+
+        if node.aggregates:
+            node.refresh_aggregates()
+
+
 def visualize(tree, size=10):  # pragma: no cover
     """
     Using `matplotlib`, generates a visualization of the `QuadTree`.
@@ -116,14 +476,15 @@ def visualize(tree, size=10):  # pragma: no cover
         for pnt in node.points:
             pyplot.plot(pnt.x, pnt.y, ".")
 
-        if node.ul:
+        if node.subdivided:
             draw_lines(node)
+        if node.ul is not None:
             draw_all_nodes(node.ul)
-        if node.ur:
+        if node.ur is not None:
             draw_all_nodes(node.ur)
-        if node.ll:
+        if node.ll is not None:
             draw_all_nodes(node.ll)
-        if node.lr:
+        if node.lr is not None:
             draw_all_nodes(node.lr)
 
     def draw_lines(node):
@@ -162,6 +523,154 @@ def visualize(tree, size=10):  # pragma: no cover
     pyplot.show()
 
 
+def read_csv(fp, x_field="x", y_field="y", **kwargs):
+    """
+    Reads points (lazily) from a CSV file with a header row.
+
+    Rows are read one at a time, so this can feed `QuadTree.insert_many`
+    from files far larger than memory.
+
+    Usage::
+
+        >>> with open("places.csv", newline="") as csv_file:
+        ...     tree.insert_many(quads.read_csv(csv_file))
+
+    Args:
+        fp (file): A file-like object opened for reading text.
+        x_field (str): Optional. The column holding the X coordinates.
+            Default is `"x"`.
+        y_field (str): Optional. The column holding the Y coordinates.
+            Default is `"y"`.
+        **kwargs: Any other options (like `delimiter`) to pass along to
+            `csv.DictReader`.
+
+    Returns:
+        iterable: `Point` objects. Their `data` is a `dict` of the other
+            columns, or `None` if there aren't any.
+    """
+    for row in csv.DictReader(fp, **kwargs):
+        x = float(row.pop(x_field))
+        y = float(row.pop(y_field))
+        yield Point(x, y, data=row or None)
+
+
+def read_geojson(fp):
+    """
+    Reads points (lazily) from newline-delimited GeoJSON.
+
+    Each line should be a `Feature` with a `Point` geometry (or a bare
+    `Point` geometry). Blank lines are skipped.
+
+    Args:
+        fp (file): A file-like object opened for reading text.
+
+    Returns:
+        iterable: `Point` objects. Their `data` is the feature's
+            `properties`.
+    """
+    for line in fp:
+        if not line.strip():
+            continue
+
+        feature = json.loads(line)
+        properties = None
+
+        if feature.get("type") == "Feature":
+            properties = feature.get("properties")
+            feature = feature.get("geometry") or {}
+
+        if feature.get("type") != "Point":
+            raise ValueError(
+                "Only `Point` geometries are supported, not {!r}.".format(
+                    feature.get("type")
+                )
+            )
+
+        x, y = feature["coordinates"][:2]
+        yield Point(x, y, data=properties)
+
+
+def write_csv(points, fp, x_field="x", y_field="y", fields=None, **kwargs):
+    """
+    Writes points (as they're iterated) to a CSV file, with a header row.
+
+    Pass the tree itself or `QuadTree.iter_within_bb`, so the points are
+    never collected in memory.
+
+    Usage::
+
+        >>> with open("places.csv", "w", newline="") as csv_file:
+        ...     quads.write_csv(tree, csv_file, fields=["name"])
+
+    Args:
+        points (iterable): The `Point` objects to write.
+        fp (file): A file-like object opened for writing text.
+        x_field (str): Optional. The column for the X coordinates. Default
+            is `"x"`.
+        y_field (str): Optional. The column for the Y coordinates. Default
+            is `"y"`.
+        fields (list): Optional. Keys from each point's `data` (a `dict`)
+            to write as extra columns. Default is `None` (no extra columns).
+        **kwargs: Any other options (like `delimiter`) to pass along to
+            `csv.DictWriter`.
+
+    Returns:
+        int: How many points were written.
+    """
+    writer = csv.DictWriter(
+        fp,
+        [x_field, y_field] + list(fields or []),
+        extrasaction="ignore",
+        **kwargs
+    )
+    writer.writeheader()
+    written = 0
+
+    for pnt in points:
+        row = dict(pnt.data) if isinstance(pnt.data, dict) else {}
+        row[x_field] = pnt.x
+        row[y_field] = pnt.y
+        writer.writerow(row)
+        written += 1
+
+    return written
+
+
+def write_geojson(points, fp):
+    """
+    Writes points (as they're iterated) as newline-delimited GeoJSON, one
+    `Feature` per line.
+
+    A point's `data` becomes the `properties` if it's a `dict` (or `None`).
+    Anything else is stored as `{"data": ...}`, so must be JSON-friendly.
+
+    Args:
+        points (iterable): The `Point` objects to write.
+        fp (file): A file-like object opened for writing text.
+
+    Returns:
+        int: How many points were written.
+    """
+    written = 0
+
+    for pnt in points:
+        properties = pnt.data
+
+        if not (properties is None or isinstance(properties, dict)):
+            properties = {"data": properties}
+
+        feature = {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [pnt.x, pnt.y]},
+            "properties": properties,
+        }
+        fp.write(json.dumps(feature))
+        fp.write("\n")
+        written += 1
+
+    return written
+
+
 class Point(object):
     """
     An object representing X/Y cartesean coordinates.
@@ -249,6 +758,57 @@ class BoundingBox(object):
             and self.min_y <= point.y <= self.max_y
         )
 
+    def contains_bb(self, other_bb):
+        """
+        Checks if another bounding box is entirely within this bounding box.
+
+        Args:
+            other_bb (BoundingBox): The bounding box to check.
+
+        Returns:
+            bool: `True` if it's fully contained, otherwise `False`.
+        """
+        return (
+            self.min_x <= other_bb.min_x
+            and other_bb.max_x <= self.max_x
+            and self.min_y <= other_bb.min_y
+            and other_bb.max_y <= self.max_y
+        )
+
+    def point_compare(self, point):
+        """
+        Calculates a raw euclidean value between a point & the nearest part
+        of the bounding box, for comparison with other raw values.
+
+        Like `euclidean_compare`, this skips the square root.
+
+        Args:
+            point (Point): The point to check.
+
+        Returns:
+            int|float: The squared distance (`0` if the point is within).
+        """
+        dx = max(self.min_x - point.x, 0, point.x - self.max_x)
+        dy = max(self.min_y - point.y, 0, point.y - self.max_y)
+        return dx ** 2 + dy ** 2
+
+    def bb_compare(self, other_bb):
+        """
+        Calculates a raw euclidean value for the gap between two bounding
+        boxes, for comparison with other raw values.
+
+        Like `euclidean_compare`, this skips the square root.
+
+        Args:
+            other_bb (BoundingBox): The bounding box to check.
+
+        Returns:
+            int|float: The squared distance (`0` if they intersect).
+        """
+        dx = max(self.min_x - other_bb.max_x, 0, other_bb.min_x - self.max_x)
+        dy = max(self.min_y - other_bb.max_y, 0, other_bb.min_y - self.max_y)
+        return dx ** 2 + dy ** 2
+
     def intersects(self, other_bb):
         """
         Checks if another bounding box intersects with this bounding box.
@@ -267,6 +827,146 @@ class BoundingBox(object):
         )
 
 
+class Aggregate(object):
+    """
+    An aggregate value each `QuadNode` maintains over it's points.
+
+    Register one with `QuadTree.register_aggregate`, then query it with
+    `QuadTree.aggregate_within_bb`.
+
+    Usage::
+
+        >>> tree.register_aggregate(
+        ...     "total", quads.Aggregate.sum(lambda data: data["price"])
+        ... )
+        >>> tree.aggregate_within_bb(bb, "total")
+        1450.25
+    """
+
+    def __init__(self, key, combine, finalize=None):
+        """
+        Constructs an `Aggregate` object.
+
+        Args:
+            key (callable): Takes a point's `data` & returns the value to
+                aggregate.
+            combine (callable): Takes two aggregated values & returns the
+                combination of them. Must be associative & commutative.
+            finalize (callable): Optional. Turns the combined value into the
+                final result. Default is `None` (return it as-is).
+        """
+        self.key = key
+        self.combine = combine
+        self.finalize = finalize
+
+    @classmethod
+    def count(cls):
+        """
+        Counts the points.
+
+        Returns:
+            Aggregate: The aggregate.
+        """
+        return cls(lambda data: 1, operator.add)
+
+    @classmethod
+    def sum(cls, key):
+        """
+        Sums `key(data)` across the points.
+
+        Args:
+            key (callable): Takes a point's `data` & returns a number.
+
+        Returns:
+            Aggregate: The aggregate.
+        """
+        return cls(key, operator.add)
+
+    @classmethod
+    def min(cls, key):
+        """
+        Finds the smallest `key(data)` across the points.
+
+        Args:
+            key (callable): Takes a point's `data` & returns a value.
+
+        Returns:
+            Aggregate: The aggregate.
+        """
+        return cls(key, min)
+
+    @classmethod
+    def max(cls, key):
+        """
+        Finds the largest `key(data)` across the points.
+
+        Args:
+            key (callable): Takes a point's `data` & returns a value.
+
+        Returns:
+            Aggregate: The aggregate.
+        """
+        return cls(key, max)
+
+    @classmethod
+    def mean(cls, key):
+        """
+        Averages `key(data)` across the points.
+
+        Args:
+            key (callable): Takes a point's `data` & returns a number.
+
+        Returns:
+            Aggregate: The aggregate.
+        """
+        return cls(
+            lambda data: (key(data), 1),
+            lambda a, b: (a[0] + b[0], a[1] + b[1]),
+            lambda total: total[0] / total[1],
+        )
+
+    def result(self, value):
+        """
+        Produces the final result from a combined value.
+
+        Args:
+            value (any): The combined value.
+
+        Returns:
+            any: The result.
+        """
+        if self.finalize is None:
+            return value
+
+        return self.finalize(value)
+
+
+class Cluster(object):
+    """
+    A group of nearby points, summarized by their count & centroid.
+
+    Returned by `QuadTree.clusters`.
+    """
+
+    def __init__(self, x, y, count, bounding_box):
+        """
+        Constructs a `Cluster` object.
+
+        Args:
+            x (int|float): The X coordinate of the centroid.
+            y (int|float): The Y coordinate of the centroid.
+            count (int): The number of points in the cluster.
+            bounding_box (BoundingBox): The region the cluster covers.
+        """
+        self.x = x
+        self.y = y
+        self.count = count
+        self.bounding_box = bounding_box
+
+    def __repr__(self):
+        return "<Cluster: ({}, {}) x{}>".format(self.x, self.y, self.count)
+
+
 class QuadNode(object):
     """
     A node within the QuadTree.
@@ -274,13 +974,29 @@ class QuadNode(object):
     Typically, you won't use this object directly. The `QuadTree` object
     provides a more convenient API. However, if you know what you're doing
     or need to customize, `QuadNode` is here.
+
+    Nodes stop subdividing at `max_depth` (`MAX_DEPTH`, `32`, by default),
+    & a node whose points all share the same coordinates never subdivides.
+    Either way, the node grows past it's capacity instead. Older versions
+    subdivided without limit (which never finished for duplicate points).
+    For trees that really need to go deeper, pass a larger `max_depth`.
     """
 
     POINT_CAPACITY = 4
+    MAX_DEPTH = 32
     point_class = Point
     bb_class = BoundingBox
 
-    def __init__(self, center, width, height, capacity=None):
+    def __init__(
+        self,
+        center,
+        width,
+        height,
+        capacity=None,
+        max_depth=None,
+        depth=0,
+        aggregates=None,
+    ):
         """
         Constructs a `QuadNode` object.
 
@@ -291,6 +1007,16 @@ class QuadNode(object):
             capacity (int): Optional. The number of points per quad before
                 subdivision occurs. Default is `None`, which defers to
                 `QuadNode.POINT_CAPACITY`, which is `4`.
+            max_depth (int): Optional. The deepest a node can be before it
+                stops subdividing & simply holds every point given to it.
+                Default is `None`, which defers to `QuadNode.MAX_DEPTH`,
+                which is `32`.
+            depth (int): Optional. How deep this node is within the tree.
+                Default is `0` (the root).
+            aggregates (dict): Optional. A mapping of names to `Aggregate`
+                objects, shared by every node in the tree. Each node keeps
+                the aggregated values of it's subtree in
+                `aggregate_values`. Default is `None`.
         """
         self.center = center
         self.width = width
@@ -301,11 +1027,29 @@ class QuadNode(object):
         self.ur = None
         self.ll = None
         self.lr = None
+        self.subdivided = False
 
         if capacity is None:
             capacity = self.POINT_CAPACITY
 
+        if max_depth is None:
+            max_depth = self.MAX_DEPTH
+
+        if aggregates is None:
+            aggregates = {}
+
         self.capacity = capacity
+        self.max_depth = max_depth
+        self.depth = depth
+        self.aggregates = aggregates
+        self.aggregate_values = {}
+        # The number of points within this node & it's children, plus the
+        # sums of their coordinates (for the centroid).
+        self.count = 0
+        self.sum_x = 0
+        self.sum_y = 0
+        # Which version of the tree owns this node. See `QuadTree.snapshot`.
+        self.epoch = 0
         self.bounding_box = self._calc_bounding_box()
 
     def __repr__(self):
@@ -373,6 +1117,21 @@ class QuadNode(object):
         if self.lr is not None:
             yield from self.lr
 
+    def centroid(self):
+        """
+        Returns the average location of the points within the node & it's
+        children.
+
+        Returns:
+            Point|None: The centroid, or `None` if the node is empty.
+        """
+        if not self.count:
+            return None
+
+        return self.point_class(
+            self.sum_x / self.count, self.sum_y / self.count
+        )
+
     def _calc_bounding_box(self):
         half_width = self.width / 2
         half_height = self.height / 2
@@ -467,61 +1226,158 @@ class QuadNode(object):
         """
         return point.x >= self.center.x and point.y < self.center.y
 
-    def subdivide(self):
+    def quadrant(self, point):
         """
-        Subdivides an existing node into the node + children.
+        Returns the name of the quadrant a point would fall into.
 
-        Returns:
-            None: Nothing to see here. Please go about your business.
-        """
-        half_width = self.width / 2
-        half_height = self.height / 2
-        quarter_width = half_width / 2
-        quarter_height = half_height / 2
+        This is a bounding check, not verification the point is present in
+        the data.
 
-        ul_center = self.point_class(
-            self.center.x - quarter_width, self.center.y + quarter_height
-        )
-        self.ul = self.__class__(
-            ul_center, half_width, half_height, capacity=self.capacity
-        )
+        Args:
+            point (Point): The point to check.
 
-        ur_center = self.point_class(
-            self.center.x + quarter_width, self.center.y + quarter_height
-        )
-        self.ur = self.__class__(
-            ur_center, half_width, half_height, capacity=self.capacity
-        )
+        Returns:
+            str: One of `"ul"`, `"ur"`, `"ll"` or `"lr"`.
+        """
+        return _quadrant_of(self.center.x, self.center.y, point.x, point.y)
 
-        ll_center = self.point_class(
-            self.center.x - quarter_width, self.center.y - quarter_height
+    def _create_child(self, quadrant):
+        # Builds (& attaches) the child node for the named quadrant.
+        center_x, center_y, width, height = _child_cell(
+            self.center.x, self.center.y, self.width, self.height, quadrant
         )
-        self.ll = self.__class__(
-            ll_center, half_width, half_height, capacity=self.capacity
+        child = self.__class__(
+            self.point_class(center_x, center_y),
+            width,
+            height,
+            capacity=self.capacity,
+            max_depth=self.max_depth,
+            depth=self.depth + 1,
+            aggregates=self.aggregates,
         )
+        child.epoch = self.epoch
+        setattr(self, quadrant, child)
+        return child
+
+    def _copy(self, epoch):
+        # A copy of the node (sharing it's children) for a newer version of
+        # the tree, so the original can stay untouched.
+        node = copy.copy(self)
+        node.points = list(self.points)
+        node.aggregate_values = dict(self.aggregate_values)
+        node.epoch = epoch
+        return node
+
+    def _child_for(self, point):
+        # Returns the child a point routes to, creating it on first use if
+        # the node has been subdivided.
+        quadrant = self.quadrant(point)
+        child = getattr(self, quadrant)
+
+        if child is None and self.subdivided:
+            child = self._create_child(quadrant)
+
+        return child
 
-        lr_center = self.point_class(
-            self.center.x + quarter_width, self.center.y - quarter_height
-        )
-        self.lr = self.__class__(
-            lr_center, half_width, half_height, capacity=self.capacity
-        )
+    def subdivide(self):
+        """
+        Subdivides an existing node into the node + children.
+
+        Children are created lazily, only once a point is routed to them.
+        Quadrants that never receive a point stay `None`.
+
+        Returns:
+            None: Nothing to see here. Please go about your business.
+        """
+        self.subdivided = True
 
         # Redistribute the points.
         # Manually call `append` here, as calling `.insert()` creates an
         # infinite recursion situation.
         for pnt in self.points:
-            if self.is_ul(pnt):
-                self.ul.points.append(pnt)
-            elif self.is_ur(pnt):
-                self.ur.points.append(pnt)
-            elif self.is_ll(pnt):
-                self.ll.points.append(pnt)
-            else:
-                self.lr.points.append(pnt)
+            child = self._child_for(pnt)
+            child.points.append(pnt)
+            child.count += 1
+            child.sum_x += pnt.x
+            child.sum_y += pnt.y
+
+            if self.aggregates:
+                child._add_to_aggregates(self._aggregate_point(pnt))
 
         self.points = []
 
+    def _aggregate_point(self, point):
+        # The per-aggregate values for a single point.
+        return {
+            name: aggregate.key(point.data)
+            for name, aggregate in self.aggregates.items()
+        }
+
+    def _add_to_aggregates(self, values):
+        # Folds a single point's aggregate values into this node's.
+        current = self.aggregate_values
+
+        for name, value in values.items():
+            if name in current:
+                current[name] = self.aggregates[name].combine(
+                    current[name], value
+                )
+            else:
+                current[name] = value
+
+    def refresh_aggregates(self):
+        """
+        Recalculates this node's aggregate values from it's own points &
+        the (already up-to-date) values of it's children.
+
+        Primarily for internal use, but stable API if you need it.
+
+        Returns:
+            None: Nothing to see here. Please go about your business.
+        """
+        self.aggregate_values = {}
+
+        for pnt in self.points:
+            self._add_to_aggregates(self._aggregate_point(pnt))
+
+        for child in (self.ul, self.ur, self.ll, self.lr):
+            if child is not None:
+                self._add_to_aggregates(child.aggregate_values)
+
+    def should_subdivide(self, point):
+        """
+        Checks if the node needs to subdivide before `point` can be added.
+
+        Nodes at `max_depth`, or whose points all share the coordinates of
+        the new point, never subdivide. They instead grow past capacity,
+        acting as overflow buckets. Otherwise, heavily duplicated data would
+        subdivide forever.
+
+        Args:
+            point (Point): The point about to be inserted.
+
+        Returns:
+            bool: `True` if the node should subdivide, otherwise `False`.
+        """
+        if self.subdivided or (len(self.points) + 1) <= self.capacity:
+            return False
+
+        if self.depth >= self.max_depth:
+            return False
+
+        # A node only holds more than `capacity` points if they're all
+        # identical, so checking the first is enough.
+        if len(self.points) > self.capacity:
+            points = self.points[:1]
+        else:
+            points = self.points
+
+        for pnt in points:
+            if pnt.x != point.x or pnt.y != point.y:
+                return True
+
+        return False
+
     def insert(self, point):
         """
         Inserts a `Point` into the node.
@@ -530,12 +1386,20 @@ class QuadNode(object):
         & redistribute its points before adding the new one. This means there
         can be some variance in the performance of this method.
 
+        See `should_subdivide` for when a node holds more than it's capacity.
+
         Args:
             point (Point): The point to insert.
 
         Returns:
             bool: `True` if insertion succeeded, otherwise `False`.
         """
+        return self._insert(point) is not None
+
+    def _insert(self, point, values=None):
+        # Does the actual insert, returning the node the point landed in.
+        # `values` are the point's aggregate values, worked out once at the
+        # top & folded into every node on the way down.
         if not self.contains_point(point):
             raise ValueError(
                 "Point {} is not within this node ({} - {}).".format(
@@ -543,24 +1407,128 @@ class QuadNode(object):
                 )
             )
 
+        self.count += 1
+        self.sum_x += point.x
+        self.sum_y += point.y
+
+        if self.aggregates:
+            if values is None:
+                values = self._aggregate_point(point)
+
+            self._add_to_aggregates(values)
+
         # Check to ensure we're not going to go over capacity.
-        if (len(self.points) + 1) > self.capacity:
+        if self.should_subdivide(point):
             # We're over capacity. Subdivide, then insert into the new child.
             self.subdivide()
 
-        if self.ul is not None:
-            if self.is_ul(point):
-                return self.ul.insert(point)
-            elif self.is_ur(point):
-                return self.ur.insert(point)
-            elif self.is_ll(point):
-                return self.ll.insert(point)
-            elif self.is_lr(point):
-                return self.lr.insert(point)
+        child = self._child_for(point)
+
+        if child is not None:
+            return child._insert(point, values)
 
         # There are no child nodes & we're under capacity. Add it to `points`.
         self.points.append(point)
-        return True
+        return self
+
+    def _insert_many(self, points, values, epoch, landed):
+        # Inserts a group of points (all within this node) in one pass,
+        # splitting it by quadrant on the way down, so each node is updated
+        # once per group. `values` are the points' aggregate values (or
+        # `None`). Children shared with an older `epoch` are copied first.
+        # Appends `(point, node)` to `landed` for each point stored.
+        self.count += len(points)
+        self.sum_x += sum(map(_get_x, points))
+        self.sum_y += sum(map(_get_y, points))
+
+        if self.aggregates:
+            if values is None:
+                values = [self._aggregate_point(pnt) for pnt in points]
+
+            for value in values:
+                self._add_to_aggregates(value)
+
+        if not self.subdivided:
+            if not self._overflows(points):
+                self.points.extend(points)
+                landed.extend((pnt, self) for pnt in points)
+                return
+
+            self.subdivide()
+
+        # Indexed like `_QUADRANTS`, matching `_quadrant_of`.
+        center_x, center_y = self.center.x, self.center.y
+        groups = ([], [], [], [])
+        value_groups = ([], [], [], [])
+
+        if values:
+            for pnt, value in zip(points, values):
+                index = (pnt.y < center_y) * 2 + (pnt.x >= center_x)
+                groups[index].append(pnt)
+                value_groups[index].append(value)
+        else:
+            for pnt in points:
+                groups[(pnt.y < center_y) * 2 + (pnt.x >= center_x)].append(
+                    pnt
+                )
+
+        for quadrant, group, value_group in zip(
+            _QUADRANTS, groups, value_groups
+        ):
+            if not group:
+                continue
+
+            child = getattr(self, quadrant)
+
+            if child is None:
+                child = self._create_child(quadrant)
+            elif child.epoch != epoch:
+                child = child._copy(epoch)
+                setattr(self, quadrant, child)
+
+            child._insert_many(group, value_group or None, epoch, landed)
+
+    def _overflows(self, points):
+        # The `should_subdivide` check, for a whole group of new points.
+        if (len(self.points) + len(points)) <= self.capacity:
+            return False
+
+        if self.depth >= self.max_depth:
+            return False
+
+        first = self.points[0] if self.points else points[0]
+
+        for pnt in itertools.chain(self.points, points):
+            if pnt.x != first.x or pnt.y != first.y:
+                return True
+
+        return False
+
+    def remove(self, point):
+        """
+        Removes a `Point` from the node (or it's children).
+
+        Only the coordinates are considered. If several points share the
+        same coordinates, the first one inserted is removed.
+
+        Args:
+            point (Point): The point to remove.
+
+        Returns:
+            bool: `True` if a point was removed, otherwise `False`.
+        """
+        found_node, searched = self.find_node(point)
+
+        if found_node is None:
+            return False
+
+        for offset, pnt in enumerate(found_node.points):
+            if pnt.x == point.x and pnt.y == point.y:
+                del found_node.points[offset]
+                _unwind_removal(searched, pnt)
+                return True
+
+        return False
 
     def find(self, point):
         """
@@ -674,6 +1642,254 @@ class QuadNode(object):
 
         return points
 
+    def iter_within_bb(self, bb):
+        """
+        Iterates (lazily) over the points within a bounding box, in the
+        same order as `within_bb`.
+
+        Args:
+            bb (BoundingBox): The bounding box to search within.
+
+        Returns:
+            iterable: The matching `Point` objects.
+        """
+        stack = [self]
+
+        while stack:
+            node = stack.pop()
+
+            if not node.bounding_box.intersects(bb):
+                continue
+
+            if bb.contains_bb(node.bounding_box):
+                yield from node
+                continue
+
+            for pnt in node.points[:]:
+                if bb.contains(pnt):
+                    yield pnt
+
+            # Reversed, so they come off the stack in the usual order.
+            for child in (node.lr, node.ll, node.ur, node.ul):
+                if child is not None:
+                    stack.append(child)
+
+    def within_bb_many(self, boxes):
+        """
+        Finds the points within each of several bounding boxes, in a single
+        walk of the node & it's children.
+
+        Only the boxes that still intersect a node are carried down into it,
+        & a point is only checked against the boxes that reached it's node.
+        Boxes that cover a node entirely take all of it's points without
+        checking them.
+
+        Args:
+            boxes (list): The `BoundingBox` objects to check.
+
+        Returns:
+            list: A list of points for each box (in the same order as
+                `boxes`), matching what `within_bb` would return for it.
+        """
+        results = [[] for _ in boxes]
+        stack = [(self, list(range(len(boxes))))]
+
+        while stack:
+            node, active = stack.pop()
+            partial = []
+
+            for offset in active:
+                bb = boxes[offset]
+
+                if not node.bounding_box.intersects(bb):
+                    continue
+
+                if bb.contains_bb(node.bounding_box):
+                    results[offset].extend(node)
+                else:
+                    partial.append(offset)
+
+            if not partial:
+                continue
+
+            for pnt in node.points:
+                for offset in partial:
+                    if boxes[offset].contains(pnt):
+                        results[offset].append(pnt)
+
+            for child in (node.lr, node.ll, node.ur, node.ul):
+                if child is not None:
+                    stack.append((child, partial))
+
+        return results
+
+
+class CompressedQuadNode(QuadNode):
+    """
+    A path-compressed node within the `CompressedQuadTree`.
+
+    In a plain `QuadNode` tree, a tight cluster inside a large extent
+    produces a long chain of nodes with a single occupied child. Here, such
+    chains are collapsed: a child may sit several levels below it's parent,
+    covering only the smallest aligned cell that holds it's points. The
+    depth of the tree then depends on the number of points, not on the
+    ratio of the extent to the cluster size.
+
+    Node cells are still the same aligned cells a `QuadNode` tree would
+    use, & `depth` is their real depth (so `max_depth` still applies).
+    """
+
+    def _holds(self, child, point):
+        # Checks if routing `point` down from this node (one aligned cell at
+        # a time) would pass through `child`'s cell.
+        depth = self.depth + 1
+        center_x, center_y, width, height = _child_cell(
+            self.center.x,
+            self.center.y,
+            self.width,
+            self.height,
+            self.quadrant(point),
+        )
+
+        while depth < child.depth:
+            center_x, center_y, width, height = _child_cell(
+                center_x,
+                center_y,
+                width,
+                height,
+                _quadrant_of(center_x, center_y, point.x, point.y),
+            )
+            depth += 1
+
+        return center_x == child.center.x and center_y == child.center.y
+
+    def _split(self, quadrant, child, point):
+        # `child` is a compressed node that doesn't hold `point`. Insert a
+        # new node at the smallest aligned cell holding both, with `child`
+        # underneath it.
+        depth = self.depth + 1
+        center_x, center_y, width, height = _child_cell(
+            self.center.x, self.center.y, self.width, self.height, quadrant
+        )
+
+        while True:
+            point_quadrant = _quadrant_of(center_x, center_y, point.x, point.y)
+            child_quadrant = _quadrant_of(
+                center_x, center_y, child.center.x, child.center.y
+            )
+
+            if point_quadrant != child_quadrant:
+                break
+
+            center_x, center_y, width, height = _child_cell(
+                center_x, center_y, width, height, point_quadrant
+            )
+            depth += 1
+
+        node = self.__class__(
+            self.point_class(center_x, center_y),
+            width,
+            height,
+            capacity=self.capacity,
+            max_depth=self.max_depth,
+            depth=depth,
+            aggregates=self.aggregates,
+        )
+        node.subdivided = True
+        node.count = child.count
+        node.sum_x = child.sum_x
+        node.sum_y = child.sum_y
+        node.aggregate_values = dict(child.aggregate_values)
+        node.epoch = self.epoch
+        setattr(node, child_quadrant, child)
+        setattr(self, quadrant, node)
+        return node
+
+    def _shrink(self, point):
+        # About to subdivide a leaf. First shrink it down to the smallest
+        # aligned cell holding all of it's points (plus the new one), so
+        # that the subdivide actually separates them.
+        points = self.points + [point]
+        depth = self.depth
+        center_x, center_y = self.center.x, self.center.y
+        width, height = self.width, self.height
+
+        while depth < self.max_depth:
+            quadrant = _quadrant_of(center_x, center_y, point.x, point.y)
+
+            for pnt in points:
+                if _quadrant_of(center_x, center_y, pnt.x, pnt.y) != quadrant:
+                    break
+            else:
+                center_x, center_y, width, height = _child_cell(
+                    center_x, center_y, width, height, quadrant
+                )
+                depth += 1
+                continue
+
+            break
+
+        if depth != self.depth:
+            self.center = self.point_class(center_x, center_y)
+            self.width = width
+            self.height = height
+            self.depth = depth
+            self.bounding_box = self._calc_bounding_box()
+
+    def _child_for(self, point):
+        quadrant = self.quadrant(point)
+        child = getattr(self, quadrant)
+
+        if child is None:
+            if self.subdivided:
+                child = self._create_child(quadrant)
+
+            return child
+
+        if child.depth > self.depth + 1 and not self._holds(child, point):
+            return self._split(quadrant, child, point)
+
+        if child.should_subdivide(point):
+            child._shrink(point)
+
+        return child
+
+    def find_node(self, point, searched=None):
+        """
+        Searches for the node that would contain the `Point` within the
+        node & it's children.
+
+        Args:
+            point (Point): The point to search for.
+            searched (list|None): Optional. This is a list of all the nodes
+                that were touched during the search. Default is `None`, which
+                will construct an empty `list` to pass to recursive calls.
+
+        Returns:
+            tuple: (QuadNode|None, list): Returns the node where the point
+                would be found or `None`, AND the list of nodes touched
+                during the search.
+        """
+        if searched is None:
+            searched = []
+
+        if not self.contains_point(point):
+            return None, searched
+
+        node = self
+        searched.append(node)
+
+        while True:
+            child = getattr(node, node.quadrant(point))
+
+            if child is None or (
+                child.depth > node.depth + 1 and not node._holds(child, point)
+            ):
+                return node, searched
+
+            searched.append(child)
+            node = child
+
 
 class QuadTree(object):
     """
@@ -705,7 +1921,24 @@ class QuadTree(object):
     node_class = QuadNode
     point_class = Point
 
-    def __init__(self, center, width, height, capacity=None):
+    # Used by `from_points` when picking a capacity. These are the relative
+    # costs of stepping through a node vs. checking a point within a leaf,
+    # roughly as measured on CPython.
+    CAPACITY_CANDIDATES = (4, 8, 16, 32, 64)
+    NODE_COST = 20
+    POINT_COST = 1
+
+    def __init__(
+        self,
+        center,
+        width,
+        height,
+        capacity=None,
+        max_depth=None,
+        index=False,
+        key_func=None,
+        auto_expand=False,
+    ):
         """
         Constructs a `QuadTree` object.
 
@@ -715,222 +1948,4121 @@ class QuadTree(object):
             height (int|float): The height of the point space.
             capacity (int): Optional. The number of points per quad before
                 subdivision occurs. Default is `None`.
+            max_depth (int): Optional. The maximum depth of the tree. Nodes
+                at this depth hold any number of points rather than
+                subdividing further. Default is `None`, which defers to
+                `QuadNode.MAX_DEPTH`.
+            index (bool): Optional. If `True`, a coordinate-to-point hash
+                index is maintained alongside the tree, making `find` &
+                `in` checks a single dictionary lookup. The tree is then
+                only walked for spatial queries. Default is `False`.
+            key_func (callable): Optional. A function that takes a point's
+                `data` & returns a unique, hashable key (for instance, an
+                entity id). When provided, a secondary index is kept so
+                that `get_by_key` & `remove_by_key` don't need to walk the
+                tree. Default is `None`.
+            auto_expand (bool): Optional. If `True`, inserting a point
+                outside the tree grows it (doubling it's size towards the
+                point, as many times as needed) rather than raising a
+                `ValueError`. Existing nodes are kept as-is, underneath the
+                new root. `max_depth` stays relative to the original root.
+                Default is `False`.
         """
-        self.width = width
-        self.height = height
-        self.center = self.convert_to_point(center)
         self._root = self.node_class(
-            self.center, self.width, self.height, capacity=capacity
+            self.convert_to_point(center),
+            width,
+            height,
+            capacity=capacity,
+            max_depth=max_depth,
         )
+        self.auto_expand = auto_expand
+        self._index = {} if index else None
+        self.key_func = key_func
+        # Maps `key_func(data)` to a `(point, node)` pair.
+        self._keys = {} if key_func is not None else None
+        # Bumped by `snapshot`. Nodes from an older epoch may be shared with
+        # a snapshot, so they're copied before being changed.
+        self._epoch = 0
+        self.read_only = False
 
     def __repr__(self):
         return "<QuadTree: ({}, {}) {}x{}>".format(
             self.center.x, self.center.y, self.width, self.height,
         )
 
-    def convert_to_point(self, val):
+    @property
+    def center(self):
         """
-        Converts a value to a `Point` object.
+        The center point of the quadtree.
 
-        This is to allow shortcuts, like providing a tuple for a point.
-
-        Args:
-            val (Point|tuple|None): The value to convert.
+        This is the root node's, so it follows any `auto_expand` growth.
+        Setting it (or `width`/`height`) rebuilds the tree over the new
+        extent, reinserting any points.
 
         Returns:
-            Point: A point object.
-        """
-        if isinstance(val, self.point_class):
-            return val
-        elif isinstance(val, (tuple, list)):
-            return self.point_class(val[0], val[1])
-        elif val is None:
-            return self.point_class(0, 0)
-        else:
-            raise ValueError(
-                "Unknown data provided for point. Please use one of: "
-                "quads.Point | tuple | list | None"
-            )
-
-    def __contains__(self, point):
+            Point: The center.
         """
-        Checks if a `Point` is found in the quadtree.
+        return self._root.center
 
-        > Note: This doesn't check if a point is within the bounds of the
-        > tree, but if that *specific point* is in the tree.
+    @center.setter
+    def center(self, center):
+        self._relayout(self.convert_to_point(center), self.width, self.height)
 
-        Args:
-            point (Point|tuple|None): The point to check for.
+    @property
+    def width(self):
+        """
+        The width of the point space.
 
         Returns:
-            bool: `True` if found, otherwise `False`.
+            int|float: The width.
         """
-        pnt = self.convert_to_point(point)
-        return self.find(pnt) is not None
+        return self._root.width
 
-    def __len__(self):
+    @width.setter
+    def width(self, width):
+        self._relayout(self.center, width, self.height)
+
+    @property
+    def height(self):
         """
-        Returns a count of how many points are in the tree.
+        The height of the point space.
 
         Returns:
-            int: A count of all the points.
+            int|float: The height.
         """
-        return len(self._root)
+        return self._root.height
+
+    @height.setter
+    def height(self, height):
+        self._relayout(self.center, self.width, height)
+
+    def _relayout(self, center, width, height):
+        # Swaps in a new (empty) root covering the given extent, then puts
+        # the points back. Everything is checked first, so a point that
+        # wouldn't fit leaves the tree as it was.
+        self._check_writable()
+        old_root = self._root
+        root = self.node_class(
+            center,
+            width,
+            height,
+            capacity=old_root.capacity,
+            max_depth=old_root.max_depth,
+            aggregates=old_root.aggregates,
+        )
+        points = list(old_root)
+
+        if not self.auto_expand:
+            for pnt in points:
+                if not root.contains_point(pnt):
+                    raise ValueError(
+                        "Point {} is not within the new extent ({}).".format(
+                            pnt, root.bounding_box
+                        )
+                    )
+
+        root.epoch = self._epoch
+        self._root = root
+
+        if self._index is not None:
+            self._index = {}
+
+        if self._keys is not None:
+            self._keys = {}
+
+        for pnt in points:
+            self.insert(pnt, data=pnt.data)
+
+    def _expand_to(self, point):
+        # Grows the tree until the root covers `point`. Each step builds a
+        # root twice the size (towards the point) & attaches the old root as
+        # one of it's quadrants, so nothing gets reinserted.
+        if not (math.isfinite(point.x) and math.isfinite(point.y)):
+            raise ValueError(
+                "Point {} can not be placed in the tree.".format(point)
+            )
 
-    def __iter__(self):
-        """
-        Returns an iterator for all the points in the tree.
+        while not self._root.contains_point(point):
+            old_root = self._root
+            bb = old_root.bounding_box
 
-        Returns:
-            iterator: An iterator of all the points.
-        """
-        return iter(self._root)
+            if point.x < bb.min_x:
+                center_x = old_root.center.x - old_root.width / 2
+            else:
+                center_x = old_root.center.x + old_root.width / 2
 
-    def insert(self, point, data=None):
-        """
-        Inserts a `Point` into the quadtree.
+            if point.y < bb.min_y:
+                center_y = old_root.center.y - old_root.height / 2
+            else:
+                center_y = old_root.center.y + old_root.height / 2
 
-        Args:
-            point (Point|tuple|None): The point to insert.
-            data (any): Optional. Corresponding data for that point. Default
-                is `None`.
+            # Growing up or right puts the new split lines on the old root's
+            # (inclusive) top/right edges, where points would now route to
+            # a different quadrant. Those get taken out & reinserted below.
+            quadrant = _quadrant_of(
+                center_x, center_y, old_root.center.x, old_root.center.y
+            )
+            old_root, evicted = self._evict(
+                old_root, center_x, center_y, quadrant
+            )
 
-        Returns:
-            bool: `True` if insertion succeeded, otherwise `False`.
-        """
-        pnt = self.convert_to_point(point)
-        pnt.data = data
-        return self._root.insert(pnt)
+            new_root = self.node_class(
+                self.point_class(center_x, center_y),
+                old_root.width * 2,
+                old_root.height * 2,
+                capacity=old_root.capacity,
+                max_depth=old_root.max_depth,
+                depth=old_root.depth - 1,
+                aggregates=old_root.aggregates,
+            )
+            new_root.subdivided = True
+            new_root.epoch = self._epoch
+            new_root.count = old_root.count
+            new_root.sum_x = old_root.sum_x
+            new_root.sum_y = old_root.sum_y
+            new_root.aggregate_values = dict(old_root.aggregate_values)
+            setattr(new_root, quadrant, old_root)
+            self._root = new_root
+
+            for pnt in evicted:
+                self._track(pnt, new_root._insert(pnt))
+
+    def _evict(self, node, center_x, center_y, quadrant):
+        # Takes the points under `node` that route somewhere other than
+        # `quadrant` of a cell centered on `(center_x, center_y)` out of the
+        # subtree, keeping the counts, sums & aggregates up to date. Returns
+        # the node (a copy, if it was shared with a snapshot) & the points.
+        bb = node.bounding_box
 
-    def find(self, point):
-        """
-        Searches for a `Point` within the quadtree.
+        if (
+            _quadrant_of(center_x, center_y, bb.min_x, bb.min_y) == quadrant
+            and _quadrant_of(center_x, center_y, bb.max_x, bb.max_y)
+            == quadrant
+        ):
+            return node, []
+
+        evicted = [
+            pnt
+            for pnt in node.points
+            if _quadrant_of(center_x, center_y, pnt.x, pnt.y) != quadrant
+        ]
+        changed = []
 
-        Args:
-            point (Point|tuple|None): The point to search for.
+        for name in ("ul", "ur", "ll", "lr"):
+            child = getattr(node, name)
 
-        Returns:
-            Point|None: Returns the `Point` (including it's data) if found.
-                `None` if the point is not found.
-        """
-        pnt = self.convert_to_point(point)
-        return self._root.find(pnt)
+            if child is not None:
+                child, moved = self._evict(child, center_x, center_y, quadrant)
 
-    def within_bb(self, bb):
-        """
-        Checks if a bounding box is within the quadtree's bounding box.
+                if moved:
+                    changed.append((name, child))
+                    evicted.extend(moved)
 
-        Primarily for internal use, but stable API if you need it.
+        if not evicted:
+            return node, []
+
+        if node.epoch != self._epoch:
+            node = node._copy(self._epoch)
+
+        for name, child in changed:
+            setattr(node, name, child)
+
+        node.points = [
+            pnt
+            for pnt in node.points
+            if _quadrant_of(center_x, center_y, pnt.x, pnt.y) == quadrant
+        ]
+        node.count -= len(evicted)
+        node.sum_x -= sum(pnt.x for pnt in evicted)
+        node.sum_y -= sum(pnt.y for pnt in evicted)
+
+        if node.aggregates:
+            node.refresh_aggregates()
+
+        return node, evicted
+
+    @classmethod
+    def from_points(cls, points, capacity=None, sample_size=1000, **kwargs):
+        """
+        Builds a quadtree sized to fit the provided points.
+
+        The extent is the tightest square around the points. Unless a
+        `capacity` is provided, one is chosen via `estimate_capacity`.
+
+        Usage::
+
+            >>> tree = quads.QuadTree.from_points([(1, 2), (-4, 7)])
+            >>> len(tree)
+            2
 
         Args:
-            bb (BoundingBox): The bounding box to check.
+            points (iterable): The points to insert, as `Point` objects or
+                `(x, y)` tuples/lists. The `data` on `Point` objects is kept.
+            capacity (int): Optional. The number of points per quad before
+                subdivision occurs. Default is `None`, which picks one from
+                a sample of the data.
+            sample_size (int): Optional. How many points to sample when
+                picking a capacity. Default is `1000`.
+            **kwargs: Any other options to pass along to the constructor.
 
         Returns:
-            bool: `True` if the bounding boxes intersect, otherwise `False`.
+            QuadTree: The populated tree.
         """
-        return self._root.within_bb(bb)
+        points = [
+            pnt
+            if isinstance(pnt, cls.point_class)
+            else cls.point_class(pnt[0], pnt[1])
+            for pnt in points
+        ]
+        center, width, height = cls._fit_extent(points)
 
-    def nearest_neighbors(self, point, count=10):
+        if capacity is None:
+            capacity = cls.estimate_capacity(
+                points, center, width, height, sample_size=sample_size
+            )
+
+        tree = cls(center, width, height, capacity=capacity, **kwargs)
+
+        for pnt in points:
+            tree.insert(pnt, data=pnt.data)
+
+        return tree
+
+    @classmethod
+    def _fit_extent(cls, points):
+        # The tightest square (center, width, height) around the points.
+        if not points:
+            return cls.point_class(0, 0), 1, 1
+
+        min_x = min(pnt.x for pnt in points)
+        max_x = max(pnt.x for pnt in points)
+        min_y = min(pnt.y for pnt in points)
+        max_y = max(pnt.y for pnt in points)
+
+        # Square cells keep queries balanced on both axes. The bit of slack
+        # keeps float rounding from pushing edge points outside. Rounding
+        # scales with the coordinates, not the spread, so it's grown until
+        # the bounds (computed like `_calc_bounding_box`) take them in.
+        center_x = (min_x + max_x) / 2
+        center_y = (min_y + max_y) / 2
+        side = max(max_x - min_x, max_y - min_y) or 1
+        slack = (
+            4
+            * sys.float_info.epsilon
+            * max(abs(min_x), abs(max_x), abs(min_y), abs(max_y), side)
+        )
+        side += slack
+
+        while not (
+            center_x - side / 2 <= min_x
+            and max_x <= center_x + side / 2
+            and center_y - side / 2 <= min_y
+            and max_y <= center_y + side / 2
+        ):
+            side += slack
+            slack *= 2
+
+        return cls.point_class(center_x, center_y), side, side
+
+    @classmethod
+    def estimate_capacity(
+        cls, points, center, width, height, sample_size=1000, seed=0
+    ):
         """
-        Returns the nearest points of a given point, sorted by distance
-        (closest first).
+        Picks a node capacity suited to the points, from a small sample.
 
-        The desired point does not need to exist within the quadtree, but
-        does need to be within the tree's boundaries.
+        A trial tree is built on a sample of the points for each of
+        `CAPACITY_CANDIDATES`. Each is scored by the cost of reaching a
+        point: the average leaf depth (weighted by `NODE_COST`) plus the
+        average number of points in it's leaf (weighted by `POINT_COST`).
+        Deeper trees cost more per descent, fuller leaves cost more per
+        scan. The cheapest candidate wins.
 
         Args:
-            point (Point): The desired location to search around.
-            count (int): Optional. The number of neighbors to return. Default
-                is `10`.
+            points (list): The `Point` objects to be inserted.
+            center (Point): The center of the tree.
+            width (int|float): The width of the tree.
+            height (int|float): The height of the tree.
+            sample_size (int): Optional. How many points to sample. Default
+                is `1000`.
+            seed (int): Optional. The seed for the sampling. Default is `0`.
 
         Returns:
-            list: The nearest `Point` neighbors.
+            int: The chosen capacity.
         """
-        # Algorithm description:
-        # * Search down to find the smallest node around the desired point,
-        #   retaining a stack of nodes visited on the way down.
-        # * Reverse the visited stack, so that it's now in
-        #   smallest/closest-to-largest/furthest order.
-        # * Iterate over the node stack.
-        #   * Collect the points from the current node & it's children.
-        #   * Sort the points by euclidean distance, using
-        #     `euclidean_compare`, since the actual distance doesn't matter
-        #     for now.
-        #   * Add them to the "found" results.
-        #   * If the "found" count is greater-than-or-equal to the desired
-        #     count, break out of the loop.
-        # * If the stack is exhausted, we have all the points in the entire
-        #   quadtree & can just return them.
-        # * Otherwise, we now have a decent set of results, ordered by
-        #   distance. But we are not done. It's possible/probable that there
-        #   are other nearby quadnodes that weren't touched by the search
-        #   BUT are physically closer.
-        # * Take our furthest point and use it as a radius for a search
-        #   "circle".
-        #     * We'll actually just create a bounding box, which is
-        #       computationally cheaper & we already have methods that
-        #       support it.
-        #     * Using that radius as a distance to the *edge* (not a corner),
-        #       we create a box big enough to fit the search circle.
-        # * Collect all the points within that bounding box.
-        # * Re-sort them by euclidean distance (again, using
-        #   `euclidean_compare`).
-        # * Slice it to match the desired count & return them.
+        if len(points) > sample_size:
+            points = random.Random(seed).sample(points, sample_size)
 
-        point = self.convert_to_point(point)
-        nearest_results = []
+        best_capacity, best_cost = None, None
 
-        # Check to see if it's within our bounds first.
-        if not self._root.contains_point(point):
-            return nearest_results
+        for capacity in cls.CAPACITY_CANDIDATES:
+            root = cls.node_class(center, width, height, capacity=capacity)
 
-        # First, find the target node.
-        node, searched_nodes = self._root.find_node(point)
+            for pnt in points:
+                root.insert(cls.point_class(pnt.x, pnt.y))
 
-        # Reverse the order, as they come back in coarse-to-fine order, which
-        # is the opposite of nearby points.
-        searched_nodes.reverse()
-        seen_nodes = set()
-        seen_points = set()
+            depth_total, scan_total = 0, 0
+            stack = [root]
 
-        # From here, we'll work our way backwards out through the nodes.
-        for node in searched_nodes:
-            # Mark the node as already checked.
-            seen_nodes.add(node)
-            local_points = []
+            while stack:
+                node = stack.pop()
+                occupancy = len(node.points)
+                depth_total += occupancy * (node.depth + 1)
+                scan_total += occupancy * occupancy
 
-            for pnt in node.all_points():
-                if pnt in seen_points:
-                    continue
+                for child in (node.ul, node.ur, node.ll, node.lr):
+                    if child is not None:
+                        stack.append(child)
 
-                seen_points.add(pnt)
-                local_points.append(pnt)
+            count = len(points) or 1
+            cost = (
+                cls.NODE_COST * depth_total / count
+                + cls.POINT_COST * scan_total / count
+            )
 
-            local_points = sorted(
-                local_points, key=lambda lpnt: euclidean_compare(point, lpnt)
+            if best_cost is None or cost < best_cost:
+                best_capacity, best_cost = capacity, cost
+
+        return best_capacity
+
+    def __getstate__(self):
+        # Pickle via the binary format, which is far smaller & doesn't
+        # recurse through every node.
+        buffer = io.BytesIO()
+        self.dump(buffer)
+        return {
+            "tree": buffer.getvalue(),
+            "key_func": self.key_func,
+            "aggregates": dict(self._root.aggregates),
+        }
+
+    def __setstate__(self, state):
+        # As with any pickle (& `load`), only unpickle trusted data. The
+        # point data within is unpickled too.
+        loaded = self.load(
+            io.BytesIO(state["tree"]),
+            key_func=state["key_func"],
+            aggregates=state["aggregates"],
+        )
+        self.__dict__.update(loaded.__dict__)
+
+    def dump(self, fp):
+        """
+        Writes the quadtree to a file, in a compact binary format.
+
+        The nodes, coordinates & (pickled) point data are written as flat
+        tables, so there's no recursion & loading doesn't reinsert anything.
+        See `FORMAT_VERSION` & the notes above it for the layout.
+
+        The `key_func` & any registered aggregates are functions, so they
+        aren't written. Provide them again to `load`.
+
+        Usage::
+
+            >>> with open("tree.qt", "wb") as dump_file:
+            ...     tree.dump(dump_file)
+
+        Args:
+            fp (file): A file-like object opened for writing bytes.
+
+        Returns:
+            None: Nothing to see here. Please go about your business.
+        """
+        # Number the nodes in pre-order.
+        nodes = []
+        stack = [self._root]
+
+        while stack:
+            node = stack.pop()
+            nodes.append(node)
+
+            for child in (node.lr, node.ll, node.ur, node.ul):
+                if child is not None:
+                    stack.append(child)
+
+        numbers = {id(node): offset for offset, node in enumerate(nodes)}
+        xs = array("d")
+        ys = array("d")
+        kinds = bytearray()
+        payload_index = array("q", [0])
+        payloads = []
+        payload_size = 0
+        records = []
+
+        for node in nodes:
+            point_start = len(xs)
+
+            for pnt in node.points:
+                xs.append(pnt.x)
+                ys.append(pnt.y)
+                kinds.append(_int_flags(pnt.x, pnt.y))
+
+                if pnt.data is not None:
+                    payload = pickle.dumps(pnt.data, pickle.HIGHEST_PROTOCOL)
+                    payloads.append(payload)
+                    payload_size += len(payload)
+
+                payload_index.append(payload_size)
+
+            children = [
+                -1 if child is None else numbers[id(child)]
+                for child in (node.ul, node.ur, node.ll, node.lr)
+            ]
+            records.append(
+                _NODE.pack(
+                    node.center.x,
+                    node.center.y,
+                    node.width,
+                    node.height,
+                    node.depth,
+                    (_NODE_SUBDIVIDED if node.subdivided else 0)
+                    | _cell_int_flags(
+                        node.center.x, node.center.y, node.width, node.height
+                    )
+                    << _NODE_INT_SHIFT,
+                    point_start,
+                    len(node.points),
+                    node.count,
+                    *children
+                )
             )
-            nearest_results.extend(local_points)
 
-            if len(nearest_results) >= count:
-                break
+        if sys.byteorder != "little":  # pragma: no cover
+            for values in (xs, ys, payload_index):
+                values.byteswap()
+
+        flags = 0
+
+        if self._index is not None:
+            flags |= _FLAG_INDEX
+
+        if self.auto_expand:
+            flags |= _FLAG_AUTO_EXPAND
+
+        if isinstance(self._root, CompressedQuadNode):
+            flags |= _FLAG_COMPRESSED
+
+        nodes_offset = _HEADER.size
+        xs_offset = nodes_offset + _NODE.size * len(nodes)
+        ys_offset = xs_offset + 8 * len(xs)
+        kinds_offset = ys_offset + 8 * len(ys)
+        kinds.extend(bytes(-len(kinds) % 8))
+        payload_index_offset = kinds_offset + len(kinds)
+        payload_offset = payload_index_offset + 8 * len(payload_index)
+
+        fp.write(
+            _HEADER.pack(
+                FORMAT_MAGIC,
+                FORMAT_VERSION,
+                flags,
+                0,
+                self._root.capacity,
+                self._root.max_depth,
+                len(nodes),
+                len(xs),
+                nodes_offset,
+                xs_offset,
+                ys_offset,
+                kinds_offset,
+                payload_index_offset,
+                payload_offset,
+            )
+        )
+        fp.write(b"".join(records))
+        fp.write(xs.tobytes())
+        fp.write(ys.tobytes())
+        fp.write(kinds)
+        fp.write(payload_index.tobytes())
+        fp.write(b"".join(payloads))
+
+    @classmethod
+    def load(cls, fp, key_func=None, aggregates=None):
+        """
+        Reads a quadtree written by `dump`.
 
-        # Slice off any extras.
-        nearest_results = nearest_results[:count]
+        The tree is rebuilt in a single pass over the node table (plus one
+        more to fill in the cached sums & aggregates), without reinserting
+        any points.
 
-        if len(seen_nodes) == len(searched_nodes):
-            # We've exhausted everything. Return what we've got.
-            return nearest_results[:count]
+        The point data is stored pickled, so only load files from a source
+        you trust. Unpickling untrusted data can run arbitrary code.
 
-        search_radius = euclidean_distance(point, nearest_results[-1])
-        search_bb = BoundingBox(
-            point.x - search_radius,
-            point.y - search_radius,
-            point.x + search_radius,
-            point.y + search_radius,
+        Usage::
+
+            >>> with open("tree.qt", "rb") as dump_file:
+            ...     tree = quads.QuadTree.load(dump_file)
+
+        Args:
+            fp (file): A file-like object opened for reading bytes.
+            key_func (callable): Optional. The `key_func` to index the
+                points by. Default is `None`.
+            aggregates (dict): Optional. A mapping of names to `Aggregate`
+                objects to register. Default is `None`.
+
+        Returns:
+            QuadTree: The loaded tree.
+        """
+        data = fp.read()
+        header = _read_header(data)
+        flags = header["flags"]
+
+        if bool(flags & _FLAG_COMPRESSED) != issubclass(
+            cls.node_class, CompressedQuadNode
+        ):
+            raise ValueError(
+                "This tree was dumped from a different kind of quadtree."
+            )
+
+        xs = _read_array(data, "d", header["xs_offset"], header["point_count"])
+        ys = _read_array(data, "d", header["ys_offset"], header["point_count"])
+        payload_index = _read_array(
+            data,
+            "q",
+            header["payload_index_offset"],
+            header["point_count"] + 1,
         )
-        bb_results = self._root.within_bb(search_bb)
-        nearest_results = sorted(
-            bb_results, key=lambda lpnt: euclidean_compare(point, lpnt)
+        kinds_offset = header["kinds_offset"]
+        payload_offset = header["payload_offset"]
+
+        tree = cls(
+            (0, 0),
+            1,
+            1,
+            capacity=header["capacity"],
+            max_depth=header["max_depth"],
+            index=bool(flags & _FLAG_INDEX),
+            key_func=key_func,
+            auto_expand=bool(flags & _FLAG_AUTO_EXPAND),
         )
+        shared_aggregates = tree._root.aggregates
+        shared_aggregates.update(aggregates or {})
+        nodes = []
+        links = []
+
+        for offset in range(header["node_count"]):
+            (
+                center_x,
+                center_y,
+                width,
+                height,
+                depth,
+                node_flags,
+                point_start,
+                point_count,
+                count,
+                *children
+            ) = _NODE.unpack_from(
+                data, header["nodes_offset"] + offset * _NODE.size
+            )
+            kind = node_flags >> _NODE_INT_SHIFT
+            node = cls.node_class(
+                cls.point_class(
+                    _restore_int(center_x, kind, _CELL_X_INT),
+                    _restore_int(center_y, kind, _CELL_Y_INT),
+                ),
+                _restore_int(width, kind, _CELL_WIDTH_INT),
+                _restore_int(height, kind, _CELL_HEIGHT_INT),
+                capacity=header["capacity"],
+                max_depth=header["max_depth"],
+                depth=depth,
+                aggregates=shared_aggregates,
+            )
+            node.subdivided = bool(node_flags & _NODE_SUBDIVIDED)
+            node.count = count
+
+            for pnt_offset in range(point_start, point_start + point_count):
+                start = payload_index[pnt_offset]
+                end = payload_index[pnt_offset + 1]
+                kind = data[kinds_offset + pnt_offset]
+                pnt = cls.point_class(
+                    _restore_int(xs[pnt_offset], kind, _X_INT),
+                    _restore_int(ys[pnt_offset], kind, _Y_INT),
+                )
 
-        return nearest_results[:count]
+                if end > start:
+                    pnt.data = pickle.loads(
+                        data[payload_offset + start:payload_offset + end]
+                    )
+
+                node.points.append(pnt)
+                tree._track(pnt, node)
+
+            nodes.append(node)
+            links.append(children)
+
+        # Children always come after their parent, so going backwards
+        # builds the sums & aggregates bottom-up.
+        for node, children in zip(reversed(nodes), reversed(links)):
+            node.sum_x = sum(pnt.x for pnt in node.points)
+            node.sum_y = sum(pnt.y for pnt in node.points)
+
+            for quadrant, child in zip(("ul", "ur", "ll", "lr"), children):
+                if child >= 0:
+                    setattr(node, quadrant, nodes[child])
+                    node.sum_x += nodes[child].sum_x
+                    node.sum_y += nodes[child].sum_y
+
+            if shared_aggregates:
+                node.refresh_aggregates()
+
+        if nodes:
+            tree._root = nodes[0]
+
+        return tree
+
+    def convert_to_point(self, val):
+        """
+        Converts a value to a `Point` object.
+
+        This is to allow shortcuts, like providing a tuple for a point.
+
+        Args:
+            val (Point|tuple|None): The value to convert.
+
+        Returns:
+            Point: A point object.
+        """
+        if isinstance(val, self.point_class):
+            return val
+        elif isinstance(val, (tuple, list)):
+            return self.point_class(val[0], val[1])
+        elif val is None:
+            return self.point_class(0, 0)
+        else:
+            raise ValueError(
+                "Unknown data provided for point. Please use one of: "
+                "quads.Point | tuple | list | None"
+            )
+
+    def _coords(self, val):
+        # Avoids building a throwaway `Point` for index lookups.
+        if isinstance(val, self.point_class):
+            return (val.x, val.y)
+        elif isinstance(val, (tuple, list)):
+            return (val[0], val[1])
+
+        pnt = self.convert_to_point(val)
+        return (pnt.x, pnt.y)
+
+    def __contains__(self, point):
+        """
+        Checks if a `Point` is found in the quadtree.
+
+        > Note: This doesn't check if a point is within the bounds of the
+        > tree, but if that *specific point* is in the tree.
+
+        Args:
+            point (Point|tuple|None): The point to check for.
+
+        Returns:
+            bool: `True` if found, otherwise `False`.
+        """
+        if self._index is not None:
+            return self._coords(point) in self._index
+
+        pnt = self.convert_to_point(point)
+        return self.find(pnt) is not None
+
+    def __len__(self):
+        """
+        Returns a count of how many points are in the tree.
+
+        Returns:
+            int: A count of all the points.
+        """
+        return len(self._root)
+
+    def __iter__(self):
+        """
+        Returns an iterator for all the points in the tree.
+
+        Returns:
+            iterator: An iterator of all the points.
+        """
+        return iter(self._root)
+
+    def insert(self, point, data=None):
+        """
+        Inserts a `Point` into the quadtree.
+
+        Args:
+            point (Point|tuple|None): The point to insert.
+            data (any): Optional. Corresponding data for that point. Default
+                is `None`.
+
+        Returns:
+            bool: `True` if insertion succeeded, otherwise `False`.
+        """
+        self._check_writable()
+        pnt = self.convert_to_point(point)
+        pnt.data = data
+
+        if self._keys is not None:
+            key = self.key_func(pnt.data)
+
+            if key in self._keys:
+                raise ValueError(
+                    "A point with the key {!r} is already present.".format(key)
+                )
+
+        if self.auto_expand and not self._root.contains_point(pnt):
+            self._expand_to(pnt)
+
+        if self._epoch:
+            self._writable_path(pnt)
+
+        node = self._root._insert(pnt)
+
+        if node is None:
+            return False
+
+        self._track(pnt, node)
+        return True
+
+    def _track(self, pnt, node):
+        # Adds a newly stored point to the indexes.
+        if self._index is not None:
+            # Keep the first point at these coordinates, matching what a
+            # tree walk would find.
+            self._index.setdefault((pnt.x, pnt.y), pnt)
+
+        if self._keys is not None:
+            self._keys[self.key_func(pnt.data)] = (pnt, node)
+
+    def _discard(self, node, pnt):
+        # Removes the exact `pnt` object from `node`, keeping the indexes in
+        # sync. Duplicates always share a leaf, so any replacement for the
+        # coordinate index is found right here.
+        if self._epoch:
+            # `node` may be shared with a snapshot (or be an old copy).
+            node = self._writable_path(pnt)[-1]
+
+        for offset, existing in enumerate(node.points):
+            if existing is pnt:
+                del node.points[offset]
+                break
+
+        _, searched = self._root.find_node(pnt)
+        _unwind_removal(searched, pnt)
+
+        coords = (pnt.x, pnt.y)
+
+        if self._index is not None and self._index.get(coords) is pnt:
+            for existing in node.points:
+                if existing.x == pnt.x and existing.y == pnt.y:
+                    self._index[coords] = existing
+                    break
+            else:
+                del self._index[coords]
+
+        if self._keys is not None:
+            key = self.key_func(pnt.data)
+
+            if self._keys.get(key, (None, None))[0] is pnt:
+                del self._keys[key]
+
+    def remove(self, point):
+        """
+        Removes a `Point` from the quadtree.
+
+        Only the coordinates are considered. If several points share the
+        same coordinates, the first one inserted is removed.
+
+        Args:
+            point (Point|tuple|None): The point to remove.
+
+        Returns:
+            bool: `True` if a point was removed, otherwise `False`.
+        """
+        self._check_writable()
+        pnt = self.convert_to_point(point)
+        node, _ = self._root.find_node(pnt)
+
+        if node is None:
+            return False
+
+        for existing in node.points:
+            if existing.x == pnt.x and existing.y == pnt.y:
+                self._discard(node, existing)
+                return True
+
+        return False
+
+    def _lookup_key(self, key):
+        # Returns the `(point, node)` pair for a key, refreshing the node if
+        # it has been subdivided since the point was stored.
+        if self._keys is None:
+            if self.key_func is None:
+                raise ValueError(
+                    "This tree has no key index. Please provide `key_func`."
+                )
+
+            # Snapshots don't carry the key index, so search for it.
+            for pnt in self:
+                if self.key_func(pnt.data) == key:
+                    return pnt, None
+
+            return None, None
+
+        if key not in self._keys:
+            return None, None
+
+        pnt, node = self._keys[key]
+
+        for existing in node.points:
+            if existing is pnt:
+                return pnt, node
+
+        # The point moved down into a child during a subdivide.
+        node, _ = node.find_node(pnt)
+        self._keys[key] = (pnt, node)
+        return pnt, node
+
+    def get_by_key(self, key):
+        """
+        Fetches a `Point` by the key of it's data.
+
+        Requires the tree to have been created with a `key_func`.
+
+        Args:
+            key (any): The key, as returned by `key_func(point.data)`.
+
+        Returns:
+            Point|None: Returns the `Point` if found. `None` if there is no
+                point with that key.
+        """
+        pnt, _ = self._lookup_key(key)
+        return pnt
+
+    def remove_by_key(self, key):
+        """
+        Removes a `Point` by the key of it's data.
+
+        Requires the tree to have been created with a `key_func`.
+
+        Args:
+            key (any): The key, as returned by `key_func(point.data)`.
+
+        Returns:
+            bool: `True` if a point was removed, otherwise `False`.
+        """
+        self._check_writable()
+        pnt, node = self._lookup_key(key)
+
+        if pnt is None:
+            return False
+
+        self._discard(node, pnt)
+        return True
+
+    def snapshot(self):
+        """
+        Returns a read-only, point-in-time copy of the tree, in O(1).
+
+        The snapshot shares all of it's nodes with the tree. Afterward, the
+        tree copies a node before changing it (along with the path from the
+        root down to it), so the snapshot never changes & can be read from
+        other threads without any locking, while this tree carries on being
+        updated.
+
+        Snapshots support all of the queries, but raise a `ValueError` if
+        changed. They don't keep the coordinate or key indexes (copying
+        those wouldn't be O(1)), so `find` walks the tree & `get_by_key`
+        searches all the points.
+
+        Usage::
+
+            >>> view = tree.snapshot()
+            >>> tree.insert((1, 2))
+            True
+            >>> view.find((1, 2))
+            None
+
+        Returns:
+            QuadTree: The snapshot.
+        """
+        view = self.__class__.__new__(self.__class__)
+        view.__dict__.update(self.__dict__)
+        view._index = None
+        view._keys = None
+        view.read_only = True
+
+        if not self.read_only:
+            self._epoch += 1
+
+        return view
+
+    def _check_writable(self):
+        if self.read_only:
+            raise ValueError("This is a snapshot, which can't be changed.")
+
+    def _writable_path(self, point):
+        # Copies any nodes on the path down to where `point` would be that
+        # are shared with a snapshot, returning the (now writable) path.
+        _, searched = self._root.find_node(point)
+        parent = None
+
+        for offset, node in enumerate(searched):
+            if node.epoch != self._epoch:
+                node = node._copy(self._epoch)
+
+                if parent is None:
+                    self._root = node
+                else:
+                    for quadrant in ("ul", "ur", "ll", "lr"):
+                        if getattr(parent, quadrant) is searched[offset]:
+                            setattr(parent, quadrant, node)
+
+                searched[offset] = node
+
+            parent = node
+
+        return searched
+
+    def _copy_all(self):
+        # Copies every node, with a new (unshared) mapping of aggregates.
+        aggregates = dict(self._root.aggregates)
+        self._root = self._root._copy(self._epoch)
+        stack = [self._root]
+
+        while stack:
+            node = stack.pop()
+            node.aggregates = aggregates
+
+            for quadrant in ("ul", "ur", "ll", "lr"):
+                child = getattr(node, quadrant)
+
+                if child is not None:
+                    child = child._copy(self._epoch)
+                    setattr(node, quadrant, child)
+                    stack.append(child)
+
+    def find(self, point):
+        """
+        Searches for a `Point` within the quadtree.
+
+        Args:
+            point (Point|tuple|None): The point to search for.
+
+        Returns:
+            Point|None: Returns the `Point` (including it's data) if found.
+                `None` if the point is not found.
+        """
+        if self._index is not None:
+            return self._index.get(self._coords(point))
+
+        pnt = self.convert_to_point(point)
+        return self._root.find(pnt)
+
+    def within_bb(self, bb):
+        """
+        Checks if a bounding box is within the quadtree's bounding box.
+
+        Primarily for internal use, but stable API if you need it.
+
+        Args:
+            bb (BoundingBox): The bounding box to check.
+
+        Returns:
+            bool: `True` if the bounding boxes intersect, otherwise `False`.
+        """
+        return self._root.within_bb(bb)
+
+    def iter_within_bb(self, bb):
+        """
+        Iterates (lazily) over the points within a bounding box.
+
+        Unlike `within_bb`, the results aren't collected into a list, so
+        large regions can be streamed (to `write_csv`, for instance).
+
+        Args:
+            bb (BoundingBox): The bounding box to search within.
+
+        Returns:
+            iterable: The matching `Point` objects.
+        """
+        return self._root.iter_within_bb(bb)
+
+    def coordinates(self, bb=None):
+        """
+        Returns the coordinates of the points as two flat `array("d")`
+        buffers (X & Y), in the same order as iterating over the tree.
+
+        Both support the buffer protocol, so `memoryview(xs)` or
+        `numpy.frombuffer(xs)` use them without any further copying. See
+        `to_numpy` & `node_offsets`.
+
+        Args:
+            bb (BoundingBox): Optional. Only include the points within this
+                box, in the same order as `within_bb`. Default is `None`
+                (every point).
+
+        Returns:
+            tuple: The `(xs, ys)` arrays.
+        """
+        points = self if bb is None else self.iter_within_bb(bb)
+        xs = array("d")
+        ys = array("d")
+
+        for pnt in points:
+            xs.append(pnt.x)
+            ys.append(pnt.y)
+
+        return xs, ys
+
+    def node_offsets(self):
+        """
+        Returns where each node's points are within `coordinates()`.
+
+        A node's points (including all of it's children's) are contiguous,
+        so `xs[start:end]` are the X coordinates within that node.
+
+        Returns:
+            tuple: `(nodes, offsets)`. The nodes, in pre-order, & an
+                `array("q")` holding a `start, end` pair for each of them.
+        """
+        nodes = []
+        offsets = array("q")
+        stack = [self._root]
+        start = 0
+
+        while stack:
+            node = stack.pop()
+            nodes.append(node)
+            offsets.append(start)
+            offsets.append(start + node.count)
+            start += len(node.points)
+
+            for child in (node.lr, node.ll, node.ur, node.ul):
+                if child is not None:
+                    stack.append(child)
+
+        return nodes, offsets
+
+    def to_numpy(self, bb=None):
+        """
+        Returns the coordinates of the points as NumPy arrays.
+
+        You will have to separately install `numpy`, as this library does
+        not depend on it in any other way. The arrays share memory with the
+        buffers from `coordinates`, so there's no extra copy.
+
+        Args:
+            bb (BoundingBox): Optional. Only include the points within this
+                box. Default is `None` (every point).
+
+        Returns:
+            tuple: The `(xs, ys)` arrays (of `float64`).
+        """
+        import numpy
+
+        xs, ys = self.coordinates(bb=bb)
+        return (
+            numpy.frombuffer(xs, dtype=numpy.float64),
+            numpy.frombuffer(ys, dtype=numpy.float64),
+        )
+
+    def insert_many(self, points, chunk_size=10000):
+        """
+        Inserts many points, reading them from any iterable (including
+        generators, like `read_csv`) a chunk at a time.
+
+        Only one chunk is held in memory at once. With `auto_expand`, the
+        tree grows to fit each chunk in one go, rather than point by point.
+        Each chunk then goes down the tree in a single pass, split up by
+        quadrant at each node, so a node's counts & aggregates are updated
+        once per chunk rather than once per point. (A `CompressedQuadTree`
+        still inserts point by point, as it's nodes reshape around each
+        one.)
+
+        A chunk is checked (bounds & keys) before any of it is inserted, so
+        a bad point leaves the rest of it's chunk out of the tree.
+
+        Usage::
+
+            >>> with open("places.csv", newline="") as csv_file:
+            ...     tree.insert_many(quads.read_csv(csv_file))
+            1000000
+
+        Args:
+            points (iterable): The points to insert, as `Point` objects or
+                `(x, y)` tuples/lists. The `data` on `Point` objects is kept.
+            chunk_size (int): Optional. How many points to read at a time.
+                Default is `10000`.
+
+        Returns:
+            int: How many points were inserted.
+        """
+        self._check_writable()
+        points = iter(points)
+        inserted = 0
+
+        while True:
+            chunk = [
+                self.convert_to_point(pnt)
+                for pnt in itertools.islice(points, chunk_size)
+            ]
+
+            if not chunk:
+                return inserted
+
+            if self.auto_expand:
+                xs = [pnt.x for pnt in chunk]
+                ys = [pnt.y for pnt in chunk]
+                self._expand_to(self.point_class(min(xs), min(ys)))
+                self._expand_to(self.point_class(max(xs), max(ys)))
+
+            self._check_chunk(chunk)
+            inserted += self._insert_chunk(chunk)
+
+    def _check_chunk(self, chunk):
+        # Everything `insert` would reject, checked before any of the chunk
+        # goes in.
+        for pnt in chunk:
+            if not self._root.contains_point(pnt):
+                raise ValueError(
+                    "Point {} is not within this tree ({}).".format(
+                        pnt, self._root.bounding_box
+                    )
+                )
+
+        if self._keys is not None:
+            seen = set()
+
+            for pnt in chunk:
+                key = self.key_func(pnt.data)
+
+                if key in self._keys or key in seen:
+                    raise ValueError(
+                        "A point with the key {!r} is already present.".format(
+                            key
+                        )
+                    )
+
+                seen.add(key)
+
+    def _insert_chunk(self, chunk):
+        # Inserts a checked chunk in one pass down the tree, returning how
+        # many points went in.
+        if self._root.epoch != self._epoch:
+            self._root = self._root._copy(self._epoch)
+
+        landed = []
+        self._root._insert_many(chunk, None, self._epoch, landed)
+
+        for pnt, node in landed:
+            self._track(pnt, node)
+
+        return len(chunk)
+
+    def register_aggregate(self, name, aggregate):
+        """
+        Registers an `Aggregate` that every node maintains as points are
+        added or removed.
+
+        Any points already in the tree are included right away.
+
+        Args:
+            name (str): The name to refer to the aggregate by.
+            aggregate (Aggregate): The aggregate to maintain.
+
+        Returns:
+            None: Nothing to see here. Please go about your business.
+        """
+        self._check_writable()
+
+        if self._epoch:
+            # Every node (& the shared mapping of aggregates) is about to
+            # change, so stop sharing any of them with snapshots.
+            self._copy_all()
+
+        self._root.aggregates[name] = aggregate
+
+        # Children before parents, so each node can build from them.
+        stack = [self._root]
+        ordered = []
+
+        while stack:
+            node = stack.pop()
+            ordered.append(node)
+
+            for child in (node.ul, node.ur, node.ll, node.lr):
+                if child is not None:
+                    stack.append(child)
+
+        for node in reversed(ordered):
+            node.refresh_aggregates()
+
+    def aggregate_within_bb(self, bb, name):
+        """
+        Calculates a registered aggregate over the points within a bounding
+        box.
+
+        Nodes that are entirely within the bounding box contribute their
+        cached value, without looking at their points.
+
+        Args:
+            bb (BoundingBox): The bounding box to aggregate within.
+            name (str): The name of the registered `Aggregate`.
+
+        Returns:
+            any: The aggregated result, or `None` if there are no points
+                within the bounding box.
+        """
+        if name not in self._root.aggregates:
+            raise ValueError("No aggregate named {!r}.".format(name))
+
+        aggregate = self._root.aggregates[name]
+        value = None
+        found = False
+        stack = [self._root]
+
+        while stack:
+            node = stack.pop()
+
+            if not node.bounding_box.intersects(bb):
+                continue
+
+            if bb.contains_bb(node.bounding_box):
+                if name in node.aggregate_values:
+                    node_value = node.aggregate_values[name]
+                    value = (
+                        aggregate.combine(value, node_value)
+                        if found
+                        else node_value
+                    )
+                    found = True
+
+                continue
+
+            for pnt in node.points:
+                if bb.contains(pnt):
+                    pnt_value = aggregate.key(pnt.data)
+                    value = (
+                        aggregate.combine(value, pnt_value)
+                        if found
+                        else pnt_value
+                    )
+                    found = True
+
+            for child in (node.ul, node.ur, node.ll, node.lr):
+                if child is not None:
+                    stack.append(child)
+
+        if not found:
+            return None
+
+        return aggregate.result(value)
+
+    def density_grid(self, bb, rows, cols, as_array=False):
+        """
+        Counts the points within a bounding box, bucketed into a grid.
+
+        This is a single walk of the tree. Any node that falls entirely
+        within one cell adds it's cached point count, without looking at
+        it's points. Only nodes straddling cell borders are scanned.
+
+        If you have `numpy` installed (not required!), you can get the
+        grid back as an array.
+
+        Usage::
+
+            >>> bb = quads.BoundingBox(-50, -50, 50, 50)
+            >>> tree.density_grid(bb, 2, 2)
+            [[3, 1], [0, 5]]
+
+        Args:
+            bb (BoundingBox): The region to cover.
+            rows (int): The number of rows. Row `0` is at the top
+                (`bb.max_y`), like an image.
+            cols (int): The number of columns. Column `0` is at the left
+                (`bb.min_x`).
+            as_array (bool): Optional. If `True`, returns a
+                `numpy.ndarray` instead. Default is `False`.
+
+        Returns:
+            list|numpy.ndarray: A list of `rows` lists, each of `cols`
+                counts.
+        """
+        if rows < 1 or cols < 1:
+            raise ValueError(
+                "The grid needs at least one row & column, not {}x{}.".format(
+                    rows, cols
+                )
+            )
+
+        grid = [[0] * cols for _ in range(rows)]
+        cell_width = bb.width / cols
+        cell_height = bb.height / rows
+
+        def cell_of(x, y):
+            # Points on the far edges belong to the last row/column.
+            col = min(int((x - bb.min_x) // cell_width), cols - 1)
+            row = min(int((bb.max_y - y) // cell_height), rows - 1)
+            return row, col
+
+        stack = [self._root]
+
+        while stack:
+            node = stack.pop()
+            node_bb = node.bounding_box
+
+            if not node.count or not node_bb.intersects(bb):
+                continue
+
+            if bb.contains_bb(node_bb):
+                top_left = cell_of(node_bb.min_x, node_bb.max_y)
+
+                if top_left == cell_of(node_bb.max_x, node_bb.min_y):
+                    grid[top_left[0]][top_left[1]] += node.count
+                    continue
+
+            for pnt in node.points:
+                if bb.contains(pnt):
+                    row, col = cell_of(pnt.x, pnt.y)
+                    grid[row][col] += 1
+
+            for child in (node.ul, node.ur, node.ll, node.lr):
+                if child is not None:
+                    stack.append(child)
+
+        if as_array:
+            import numpy
+
+            return numpy.array(grid)
+
+        return grid
+
+    def clusters(self, zoom, bb=None, resolution=3):
+        """
+        Summarizes the tree into clusters, for drawing at a map zoom level.
+
+        The tree is walked down to depth `zoom + resolution`, so that each
+        tile at that zoom holds at most `2 ** resolution` by
+        `2 ** resolution` clusters. Nodes at that depth become a single
+        `Cluster`, using their cached count & centroid, without visiting
+        their points. Points in leaves above that depth are returned as-is.
+
+        Zoom level `0` is the extent the tree was created with. Node depths
+        are counted from there, so growing the tree (via `auto_expand`)
+        doesn't change what a zoom level means. The grown levels above it
+        are negative zoom levels.
+
+        Usage::
+
+            >>> tree.clusters(2)
+            [<Cluster: (12.5, 8.25) x40>, <Point: (-3, 7)>]
+
+        Args:
+            zoom (int): The zoom level.
+            bb (BoundingBox): Optional. Only nodes intersecting this region
+                (typically the viewport) are included. Default is `None`
+                (the whole tree).
+            resolution (int): Optional. How many levels below the zoom level
+                to cluster at. Default is `3`.
+
+        Returns:
+            list: A mix of `Cluster` & `Point` objects.
+        """
+        depth = zoom + resolution
+        results = []
+        stack = [self._root]
+
+        while stack:
+            node = stack.pop()
+
+            if not node.count:
+                continue
+
+            if bb is not None and not node.bounding_box.intersects(bb):
+                continue
+
+            if node.depth >= depth and node.count > 1:
+                centroid = node.centroid()
+                results.append(
+                    Cluster(
+                        centroid.x, centroid.y, node.count, node.bounding_box
+                    )
+                )
+                continue
+
+            for pnt in node.points:
+                if bb is None or bb.contains(pnt):
+                    results.append(pnt)
+
+            for child in (node.lr, node.ll, node.ur, node.ul):
+                if child is not None:
+                    stack.append(child)
+
+        return results
+
+    def sample_within_bb(self, bb, k, seed=None):
+        """
+        Draws a uniform random sample of the points within a bounding box.
+
+        The region is first split into whole nodes (with their cached
+        counts) & the individual points of nodes along it's border. Each
+        sample then picks one of those in proportion to it's count, &
+        descends through the chosen node the same way, which is O(depth)
+        per sample. The region's points are never all gathered up, unless
+        `k` is a large share of them.
+
+        Args:
+            bb (BoundingBox): The bounding box to sample within.
+            k (int): How many (distinct) points to sample. If there are
+                fewer than that within the bounding box, all of them are
+                returned.
+            seed (any): Optional. A seed for the random number generator,
+                for repeatable samples. Default is `None`.
+
+        Returns:
+            list: The sampled `Point` objects, in random order.
+        """
+        rng = random.Random(seed)
+        # A mix of fully contained nodes & loose points, with the running
+        # total of their weights for weighted picks.
+        parts = []
+        totals = []
+        total = 0
+        stack = [self._root]
+
+        while stack:
+            node = stack.pop()
+
+            if not node.count or not node.bounding_box.intersects(bb):
+                continue
+
+            if bb.contains_bb(node.bounding_box):
+                total += node.count
+                parts.append(node)
+                totals.append(total)
+                continue
+
+            for pnt in node.points:
+                if bb.contains(pnt):
+                    total += 1
+                    parts.append(pnt)
+                    totals.append(total)
+
+            for child in (node.ul, node.ur, node.ll, node.lr):
+                if child is not None:
+                    stack.append(child)
+
+        if k * 2 >= total:
+            # Most of the region is wanted anyway, so rejecting repeats
+            # would be slow. Just gather everything.
+            points = []
+
+            for part in parts:
+                if isinstance(part, QuadNode):
+                    points.extend(part)
+                else:
+                    points.append(part)
+
+            return rng.sample(points, min(k, total))
+
+        sample = []
+        seen = set()
+
+        while len(sample) < k:
+            offset = rng.randrange(total)
+            part = parts[bisect.bisect_right(totals, offset)]
+
+            if isinstance(part, QuadNode):
+                part = self._pick(part, rng.randrange(part.count))
+
+            if id(part) not in seen:
+                seen.add(id(part))
+                sample.append(part)
+
+        return sample
+
+    def _pick(self, node, offset):
+        # Returns the `offset`-th point within the node, in iteration order,
+        # using the cached counts to skip over whole children.
+        while True:
+            if offset < len(node.points):
+                return node.points[offset]
+
+            offset -= len(node.points)
+
+            for child in (node.ul, node.ur, node.ll, node.lr):
+                if child is None:
+                    continue
+
+                if offset < child.count:
+                    node = child
+                    break
+
+                offset -= child.count
+            else:
+                raise ValueError(
+                    "Node counts are out of sync with their points."
+                )
+
+    def top_k_within_bb(self, bb, k, name):
+        """
+        Finds the points within a bounding box with the highest values of a
+        registered `Aggregate.max`.
+
+        The search is best-first, using each node's cached maximum as an
+        upper bound. Once `k` points are found, any node whose maximum
+        can't beat the worst of them is skipped entirely.
+
+        Usage::
+
+            >>> tree.register_aggregate(
+            ...     "priority", quads.Aggregate.max(lambda data: data["pri"])
+            ... )
+            >>> tree.top_k_within_bb(bb, 50, "priority")
+
+        Args:
+            bb (BoundingBox): The bounding box to search within.
+            k (int): How many points to return.
+            name (str): The name of a registered `Aggregate.max`.
+
+        Returns:
+            list: Up to `k` `Point` objects, highest value first.
+        """
+        aggregate = self._root.aggregates.get(name)
+
+        if aggregate is None or aggregate.combine is not max:
+            raise ValueError(
+                "{!r} must be a registered `Aggregate.max`.".format(name)
+            )
+
+        if k <= 0:
+            return []
+
+        # The counter breaks ties, so nodes & points never get compared.
+        counter = itertools.count()
+        # A max-heap (by negating) of nodes still to search.
+        nodes = []
+        # A min-heap of the best points so far, worst on top.
+        best = []
+
+        if self._root.count and name in self._root.aggregate_values:
+            nodes.append(
+                (-self._root.aggregate_values[name], next(counter), self._root)
+            )
+
+        while nodes:
+            negated, _, node = heapq.heappop(nodes)
+
+            if len(best) >= k and -negated <= best[0][0]:
+                # Nothing left can beat what we have.
+                break
+
+            for pnt in node.points:
+                if not bb.contains(pnt):
+                    continue
+
+                entry = (aggregate.key(pnt.data), next(counter), pnt)
+
+                if len(best) < k:
+                    heapq.heappush(best, entry)
+                elif entry[0] > best[0][0]:
+                    heapq.heapreplace(best, entry)
+
+            for child in (node.ul, node.ur, node.ll, node.lr):
+                if child is None or not child.count:
+                    continue
+
+                if child.bounding_box.intersects(bb):
+                    heapq.heappush(
+                        nodes,
+                        (-child.aggregate_values[name], next(counter), child),
+                    )
+
+        best.sort(key=lambda entry: (-entry[0], entry[1]))
+        return [entry[2] for entry in best]
+
+    def within_bb_many(self, boxes):
+        """
+        Finds the points within each of several bounding boxes, in a single
+        walk of the quadtree.
+
+        Much faster than calling `within_bb` once per box, when there are
+        many boxes (for instance, all the tiles of a map view).
+
+        Args:
+            boxes (list): The `BoundingBox` objects to check.
+
+        Returns:
+            list: A list of points for each box, in the same order as
+                `boxes`.
+        """
+        return self._root.within_bb_many(boxes)
+
+    def within_segment(self, p0, p1, width):
+        """
+        Finds all the points within a distance of a line segment.
+
+        Useful for corridor-style searches (for instance, everything near a
+        route). Nodes further than `width` from the segment are skipped.
+
+        Args:
+            p0 (Point|tuple): One end of the segment.
+            p1 (Point|tuple): The other end of the segment.
+            width (int|float): The maximum distance from the segment.
+
+        Returns:
+            list: The matching `Point` objects.
+        """
+        p0 = self.convert_to_point(p0)
+        p1 = self.convert_to_point(p1)
+        limit = width * width
+        segment = (p0.x, p0.y, p1.x, p1.y)
+        points = []
+        stack = [self._root]
+
+        while stack:
+            node = stack.pop()
+
+            if not node.count:
+                continue
+
+            if _segment_bb_compare(node.bounding_box, *segment) > limit:
+                continue
+
+            for pnt in node.points:
+                if _segment_compare(pnt.x, pnt.y, *segment) <= limit:
+                    points.append(pnt)
+
+            for child in (node.lr, node.ll, node.ur, node.ul):
+                if child is not None:
+                    stack.append(child)
+
+        return points
+
+    def ray_cast(self, origin, direction, width=0):
+        """
+        Finds the first point hit by a ray.
+
+        Nodes are visited front-to-back (by where the ray enters them), so
+        the search stops as soon as no remaining node could hold a closer
+        hit.
+
+        Args:
+            origin (Point|tuple): Where the ray starts.
+            direction (Point|tuple): The direction of the ray, as an X/Y
+                vector. It doesn't need to be normalized.
+            width (int|float): Optional. How close a point needs to be to
+                the ray to count as hit. Default is `0` (it must lie exactly
+                on the ray).
+
+        Returns:
+            Point|None: The first point hit, or `None` if nothing was hit.
+        """
+        origin = self.convert_to_point(origin)
+        direction = self.convert_to_point(direction)
+        length = math.sqrt(direction.x ** 2 + direction.y ** 2)
+
+        if not length:
+            raise ValueError("The direction of the ray can not be zero.")
+
+        dx, dy = direction.x / length, direction.y / length
+        limit = width * width
+        counter = itertools.count()
+        nodes = []
+        best, best_t = None, math.inf
+
+        entry = _ray_entry(
+            self._root.bounding_box, origin.x, origin.y, dx, dy, width
+        )
+
+        if entry is not None and self._root.count:
+            nodes.append((entry, next(counter), self._root))
+
+        while nodes:
+            entry, _, node = heapq.heappop(nodes)
+
+            if entry > best_t:
+                break
+
+            for pnt in node.points:
+                # How far along the ray the point is, & how far from it.
+                # This sticks to the raw direction where possible, so points
+                # exactly on the ray aren't lost to rounding.
+                rel_x, rel_y = pnt.x - origin.x, pnt.y - origin.y
+                along = rel_x * direction.x + rel_y * direction.y
+
+                if along <= 0:
+                    t = 0
+                    hit = rel_x * rel_x + rel_y * rel_y <= limit
+                else:
+                    t = along / length
+                    cross = rel_x * direction.y - rel_y * direction.x
+                    hit = cross * cross <= limit * length * length
+
+                if hit and t < best_t:
+                    best, best_t = pnt, t
+
+            for child in (node.ul, node.ur, node.ll, node.lr):
+                if child is None or not child.count:
+                    continue
+
+                entry = _ray_entry(
+                    child.bounding_box, origin.x, origin.y, dx, dy, width
+                )
+
+                if entry is not None and entry <= best_t:
+                    heapq.heappush(nodes, (entry, next(counter), child))
+
+        return best
+
+    def _best_first(self, point_compare, node_compare, count):
+        # A general best-first k-nearest search. `point_compare` gives the
+        # (raw) distance to a point & `node_compare` a lower bound on that
+        # for anything within a node's bounding box.
+        if count <= 0:
+            return []
+
+        counter = itertools.count()
+        nodes = []
+        # A max-heap (by negating) of the best points so far, worst on top.
+        best = []
+
+        if self._root.count:
+            distance = node_compare(self._root.bounding_box)
+            nodes.append((distance, next(counter), self._root))
+
+        while nodes:
+            distance, _, node = heapq.heappop(nodes)
+
+            if len(best) >= count and distance > -best[0][0]:
+                break
+
+            for pnt in node.points:
+                entry = (-point_compare(pnt), -next(counter), pnt)
+
+                if len(best) < count:
+                    heapq.heappush(best, entry)
+                elif entry > best[0]:
+                    heapq.heapreplace(best, entry)
+
+            for child in (node.ul, node.ur, node.ll, node.lr):
+                if child is None or not child.count:
+                    continue
+
+                distance = node_compare(child.bounding_box)
+
+                if len(best) < count or distance <= -best[0][0]:
+                    heapq.heappush(nodes, (distance, next(counter), child))
+
+        best.sort(reverse=True)
+        return [entry[2] for entry in best]
+
+    def nearest_neighbors(self, point, count=10):
+        """
+        Returns the nearest points of a given point, sorted by distance
+        (closest first).
+
+        The desired point does not need to exist within the quadtree, but
+        does need to be within the tree's boundaries.
+
+        The query can also be a `BoundingBox` (for instance, the footprint
+        of a building). Distances are then measured to the nearest part of
+        the box, so points within it come first. This uses a best-first
+        search, pruning nodes by the gap between their bounding box & the
+        query, & the box doesn't need to be within the tree's boundaries.
+
+        Args:
+            point (Point|BoundingBox): The desired location to search
+                around.
+            count (int): Optional. The number of neighbors to return. Default
+                is `10`.
+
+        Returns:
+            list: The nearest `Point` neighbors.
+        """
+        if isinstance(point, BoundingBox):
+            return self._best_first(
+                point.point_compare, point.bb_compare, count
+            )
+
+        # Algorithm description:
+        # * Search down to find the smallest node around the desired point,
+        #   retaining a stack of nodes visited on the way down.
+        # * Reverse the visited stack, so that it's now in
+        #   smallest/closest-to-largest/furthest order.
+        # * Iterate over the node stack.
+        #   * Collect the points from the current node & it's children.
+        #   * Sort the points by euclidean distance, using
+        #     `euclidean_compare`, since the actual distance doesn't matter
+        #     for now.
+        #   * Add them to the "found" results.
+        #   * If the "found" count is greater-than-or-equal to the desired
+        #     count, break out of the loop.
+        # * If the stack is exhausted, we have all the points in the entire
+        #   quadtree & can just return them.
+        # * Otherwise, we now have a decent set of results, ordered by
+        #   distance. But we are not done. It's possible/probable that there
+        #   are other nearby quadnodes that weren't touched by the search
+        #   BUT are physically closer.
+        # * Take our furthest point and use it as a radius for a search
+        #   "circle".
+        #     * We'll actually just create a bounding box, which is
+        #       computationally cheaper & we already have methods that
+        #       support it.
+        #     * Using that radius as a distance to the *edge* (not a corner),
+        #       we create a box big enough to fit the search circle.
+        # * Collect all the points within that bounding box.
+        # * Re-sort them by euclidean distance (again, using
+        #   `euclidean_compare`).
+        # * Slice it to match the desired count & return them.
+
+        point = self.convert_to_point(point)
+        nearest_results = []
+
+        # Check to see if it's within our bounds first.
+        if not self._root.contains_point(point):
+            return nearest_results
+
+        # First, find the target node.
+        node, searched_nodes = self._root.find_node(point)
+
+        # Reverse the order, as they come back in coarse-to-fine order, which
+        # is the opposite of nearby points.
+        searched_nodes.reverse()
+        seen_nodes = set()
+        seen_points = set()
+
+        # From here, we'll work our way backwards out through the nodes.
+        for node in searched_nodes:
+            # Mark the node as already checked.
+            seen_nodes.add(node)
+            local_points = []
+
+            for pnt in node.all_points():
+                if pnt in seen_points:
+                    continue
+
+                seen_points.add(pnt)
+                local_points.append(pnt)
+
+            local_points = sorted(
+                local_points, key=lambda lpnt: euclidean_compare(point, lpnt)
+            )
+            nearest_results.extend(local_points)
+
+            if len(nearest_results) >= count:
+                break
+
+        # Slice off any extras.
+        nearest_results = nearest_results[:count]
+
+        if len(seen_nodes) == len(searched_nodes):
+            # We've exhausted everything. Return what we've got.
+            return nearest_results[:count]
+
+        search_radius = euclidean_distance(point, nearest_results[-1])
+        search_bb = BoundingBox(
+            point.x - search_radius,
+            point.y - search_radius,
+            point.x + search_radius,
+            point.y + search_radius,
+        )
+        bb_results = self._root.within_bb(search_bb)
+        nearest_results = sorted(
+            bb_results, key=lambda lpnt: euclidean_compare(point, lpnt)
+        )
+
+        return nearest_results[:count]
+
+
+class CompressedQuadTree(QuadTree):
+    """
+    A `QuadTree` made of path-compressed `CompressedQuadNode` objects.
+
+    Best suited to highly clustered data within a large extent, where it
+    avoids long chains of nodes with only one occupied child. The API is
+    the same as `QuadTree`.
+
+    Usage::
+
+        >>> import quads
+        >>> tree = quads.CompressedQuadTree((0, 0), 2 ** 20, 2 ** 20)
+        >>> tree.insert((1000.001, 1000.002))
+        True
+    """
+
+    node_class = CompressedQuadNode
+
+    def _insert_chunk(self, chunk):
+        # Compressed nodes reshape themselves around each new point (see
+        # `CompressedQuadNode._child_for`), so these go in one at a time.
+        inserted = 0
+
+        for pnt in chunk:
+            if self.insert(pnt, data=pnt.data):
+                inserted += 1
+
+        return inserted
+
+
+class MappedQuadTree(object):
+    """
+    A read-only quadtree, queried directly from a file written by
+    `QuadTree.dump`.
+
+    The file is memory-mapped rather than loaded, so opening it is nearly
+    instant regardless of size. Queries read the node table & coordinate
+    arrays in place, the OS only pages in the parts that get touched, &
+    processes opening the same file share those pages. Only the matching
+    points are ever built (& have their data unpickled).
+
+    As with `QuadTree.load`, the point data is pickled, so only open files
+    from a source you trust.
+
+    Usage::
+
+        >>> import quads
+        >>> with open("tree.qt", "wb") as dump_file:
+        ...     tree.dump(dump_file)
+        >>> mapped = quads.MappedQuadTree("tree.qt")
+        >>> mapped.find((1, 2))
+        Point(1, 2)
+        >>> mapped.close()
+    """
+
+    point_class = Point
+    # Where each child's index sits within a node record.
+    _CHILD_FIELDS = {"ul": 9, "ur": 10, "ll": 11, "lr": 12}
+
+    def __init__(self, path):
+        """
+        Opens a `MappedQuadTree`.
+
+        Args:
+            path (str): The path to a file written by `QuadTree.dump`.
+        """
+        with open(path, "rb") as tree_file:
+            self._map = mmap.mmap(
+                tree_file.fileno(), 0, access=mmap.ACCESS_READ
+            )
+
+        try:
+            header = _read_header(self._map)
+        except ValueError:
+            self._map.close()
+            raise
+
+        self._header = header
+        self._nodes_offset = header["nodes_offset"]
+        self._kinds_offset = header["kinds_offset"]
+        self._payload_offset = header["payload_offset"]
+        self._buffer = memoryview(self._map)
+        point_count = header["point_count"]
+
+        if sys.byteorder == "little":
+            self._xs = self._view("d", header["xs_offset"], point_count)
+            self._ys = self._view("d", header["ys_offset"], point_count)
+            self._payload_index = self._view(
+                "q", header["payload_index_offset"], point_count + 1
+            )
+        else:  # pragma: no cover
+            self._xs = _read_array(
+                self._map, "d", header["xs_offset"], point_count
+            )
+            self._ys = _read_array(
+                self._map, "d", header["ys_offset"], point_count
+            )
+            self._payload_index = _read_array(
+                self._map, "q", header["payload_index_offset"], point_count + 1
+            )
+
+        root = self._node(0)
+        kind = root[5] >> _NODE_INT_SHIFT
+        self.center = self.point_class(
+            _restore_int(root[0], kind, _CELL_X_INT),
+            _restore_int(root[1], kind, _CELL_Y_INT),
+        )
+        self.width = _restore_int(root[2], kind, _CELL_WIDTH_INT)
+        self.height = _restore_int(root[3], kind, _CELL_HEIGHT_INT)
+
+    def _view(self, typecode, offset, length):
+        return self._buffer[offset:offset + 8 * length].cast(typecode)
+
+    def __repr__(self):
+        return "<MappedQuadTree: ({}, {}) {}x{}>".format(
+            self.center.x, self.center.y, self.width, self.height
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Unmaps the file.
+
+        Any points already returned stay usable, but the tree can't be
+        queried afterward.
+
+        Returns:
+            None: Nothing to see here. Please go about your business.
+        """
+        for name in ("_xs", "_ys", "_payload_index", "_buffer"):
+            values = getattr(self, name)
+
+            if isinstance(values, memoryview):
+                values.release()
+
+        self._map.close()
+
+    def _node(self, offset):
+        # A node's record: (center_x, center_y, width, height, depth, flags,
+        # point_start, point_count, subtree count, ul, ur, ll, lr).
+        return _NODE.unpack_from(
+            self._map, self._nodes_offset + offset * _NODE.size
+        )
+
+    def _point(self, offset):
+        kind = self._map[self._kinds_offset + offset]
+        pnt = self.point_class(
+            _restore_int(self._xs[offset], kind, _X_INT),
+            _restore_int(self._ys[offset], kind, _Y_INT),
+        )
+        start = self._payload_index[offset]
+        end = self._payload_index[offset + 1]
+
+        if end > start:
+            payload_offset = self._payload_offset
+            pnt.data = pickle.loads(
+                self._map[payload_offset + start:payload_offset + end]
+            )
+
+        return pnt
+
+    def _points(self, start, count):
+        return [self._point(offset) for offset in range(start, start + count)]
+
+    def convert_to_point(self, val):
+        """
+        Converts a value to a `Point` object.
+
+        This is to allow shortcuts, like providing a tuple for a point.
+
+        Args:
+            val (Point|tuple|None): The value to convert.
+
+        Returns:
+            Point: A point object.
+        """
+        if isinstance(val, self.point_class):
+            return val
+        elif isinstance(val, (tuple, list)):
+            return self.point_class(val[0], val[1])
+        elif val is None:
+            return self.point_class(0, 0)
+        else:
+            raise ValueError(
+                "Unknown data provided for point. Please use one of: "
+                "quads.Point | tuple | list | None"
+            )
+
+    def __contains__(self, point):
+        """
+        Checks if a `Point` is found in the tree.
+
+        Args:
+            point (Point|tuple|None): The point to check for.
+
+        Returns:
+            bool: `True` if found, otherwise `False`.
+        """
+        return self.find(point) is not None
+
+    def __len__(self):
+        """
+        Returns a count of how many points are in the tree.
+
+        Returns:
+            int: A count of all the points.
+        """
+        return self._header["point_count"]
+
+    def __iter__(self):
+        """
+        Returns an iterator for all the points in the tree, in the same
+        order as the `QuadTree` that was dumped.
+
+        Returns:
+            iterator: An iterator of all the points.
+        """
+        return (self._point(offset) for offset in range(len(self)))
+
+    def coordinates(self, bb=None):
+        """
+        Returns the coordinates of the points as flat buffers (X & Y), in
+        the same order as iterating over the tree.
+
+        For every point, these are `memoryview` objects straight onto the
+        mapped file (on little-endian machines), so nothing is copied & the
+        pages are only read as they're used. They're only valid until the
+        tree is closed. With a `bb`, the matching coordinates are gathered
+        into new `array("d")` buffers, a whole subtree at a time where
+        possible.
+
+        Args:
+            bb (BoundingBox): Optional. Only include the points within this
+                box, in the same order as `within_bb`. Default is `None`
+                (every point).
+
+        Returns:
+            tuple: The `(xs, ys)` buffers.
+        """
+        if bb is None:
+            return self._xs, self._ys
+
+        xs = array("d")
+        ys = array("d")
+
+        for start, end in self._ranges_within_bb(bb):
+            if end - start == 1:
+                xs.append(self._xs[start])
+                ys.append(self._ys[start])
+            else:
+                xs.frombytes(memoryview(self._xs[start:end]).cast("B"))
+                ys.frombytes(memoryview(self._ys[start:end]).cast("B"))
+
+        return xs, ys
+
+    def node_offsets(self):
+        """
+        Returns where each node's points are within `coordinates()`.
+
+        Unlike `QuadTree.node_offsets`, this doesn't need to build the
+        nodes. Row `n` is the `n`-th node record of the file, in pre-order.
+
+        Returns:
+            array: An `array("q")` holding a `start, end` pair per node.
+        """
+        offsets = array("q")
+
+        for offset in range(self._header["node_count"]):
+            node = self._node(offset)
+            offsets.append(node[6])
+            offsets.append(node[6] + node[8])
+
+        return offsets
+
+    def to_numpy(self, bb=None):
+        """
+        Returns the coordinates of the points as NumPy arrays.
+
+        You will have to separately install `numpy`. Without a `bb`, the
+        arrays are read-only views onto the mapped file, so this is
+        zero-copy, but they need to be dropped before the tree is closed.
+
+        Args:
+            bb (BoundingBox): Optional. Only include the points within this
+                box. Default is `None` (every point).
+
+        Returns:
+            tuple: The `(xs, ys)` arrays (of `float64`).
+        """
+        import numpy
+
+        xs, ys = self.coordinates(bb=bb)
+        return (
+            numpy.frombuffer(xs, dtype=numpy.float64),
+            numpy.frombuffer(ys, dtype=numpy.float64),
+        )
+
+    def _ranges_within_bb(self, bb):
+        # Yields `(start, end)` ranges of the points within `bb`, in the
+        # same order as `within_bb`.
+        stack = [0]
+
+        while stack:
+            node = self._node(stack.pop())
+            min_x, min_y, max_x, max_y = _cell_bounds(node)
+
+            if (
+                bb.min_x > max_x
+                or bb.max_x < min_x
+                or bb.max_y < min_y
+                or bb.min_y > max_y
+            ):
+                continue
+
+            if (
+                bb.min_x <= min_x
+                and max_x <= bb.max_x
+                and bb.min_y <= min_y
+                and max_y <= bb.max_y
+            ):
+                # A subtree's points are contiguous, so take them all.
+                yield node[6], node[6] + node[8]
+                continue
+
+            for offset in range(node[6], node[6] + node[7]):
+                if (
+                    bb.min_x <= self._xs[offset] <= bb.max_x
+                    and bb.min_y <= self._ys[offset] <= bb.max_y
+                ):
+                    yield offset, offset + 1
+
+            for child in reversed(node[9:]):
+                if child >= 0:
+                    stack.append(child)
+
+    def find(self, point):
+        """
+        Searches for a `Point` within the tree.
+
+        Args:
+            point (Point|tuple|None): The point to search for.
+
+        Returns:
+            Point|None: Returns the `Point` (including it's data) if found.
+                `None` if the point is not found.
+        """
+        point = self.convert_to_point(point)
+        x, y = point.x, point.y
+        node = self._node(0)
+
+        if not _cell_contains(node, x, y):
+            return None
+
+        while True:
+            quadrant = _quadrant_of(node[0], node[1], x, y)
+            child = node[self._CHILD_FIELDS[quadrant]]
+
+            if child < 0:
+                break
+
+            child_node = self._node(child)
+
+            if not _cell_contains(child_node, x, y):
+                break
+
+            node = child_node
+
+        for offset in range(node[6], node[6] + node[7]):
+            if self._xs[offset] == x and self._ys[offset] == y:
+                return self._point(offset)
+
+        return None
+
+    def within_bb(self, bb):
+        """
+        Finds all the points within a bounding box.
+
+        Args:
+            bb (BoundingBox): The bounding box to search within.
+
+        Returns:
+            list: The matching `Point` objects, in the same order as
+                `QuadTree.within_bb` would give them.
+        """
+        points = []
+
+        for start, end in self._ranges_within_bb(bb):
+            points.extend(self._points(start, end - start))
+
+        return points
+
+    def nearest_neighbors(self, point, count=10):
+        """
+        Returns the nearest points of a given point, sorted by distance
+        (closest first).
+
+        This is a best-first search over the mapped nodes, so only the
+        nodes that could hold a closer point are read. As with
+        `QuadTree.nearest_neighbors`, the point needs to be within the
+        tree's boundaries & the query can also be a `BoundingBox`.
+
+        Args:
+            point (Point|BoundingBox): The desired location to search
+                around.
+            count (int): Optional. The number of neighbors to return. Default
+                is `10`.
+
+        Returns:
+            list: The nearest `Point` neighbors.
+        """
+        if count <= 0:
+            return []
+
+        if isinstance(point, BoundingBox):
+            query = point
+        else:
+            point = self.convert_to_point(point)
+
+            if not _cell_contains(self._node(0), point.x, point.y):
+                return []
+
+            query = BoundingBox(point.x, point.y, point.x, point.y)
+
+        def compare(min_x, min_y, max_x, max_y):
+            dx = max(query.min_x - max_x, 0, min_x - query.max_x)
+            dy = max(query.min_y - max_y, 0, min_y - query.max_y)
+            return dx ** 2 + dy ** 2
+
+        counter = itertools.count()
+        nodes = []
+        # A max-heap (by negating) of the best points so far, worst on top.
+        best = []
+        root = self._node(0)
+
+        if root[8]:
+            nodes.append((compare(*_cell_bounds(root)), next(counter), root))
+
+        while nodes:
+            distance, _, node = heapq.heappop(nodes)
+
+            if len(best) >= count and distance > -best[0][0]:
+                break
+
+            for offset in range(node[6], node[6] + node[7]):
+                x, y = self._xs[offset], self._ys[offset]
+                entry = (-compare(x, y, x, y), -next(counter), offset)
+
+                if len(best) < count:
+                    heapq.heappush(best, entry)
+                elif entry > best[0]:
+                    heapq.heapreplace(best, entry)
+
+            for child in node[9:]:
+                if child < 0:
+                    continue
+
+                child_node = self._node(child)
+
+                if not child_node[8]:
+                    continue
+
+                distance = compare(*_cell_bounds(child_node))
+
+                if len(best) < count or distance <= -best[0][0]:
+                    heapq.heappush(
+                        nodes, (distance, next(counter), child_node)
+                    )
+
+        best.sort(reverse=True)
+        return [self._point(entry[2]) for entry in best]
+
+
+class DurableQuadTree(object):
+    """
+    A quadtree whose changes survive crashes.
+
+    Every `insert`, `remove` & `remove_by_key` is appended to a log as a
+    small binary record, then applied to the tree. If the change fails (or
+    doesn't happen), the record is taken back out of the log, so the tree &
+    the log always agree. The log is only `fsync`-ed every `sync_every`
+    records (or on `sync`/`close`), so ingest isn't tied to disk latency.
+    `snapshot` writes the whole tree (via `QuadTree.dump`) & starts a fresh
+    log.
+
+    On opening, the latest snapshot is loaded & the log after it is
+    replayed. A record torn by a crash (the tail of the log) is detected by
+    it's checksum & dropped.
+
+    All the files live in one directory: `snapshot-<n>.qt` & `log-<n>.log`,
+    where `n` goes up with each snapshot. A snapshot is written to a
+    temporary file & renamed into place, so a crash part-way through leaves
+    the previous snapshot & log intact (the temporary file is cleaned up on
+    the next open).
+
+    Usage::
+
+        >>> import quads
+        >>> tree = quads.DurableQuadTree(
+        ...     "/var/lib/places",
+        ...     tree=quads.QuadTree((0, 0), 100, 100),
+        ... )
+        >>> tree.insert((1, 2), data="Samus")
+        True
+        >>> tree.close()
+
+        # Later (or after a crash)...
+        >>> tree = quads.DurableQuadTree("/var/lib/places")
+        >>> tree.find((1, 2)).data
+        'Samus'
+    """
+
+    def __init__(
+        self,
+        path,
+        tree=None,
+        sync_every=1000,
+        snapshot_every=None,
+        key_func=None,
+        aggregates=None,
+    ):
+        """
+        Opens (or creates) a `DurableQuadTree`.
+
+        Args:
+            path (str): The directory to keep the snapshots & logs in. It's
+                created if needed.
+            tree (QuadTree): Optional. The starting tree, used only if
+                there's nothing in `path` yet. Default is `None`.
+            sync_every (int): Optional. How many records to write between
+                each `fsync` of the log. Default is `1000`. `1` syncs every
+                change.
+            snapshot_every (int): Optional. Takes a snapshot automatically
+                after this many records. Default is `None` (only when
+                `snapshot` is called).
+            key_func (callable): Optional. The `key_func` to load the tree
+                with, if it had one. Default is `None`.
+            aggregates (dict): Optional. The aggregates to load the tree
+                with, if it had any. Default is `None`.
+        """
+        self.path = path
+        self.sync_every = sync_every
+        self.snapshot_every = snapshot_every
+        self.key_func = key_func
+        self.aggregates = aggregates
+        self._pending = 0
+        self._logged = 0
+
+        os.makedirs(path, exist_ok=True)
+        self._remove_temp_files()
+        generations = self._generations()
+
+        if generations:
+            self.generation = generations[-1]
+            self.tree = self._load_snapshot()
+            self._replay()
+            self._log = open(self._log_path(self.generation), "ab")
+
+            for generation in generations[:-1]:
+                self._remove_generation(generation)
+        elif tree is None:
+            raise ValueError(
+                "No snapshot found in {!r}. Please provide a `tree`.".format(
+                    path
+                )
+            )
+        else:
+            self.generation = 0
+            self.tree = tree
+            self._log = None
+            self.snapshot()
+
+    def __repr__(self):
+        return "<DurableQuadTree: {!r} {!r}>".format(self.path, self.tree)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _snapshot_path(self, generation):
+        return os.path.join(self.path, "snapshot-{}.qt".format(generation))
+
+    def _log_path(self, generation):
+        return os.path.join(self.path, "log-{}.log".format(generation))
+
+    def _generations(self):
+        generations = []
+
+        for filename in os.listdir(self.path):
+            name, extension = os.path.splitext(filename)
+
+            if extension == ".qt" and name.startswith("snapshot-"):
+                generations.append(int(name[len("snapshot-"):]))
+
+        return sorted(generations)
+
+    def _remove_temp_files(self):
+        # Any partial snapshots left behind by a crash.
+        for filename in os.listdir(self.path):
+            if filename.endswith(".qt.tmp"):
+                os.remove(os.path.join(self.path, filename))
+
+    def _remove_generation(self, generation):
+        for path in (
+            self._snapshot_path(generation),
+            self._log_path(generation),
+        ):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _load_snapshot(self):
+        with open(self._snapshot_path(self.generation), "rb") as snap_file:
+            header = _read_header(snap_file.read(_HEADER.size))
+            snap_file.seek(0)
+            tree_class = QuadTree
+
+            if header["flags"] & _FLAG_COMPRESSED:
+                tree_class = CompressedQuadTree
+
+            return tree_class.load(
+                snap_file, key_func=self.key_func, aggregates=self.aggregates
+            )
+
+    def _replay(self):
+        # Applies the log to the freshly loaded snapshot, stopping at the
+        # first incomplete or corrupt record.
+        log_path = self._log_path(self.generation)
+
+        if not os.path.exists(log_path):
+            return
+
+        with open(log_path, "rb") as log_file:
+            data = log_file.read()
+
+        offset = 0
+        header_size = _LOG_CHECKSUM.size + _LOG_RECORD.size
+
+        while offset + header_size <= len(data):
+            (checksum,) = _LOG_CHECKSUM.unpack_from(data, offset)
+            length, operation, kind, x, y = _LOG_RECORD.unpack_from(
+                data, offset + _LOG_CHECKSUM.size
+            )
+            end = offset + header_size + length
+
+            if end > len(data):
+                break
+
+            if checksum != zlib.crc32(data[offset + _LOG_CHECKSUM.size:end]):
+                break
+
+            payload = data[offset + header_size:end]
+            value = pickle.loads(payload) if payload else None
+            point = (
+                _restore_int(x, kind, _X_INT),
+                _restore_int(y, kind, _Y_INT),
+            )
+
+            if operation == _LOG_INSERT:
+                self.tree.insert(point, data=value)
+            elif operation == _LOG_REMOVE:
+                self.tree.remove(point)
+            elif operation == _LOG_REMOVE_BY_KEY:
+                self.tree.remove_by_key(value)
+
+            offset = end
+            self._logged += 1
+
+        if offset < len(data):
+            # Drop the torn tail, so new records follow the last good one.
+            with open(log_path, "r+b") as log_file:
+                log_file.truncate(offset)
+                log_file.flush()
+                os.fsync(log_file.fileno())
+
+    def _append(self, operation, point, value, change):
+        # Writes the record ahead of calling `change`, which makes the change
+        # to the tree. If that fails (or returns `False`), the record is
+        # truncated back off the log.
+        record = self._encode(operation, point, value)
+        offset = self._log.tell()
+        self._log.write(record)
+
+        try:
+            changed = change()
+        except BaseException:
+            self._unwrite(offset)
+            raise
+
+        if not changed:
+            self._unwrite(offset)
+            return False
+
+        self._pending += 1
+        self._logged += 1
+
+        if self._pending >= self.sync_every:
+            self.sync()
+
+        if self.snapshot_every and self._logged >= self.snapshot_every:
+            self.snapshot()
+
+        return True
+
+    def _unwrite(self, offset):
+        self._log.seek(offset)
+        self._log.truncate()
+
+    def _encode(self, operation, point, value=None):
+        payload = b""
+
+        if value is not None:
+            payload = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+        record = (
+            _LOG_RECORD.pack(
+                len(payload),
+                operation,
+                _int_flags(point.x, point.y),
+                point.x,
+                point.y,
+            )
+            + payload
+        )
+        return _LOG_CHECKSUM.pack(zlib.crc32(record)) + record
+
+    def sync(self):
+        """
+        Flushes the log to disk (with `fsync`).
+
+        Returns:
+            None: Nothing to see here. Please go about your business.
+        """
+        self._log.flush()
+        os.fsync(self._log.fileno())
+        self._pending = 0
+
+    def snapshot(self):
+        """
+        Writes the whole tree to a new snapshot & starts a new, empty log.
+
+        The old snapshot & log are removed once the new snapshot is safely
+        in place.
+
+        Returns:
+            None: Nothing to see here. Please go about your business.
+        """
+        old_generation = self.generation
+        old_log = self._log
+
+        if old_log is not None:
+            self.generation += 1
+
+        snapshot_path = self._snapshot_path(self.generation)
+        temp_path = snapshot_path + ".tmp"
+
+        try:
+            with open(temp_path, "wb") as snap_file:
+                self.tree.dump(snap_file)
+                snap_file.flush()
+                os.fsync(snap_file.fileno())
+
+            os.replace(temp_path, snapshot_path)
+        except BaseException:
+            # Carry on with the old snapshot & log, without leaving a
+            # partial snapshot behind.
+            self.generation = old_generation
+
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+            raise
+
+        self._sync_directory()
+        self._log = open(self._log_path(self.generation), "ab")
+        self._pending = 0
+        self._logged = 0
+
+        if old_log is not None:
+            old_log.close()
+            self._remove_generation(old_generation)
+
+    def _sync_directory(self):
+        # Makes the rename itself durable, where the platform allows it.
+        try:
+            dir_fd = os.open(self.path, os.O_RDONLY)
+        except OSError:  # pragma: no cover
+            return
+
+        try:
+            os.fsync(dir_fd)
+        except OSError:  # pragma: no cover
+            pass
+        finally:
+            os.close(dir_fd)
+
+    def close(self):
+        """
+        Syncs & closes the log.
+
+        Returns:
+            None: Nothing to see here. Please go about your business.
+        """
+        if self._log is not None and not self._log.closed:
+            self.sync()
+            self._log.close()
+
+    def insert(self, point, data=None):
+        """
+        Inserts a `Point` into the tree & logs it.
+
+        Args:
+            point (Point|tuple|None): The point to insert.
+            data (any): Optional. Corresponding data for that point. Default
+                is `None`.
+
+        Returns:
+            bool: `True` if insertion succeeded, otherwise `False`.
+        """
+        pnt = self.tree.convert_to_point(point)
+        return self._append(
+            _LOG_INSERT, pnt, data, lambda: self.tree.insert(pnt, data=data)
+        )
+
+    def remove(self, point):
+        """
+        Removes a `Point` from the tree & logs it.
+
+        Args:
+            point (Point|tuple|None): The point to remove.
+
+        Returns:
+            bool: `True` if a point was removed, otherwise `False`.
+        """
+        pnt = self.tree.convert_to_point(point)
+        return self._append(
+            _LOG_REMOVE, pnt, None, lambda: self.tree.remove(pnt)
+        )
+
+    def remove_by_key(self, key):
+        """
+        Removes a `Point` by the key of it's data & logs it.
+
+        Args:
+            key (any): The key, as returned by `key_func(point.data)`.
+
+        Returns:
+            bool: `True` if a point was removed, otherwise `False`.
+        """
+        return self._append(
+            _LOG_REMOVE_BY_KEY,
+            Point(0, 0),
+            key,
+            lambda: self.tree.remove_by_key(key),
+        )
+
+    def __contains__(self, point):
+        return point in self.tree
+
+    def __len__(self):
+        return len(self.tree)
+
+    def __iter__(self):
+        return iter(self.tree)
+
+    def find(self, point):
+        """
+        Searches for a `Point` within the tree. See `QuadTree.find`.
+
+        Queries don't touch the log, so for anything else, use the `tree`
+        attribute directly (but change it only through this object).
+
+        Args:
+            point (Point|tuple|None): The point to search for.
+
+        Returns:
+            Point|None: Returns the `Point` (including it's data) if found.
+                `None` if the point is not found.
+        """
+        return self.tree.find(point)
+
+    def within_bb(self, bb):
+        """
+        Finds all the points within a bounding box. See
+        `QuadTree.within_bb`.
+
+        Args:
+            bb (BoundingBox): The bounding box to search within.
+
+        Returns:
+            list: The matching `Point` objects.
+        """
+        return self.tree.within_bb(bb)
+
+    def nearest_neighbors(self, point, count=10):
+        """
+        Returns the nearest points of a given point. See
+        `QuadTree.nearest_neighbors`.
+
+        Args:
+            point (Point|BoundingBox): The desired location to search
+                around.
+            count (int): Optional. The number of neighbors to return. Default
+                is `10`.
+
+        Returns:
+            list: The nearest `Point` neighbors.
+        """
+        return self.tree.nearest_neighbors(point, count=count)
+
+
+class _BuildNode(object):
+    # A node of the tree being written by `build_file`. Until the node is
+    # known to be subdivided, `runs` holds `[key, x, y, start, count]` for
+    # each run of identical points within it (there are never more than
+    # `capacity + 1`). Once it's subdivided, `runs` is `None`.
+    def __init__(self, index, cell, depth, start):
+        self.index = index
+        self.cell = cell
+        self.depth = depth
+        self.start = start
+        self.count = 0
+        self.runs = []
+        self.children = [-1, -1, -1, -1]
+        self.child = None
+        self.child_code = None
+
+
+class _FileBuilder(object):
+    # Works out the nodes of a tree from it's points, streamed in Morton
+    # order, following the same subdivision rules as `QuadNode`. Nodes are
+    # numbered in pre-order as they're opened & their records are written
+    # (to `nodes_file`) once they're closed.
+    def __init__(self, nodes_file, capacity, max_depth):
+        self.nodes_file = nodes_file
+        self.capacity = capacity
+        self.max_depth = max_depth
+        self.node_count = 0
+
+    def open(self, cell, depth, start):
+        node = _BuildNode(self.node_count, cell, depth, start)
+        self.node_count += 1
+        return node
+
+    def push(self, node, run):
+        node.count += run[4]
+
+        if node.runs is None:
+            self.route(node, run)
+            return
+
+        if node.depth >= self.max_depth:
+            # These never subdivide, so there's no need to keep the runs.
+            return
+
+        runs = node.runs
+
+        if runs and runs[-1][1] == run[1] and runs[-1][2] == run[2]:
+            runs[-1][4] += run[4]
+        else:
+            runs.append(list(run))
+
+        # See `QuadNode.should_subdivide`.
+        if node.count > self.capacity and len(runs) > 1:
+            node.runs = None
+
+            for existing in runs:
+                self.route(node, existing)
+
+    def route(self, node, run):
+        code = (run[0] >> (2 * (self.max_depth - node.depth - 1))) & 3
+
+        if node.child is not None and node.child_code != code:
+            # The points are sorted, so nothing else lands in that child.
+            self.close(node.child)
+            node.child = None
+
+        if node.child is None:
+            node.child = self.open(
+                _child_cell(*node.cell, quadrant=_QUADRANTS[code]),
+                node.depth + 1,
+                run[3],
+            )
+            node.child_code = code
+            node.children[code] = node.child.index
+
+        self.push(node.child, run)
+
+    def close(self, node):
+        if node.child is not None:
+            self.close(node.child)
+            node.child = None
+
+        is_leaf = node.runs is not None
+        self.nodes_file.seek(node.index * _NODE.size)
+        self.nodes_file.write(
+            _NODE.pack(
+                *node.cell,
+                node.depth,
+                (0 if is_leaf else _NODE_SUBDIVIDED)
+                | _cell_int_flags(*node.cell) << _NODE_INT_SHIFT,
+                node.start,
+                node.count if is_leaf else 0,
+                node.count,
+                *node.children
+            )
+        )
+
+
+def build_file(
+    points,
+    path,
+    center,
+    width,
+    height,
+    capacity=None,
+    max_depth=None,
+    index=False,
+    chunk_size=1000000,
+    temp_dir=None,
+):
+    """
+    Builds a quadtree file (in the format written by `QuadTree.dump`)
+    from more points than fit in memory.
+
+    The points are read a chunk at a time. Each chunk is sorted by Morton
+    key (the quadrants each point routes through, relative to the tree's
+    extent) & written out as a run to a temporary file. The runs are then
+    merged, which puts the points in tree order, & the nodes are worked
+    out on the fly. Memory use depends on `chunk_size`, not on how many
+    points there are.
+
+    The result has the same nodes as inserting the points one at a time,
+    though the points within a leaf are ordered by their Morton keys. Open
+    it with `MappedQuadTree` (or `QuadTree.load` it, if it fits in memory).
+
+    Usage::
+
+        >>> import quads
+        >>> with open("places.csv", newline="") as csv_file:
+        ...     quads.build_file(
+        ...         quads.read_csv(csv_file),
+        ...         "places.qt",
+        ...         (0, 0),
+        ...         360,
+        ...         180,
+        ...     )
+        1000000000
+        >>> tree = quads.MappedQuadTree("places.qt")
+
+    Args:
+        points (iterable): The points to add, as `Point` objects or
+            `(x, y)` tuples/lists. The `data` on `Point` objects is kept.
+        path (str): Where to write the tree.
+        center (tuple|Point): The center point of the quadtree.
+        width (int|float): The width of the point space.
+        height (int|float): The height of the point space.
+        capacity (int): Optional. The number of points per quad before
+            subdivision occurs. Default is `None`, which defers to
+            `QuadNode.POINT_CAPACITY`.
+        max_depth (int): Optional. The deepest a node can be. Default is
+            `None`, which defers to `QuadNode.MAX_DEPTH`.
+        index (bool): Optional. Whether `QuadTree.load` should build the
+            coordinate index. Default is `False`.
+        chunk_size (int): Optional. How many points to sort in memory at
+            once. Default is `1000000`.
+        temp_dir (str): Optional. Where to put the temporary files (which
+            need about as much space as the result, twice over). Default is
+            `None`, the system's temporary directory.
+
+    Returns:
+        int: How many points were written.
+    """
+    if not isinstance(center, Point):
+        center = Point(center[0], center[1])
+
+    root = QuadNode(
+        center, width, height, capacity=capacity, max_depth=max_depth
+    )
+    key_size = (2 * root.max_depth + 7) // 8
+    points = iter(points)
+    point_count = 0
+
+    with tempfile.TemporaryDirectory(dir=temp_dir) as work_dir:
+        runs = []
+
+        while True:
+            chunk = []
+
+            for pnt in itertools.islice(points, chunk_size):
+                if not isinstance(pnt, Point):
+                    pnt = Point(pnt[0], pnt[1])
+
+                if not root.contains_point(pnt):
+                    raise ValueError(
+                        "Point {} is not within the tree ({}).".format(
+                            pnt, root.bounding_box
+                        )
+                    )
+
+                key = _morton_key(
+                    center.x,
+                    center.y,
+                    width,
+                    height,
+                    pnt.x,
+                    pnt.y,
+                    root.max_depth,
+                )
+                payload = b""
+
+                if pnt.data is not None:
+                    payload = pickle.dumps(pnt.data, pickle.HIGHEST_PROTOCOL)
+
+                chunk.append(
+                    (
+                        key.to_bytes(key_size, "big"),
+                        point_count,
+                        pnt.x,
+                        pnt.y,
+                        _int_flags(pnt.x, pnt.y),
+                        payload,
+                    )
+                )
+                point_count += 1
+
+            if not chunk:
+                break
+
+            # The input order is unique, so ties never compare further.
+            chunk.sort()
+            runs.append(os.path.join(work_dir, "run-{}".format(len(runs))))
+            _write_run(chunk, runs[-1])
+
+        passes = 0
+
+        while len(runs) > _MERGE_FAN_IN:
+            passes += 1
+            merged = []
+
+            for offset in range(0, len(runs), _MERGE_FAN_IN):
+                group = runs[offset:offset + _MERGE_FAN_IN]
+                merged.append(
+                    os.path.join(
+                        work_dir, "merge-{}-{}".format(passes, len(merged))
+                    )
+                )
+                _write_run(
+                    heapq.merge(*[_read_run(run, key_size) for run in group]),
+                    merged[-1],
+                )
+
+                for run in group:
+                    os.remove(run)
+
+            runs = merged
+
+        records = heapq.merge(*[_read_run(run, key_size) for run in runs])
+        _write_tree_file(records, path, work_dir, root, index, point_count)
+
+    return point_count
+
+
+def _write_tree_file(records, path, work_dir, root, index, point_count):
+    # Streams Morton-sorted records into the sections of the binary format
+    # (each in it's own temporary file), then joins them up behind a header.
+    sections = {}
+
+    for name in ("nodes", "xs", "ys", "kinds", "payload_index", "payloads"):
+        sections[name] = open(os.path.join(work_dir, name), "w+b")
+
+    try:
+        builder = _FileBuilder(
+            sections["nodes"], root.capacity, root.max_depth
+        )
+        top = builder.open(
+            (root.center.x, root.center.y, root.width, root.height), 0, 0
+        )
+        xs = array("d")
+        ys = array("d")
+        kinds = bytearray()
+        payload_index = array("q", [0])
+        payload_size = 0
+
+        def flush():
+            if sys.byteorder != "little":  # pragma: no cover
+                for values in (xs, ys, payload_index):
+                    values.byteswap()
+
+            sections["xs"].write(xs.tobytes())
+            sections["ys"].write(ys.tobytes())
+            sections["kinds"].write(kinds)
+            sections["payload_index"].write(payload_index.tobytes())
+            del xs[:], ys[:], kinds[:], payload_index[:]
+
+        for offset, (key, _, x, y, kind, payload) in enumerate(records):
+            builder.push(top, [int.from_bytes(key, "big"), x, y, offset, 1])
+            xs.append(x)
+            ys.append(y)
+            kinds.append(kind)
+            sections["payloads"].write(payload)
+            payload_size += len(payload)
+            payload_index.append(payload_size)
+
+            if len(xs) >= 65536:
+                flush()
+
+        builder.close(top)
+        padding = -point_count % 8
+        kinds.extend(bytes(padding))
+        flush()
+
+        nodes_offset = _HEADER.size
+        xs_offset = nodes_offset + _NODE.size * builder.node_count
+        ys_offset = xs_offset + 8 * point_count
+        kinds_offset = ys_offset + 8 * point_count
+        payload_index_offset = kinds_offset + point_count + padding
+        payload_offset = payload_index_offset + 8 * (point_count + 1)
+
+        with open(path, "wb") as tree_file:
+            tree_file.write(
+                _HEADER.pack(
+                    FORMAT_MAGIC,
+                    FORMAT_VERSION,
+                    _FLAG_INDEX if index else 0,
+                    0,
+                    root.capacity,
+                    root.max_depth,
+                    builder.node_count,
+                    point_count,
+                    nodes_offset,
+                    xs_offset,
+                    ys_offset,
+                    kinds_offset,
+                    payload_index_offset,
+                    payload_offset,
+                )
+            )
+
+            for name in (
+                "nodes",
+                "xs",
+                "ys",
+                "kinds",
+                "payload_index",
+                "payloads",
+            ):
+                sections[name].seek(0)
+                shutil.copyfileobj(sections[name], tree_file)
+    finally:
+        for section in sections.values():
+            section.close()
+
+
+class ReadWriteLock(object):
+    """
+    A lock that many readers can hold at once, or a single writer.
+
+    Waiting writers go first, so a steady stream of readers can't starve
+    them.
+
+    Usage::
+
+        >>> lock = quads.ReadWriteLock()
+        >>> with lock.reading():
+        ...     pass
+        >>> with lock.writing():
+        ...     pass
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writing = False
+        self._waiting_writers = 0
+
+    @contextlib.contextmanager
+    def reading(self):
+        """
+        Holds the lock for reading, within a `with` block.
+        """
+        with self._condition:
+            while self._writing or self._waiting_writers:
+                self._condition.wait()
+
+            self._readers += 1
+
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+
+                if not self._readers:
+                    self._condition.notify_all()
+
+    @contextlib.contextmanager
+    def writing(self):
+        """
+        Holds the lock for writing, within a `with` block.
+        """
+        with self._condition:
+            self._waiting_writers += 1
+
+            try:
+                while self._writing or self._readers:
+                    self._condition.wait()
+            finally:
+                self._waiting_writers -= 1
+
+            self._writing = True
+
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writing = False
+                self._condition.notify_all()
+
+
+class ConcurrentQuadTree(object):
+    """
+    A thread-safe quadtree.
+
+    The space is split into `4 ** lock_depth` partitions (the cells of the
+    nodes `lock_depth` levels down), each a `QuadTree` with it's own
+    `ReadWriteLock`. Changes only lock the partition they land in, so
+    writers in different partitions don't wait on each other, & any number
+    of readers can share a partition between writes.
+
+    Each call is consistent within a partition. Calls spanning partitions
+    (`within_bb`, `nearest_neighbors` & `len`) lock them one at a time, so
+    may see writes to one partition but not another. Iterating takes an
+    O(1) `QuadTree.snapshot` of every partition at once, so it sees a single
+    consistent state (& doesn't hold any locks while iterating).
+
+    Usage::
+
+        >>> import quads
+        >>> tree = quads.ConcurrentQuadTree((0, 0), 100, 100)
+        >>> tree.insert((1, 2))
+        True
+    """
+
+    tree_class = QuadTree
+
+    def __init__(
+        self,
+        center,
+        width,
+        height,
+        capacity=None,
+        max_depth=None,
+        index=False,
+        lock_depth=1,
+    ):
+        """
+        Constructs a `ConcurrentQuadTree` object.
+
+        Args:
+            center (tuple|Point): The center point of the quadtree.
+            width (int|float): The width of the point space.
+            height (int|float): The height of the point space.
+            capacity (int): Optional. The number of points per quad before
+                subdivision occurs. Default is `None`.
+            max_depth (int): Optional. The maximum depth of the tree (as a
+                whole). Default is `None`, which defers to
+                `QuadNode.MAX_DEPTH`.
+            index (bool): Optional. Whether each partition keeps a
+                coordinate index. See `QuadTree`. Default is `False`.
+            lock_depth (int): Optional. How many levels down to partition
+                (& lock) the tree. Default is `1` (the four quadrants).
+        """
+        if not isinstance(center, Point):
+            center = Point(center[0], center[1])
+
+        if max_depth is None:
+            max_depth = self.tree_class.node_class.MAX_DEPTH
+
+        if not 0 <= lock_depth <= max_depth:
+            raise ValueError("`lock_depth` must be between 0 & `max_depth`.")
+
+        self.center = center
+        self.width = width
+        self.height = height
+        self.lock_depth = lock_depth
+        self._bounds = QuadNode(center, width, height).bounding_box
+        self._partitions = []
+        self._locks = []
+        cells = _partition_cells(center.x, center.y, width, height, lock_depth)
+
+        for center_x, center_y, cell_width, cell_height in cells:
+            self._partitions.append(
+                self.tree_class(
+                    (center_x, center_y),
+                    cell_width,
+                    cell_height,
+                    capacity=capacity,
+                    max_depth=max_depth - lock_depth,
+                    index=index,
+                )
+            )
+            self._locks.append(ReadWriteLock())
+
+    def __repr__(self):
+        return "<ConcurrentQuadTree: ({}, {}) {}x{}>".format(
+            self.center.x, self.center.y, self.width, self.height
+        )
+
+    def _partition_of(self, point):
+        # The offset of the partition a point routes to.
+        return _morton_key(
+            self.center.x,
+            self.center.y,
+            self.width,
+            self.height,
+            point.x,
+            point.y,
+            self.lock_depth,
+        )
+
+    def convert_to_point(self, val):
+        """
+        Converts a value to a `Point` object. See
+        `QuadTree.convert_to_point`.
+
+        Args:
+            val (Point|tuple|None): The value to convert.
+
+        Returns:
+            Point: A point object.
+        """
+        return self._partitions[0].convert_to_point(val)
+
+    def insert(self, point, data=None):
+        """
+        Inserts a `Point` into the quadtree, locking only it's partition.
+
+        Args:
+            point (Point|tuple|None): The point to insert.
+            data (any): Optional. Corresponding data for that point. Default
+                is `None`.
+
+        Returns:
+            bool: `True` if insertion succeeded, otherwise `False`.
+        """
+        pnt = self.convert_to_point(point)
+
+        if not self._bounds.contains(pnt):
+            raise ValueError(
+                "Point {} is not within the tree ({}).".format(
+                    pnt, self._bounds
+                )
+            )
+
+        offset = self._partition_of(pnt)
+
+        with self._locks[offset].writing():
+            return self._partitions[offset].insert(pnt, data=data)
+
+    def remove(self, point):
+        """
+        Removes a `Point` from the quadtree, locking only it's partition.
+
+        Args:
+            point (Point|tuple|None): The point to remove.
+
+        Returns:
+            bool: `True` if a point was removed, otherwise `False`.
+        """
+        pnt = self.convert_to_point(point)
+
+        if not self._bounds.contains(pnt):
+            return False
+
+        offset = self._partition_of(pnt)
+
+        with self._locks[offset].writing():
+            return self._partitions[offset].remove(pnt)
+
+    def find(self, point):
+        """
+        Searches for a `Point` within the quadtree.
+
+        Args:
+            point (Point|tuple|None): The point to search for.
+
+        Returns:
+            Point|None: Returns the `Point` (including it's data) if found.
+                `None` if the point is not found.
+        """
+        pnt = self.convert_to_point(point)
+
+        if not self._bounds.contains(pnt):
+            return None
+
+        offset = self._partition_of(pnt)
+
+        with self._locks[offset].reading():
+            return self._partitions[offset].find(pnt)
+
+    def __contains__(self, point):
+        return self.find(point) is not None
+
+    def __len__(self):
+        count = 0
+
+        for lock, partition in zip(self._locks, self._partitions):
+            with lock.reading():
+                count += len(partition)
+
+        return count
+
+    def snapshot(self):
+        """
+        Takes a consistent, read-only `QuadTree.snapshot` of every
+        partition.
+
+        All the partitions are locked (in order) for as long as that takes,
+        which is O(1) per partition.
+
+        Returns:
+            list: The snapshots, one per partition.
+        """
+        with contextlib.ExitStack() as stack:
+            for lock in self._locks:
+                stack.enter_context(lock.writing())
+
+            return [partition.snapshot() for partition in self._partitions]
+
+    def __iter__(self):
+        """
+        Returns an iterator for all the points in the tree, as of when it
+        was called.
+
+        Returns:
+            iterator: An iterator of all the points.
+        """
+        return itertools.chain.from_iterable(self.snapshot())
+
+    def within_bb(self, bb):
+        """
+        Finds all the points within a bounding box, only reading (& locking)
+        the partitions it overlaps.
+
+        Args:
+            bb (BoundingBox): The bounding box to search within.
+
+        Returns:
+            list: The matching `Point` objects.
+        """
+        points = []
+
+        for lock, partition in zip(self._locks, self._partitions):
+            if not partition._root.bounding_box.intersects(bb):
+                continue
+
+            with lock.reading():
+                points.extend(partition.within_bb(bb))
+
+        return points
+
+    def nearest_neighbors(self, point, count=10):
+        """
+        Returns the nearest points of a given point, sorted by distance
+        (closest first).
+
+        Partitions are searched nearest first, skipping any that are
+        further away than the points found so far.
+
+        Args:
+            point (Point|BoundingBox): The desired location to search
+                around.
+            count (int): Optional. The number of neighbors to return. Default
+                is `10`.
+
+        Returns:
+            list: The nearest `Point` neighbors.
+        """
+        if isinstance(point, BoundingBox):
+            query = point
+        else:
+            pnt = self.convert_to_point(point)
+
+            if not self._bounds.contains(pnt):
+                return []
+
+            query = BoundingBox(pnt.x, pnt.y, pnt.x, pnt.y)
+
+        if count <= 0:
+            return []
+
+        ordered = sorted(
+            range(len(self._partitions)),
+            key=lambda offset: query.bb_compare(
+                self._partitions[offset]._root.bounding_box
+            ),
+        )
+        found = []
+
+        for offset in ordered:
+            partition = self._partitions[offset]
+            distance = query.bb_compare(partition._root.bounding_box)
+
+            if len(found) >= count and distance > found[count - 1][0]:
+                break
+
+            with self._locks[offset].reading():
+                nearest = partition.nearest_neighbors(query, count=count)
+
+            found.extend((query.point_compare(pnt), pnt) for pnt in nearest)
+            found.sort(key=lambda entry: entry[0])
+            del found[count:]
+
+        return [entry[1] for entry in found]
+
+
+class AsyncQuadTree(object):
+    """
+    An asyncio-friendly wrapper for querying a `QuadTree`, without blocking
+    the event loop.
+
+    Every query runs against an O(1) `QuadTree.snapshot`, so the tree can
+    keep changing (from the event loop) meanwhile. Changes are made on the
+    wrapped `tree` directly. Queries share one snapshot until the tree next
+    changes, so reads alone don't make it copy nodes on every write.
+
+    * `within_bb` & `nearest_neighbors` run in an executor (a thread pool,
+      by default).
+    * `iter_within_bb` & `async for` walk the tree on the event loop, but
+      hand control back to it every `yield_every` nodes. Points are
+      produced as they're found, so they can be streamed onward.
+
+    Usage::
+
+        >>> import asyncio
+        >>> import quads
+        >>> tree = quads.AsyncQuadTree(quads.QuadTree((0, 0), 100, 100))
+        >>> tree.tree.insert((1, 2))
+        True
+        >>> bb = quads.BoundingBox(0, 0, 5, 5)
+        >>> async def main():
+        ...     print(await tree.within_bb(bb))
+        ...     async for pnt in tree.iter_within_bb(bb):
+        ...         print(pnt)
+        >>> asyncio.run(main())
+        [<Point: (1, 2)>]
+        <Point: (1, 2)>
+    """
+
+    def __init__(self, tree, executor=None, yield_every=100):
+        """
+        Constructs an `AsyncQuadTree` object.
+
+        Args:
+            tree (QuadTree): The tree to query.
+            executor (concurrent.futures.Executor): Optional. Where to run
+                queries. Default is `None`, the event loop's default
+                executor.
+            yield_every (int): Optional. How many nodes to visit between
+                handing control back to the event loop, when iterating.
+                Default is `100`.
+        """
+        if yield_every < 1:
+            raise ValueError("`yield_every` must be at least 1.")
+
+        self.tree = tree
+        self.executor = executor
+        self.yield_every = yield_every
+        self._view = None
+
+    def __repr__(self):
+        return "<AsyncQuadTree: {!r}>".format(self.tree)
+
+    def _snapshot(self):
+        # Any change after a snapshot copies the tree's root (see
+        # `QuadTree._writable_path`), so the same root means the last
+        # snapshot is still current.
+        if self._view is None or self._view._root is not self.tree._root:
+            self._view = self.tree.snapshot()
+
+        return self._view
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def find(self, point):
+        """
+        Searches for a `Point` within the tree. See `QuadTree.find`.
+
+        Args:
+            point (Point|tuple|None): The point to search for.
+
+        Returns:
+            Point|None: Returns the `Point` (including it's data) if found.
+                `None` if the point is not found.
+        """
+        return await self._run(self._snapshot().find, point)
+
+    async def within_bb(self, bb):
+        """
+        Finds all the points within a bounding box, in the executor. See
+        `QuadTree.within_bb`.
+
+        Args:
+            bb (BoundingBox): The bounding box to search within.
+
+        Returns:
+            list: The matching `Point` objects.
+        """
+        return await self._run(self._snapshot().within_bb, bb)
+
+    async def nearest_neighbors(self, point, count=10):
+        """
+        Returns the nearest points of a given point, in the executor. See
+        `QuadTree.nearest_neighbors`.
+
+        Args:
+            point (Point|BoundingBox): The desired location to search
+                around.
+            count (int): Optional. The number of neighbors to return. Default
+                is `10`.
+
+        Returns:
+            list: The nearest `Point` neighbors.
+        """
+        return await self._run(
+            self._snapshot().nearest_neighbors, point, count
+        )
+
+    async def iter_within_bb(self, bb):
+        """
+        Iterates over the points within a bounding box, on the event loop,
+        yielding to it every `yield_every` nodes.
+
+        Args:
+            bb (BoundingBox): The bounding box to search within.
+
+        Returns:
+            async iterator: The matching `Point` objects, in the same order
+                as `QuadTree.within_bb`.
+        """
+        stack = [self._snapshot()._root]
+        visited = 0
+
+        while stack:
+            node = stack.pop()
+            visited += 1
+
+            if visited % self.yield_every == 0:
+                await asyncio.sleep(0)
+
+            if not node.bounding_box.intersects(bb):
+                continue
+
+            for pnt in node.points:
+                if bb.contains(pnt):
+                    yield pnt
+
+            for child in (node.lr, node.ll, node.ur, node.ul):
+                if child is not None:
+                    stack.append(child)
+
+    def __aiter__(self):
+        """
+        Iterates over all the points in the tree, on the event loop,
+        yielding to it every `yield_every` nodes.
+
+        Returns:
+            async iterator: All the `Point` objects.
+        """
+        return self._iter_all()
+
+    async def _iter_all(self):
+        stack = [self._snapshot()._root]
+        visited = 0
+
+        while stack:
+            node = stack.pop()
+            visited += 1
+
+            if visited % self.yield_every == 0:
+                await asyncio.sleep(0)
+
+            for pnt in node.points:
+                yield pnt
+
+            for child in (node.lr, node.ll, node.ur, node.ul):
+                if child is not None:
+                    stack.append(child)
+
+
+def _shard_worker(conn, tree_class, center, width, height, kwargs):
+    # Runs in each `ShardedQuadTree` process, answering calls on it's own
+    # tree until told to stop.
+    tree = tree_class(center, width, height, **kwargs)
+
+    while True:
+        name, args = conn.recv()
+
+        if name == "close":
+            conn.close()
+            return
+
+        try:
+            if name == "len":
+                result = len(tree)
+            else:
+                result = getattr(tree, name)(*args)
+        except Exception as exc:
+            conn.send(("error", exc))
+        else:
+            conn.send(("ok", result))
+
+
+class ShardedQuadTree(object):
+    """
+    A quadtree spread across several worker processes.
+
+    The space is split into `4 ** shard_depth` shards (the cells of the
+    nodes `shard_depth` levels down), each a `QuadTree` held by it's own
+    `multiprocessing` process. Inserts & removals go to the shard owning
+    the point. Queries only go to the shards they overlap, which all work
+    on them at once, & the results are merged here.
+
+    Everything sent to (or returned from) a shard is pickled, so point
+    data needs to be picklable. Calls aren't thread-safe. Call `close`
+    (or use it as a context manager) to stop the workers.
+
+    Usage::
+
+        >>> import quads
+        >>> with quads.ShardedQuadTree((0, 0), 100, 100) as tree:
+        ...     tree.insert_many(points)
+        ...     tree.within_bb(quads.BoundingBox(-5, -5, 5, 5))
+    """
+
+    tree_class = QuadTree
+
+    def __init__(
+        self,
+        center,
+        width,
+        height,
+        capacity=None,
+        max_depth=None,
+        index=False,
+        shard_depth=1,
+        context=None,
+    ):
+        """
+        Constructs a `ShardedQuadTree` object, starting the workers.
+
+        Args:
+            center (tuple|Point): The center point of the quadtree.
+            width (int|float): The width of the point space.
+            height (int|float): The height of the point space.
+            capacity (int): Optional. The number of points per quad before
+                subdivision occurs. Default is `None`.
+            max_depth (int): Optional. The maximum depth of the tree (as a
+                whole). Default is `None`, which defers to
+                `QuadNode.MAX_DEPTH`.
+            index (bool): Optional. Whether each shard keeps a coordinate
+                index. See `QuadTree`. Default is `False`.
+            shard_depth (int): Optional. How many levels down to split the
+                tree. Default is `1` (four shards, one per quadrant).
+            context (str|multiprocessing.context.BaseContext): Optional.
+                The `multiprocessing` start method (or context) to use.
+                Default is `None`, the platform's default.
+        """
+        if not isinstance(center, Point):
+            center = Point(center[0], center[1])
+
+        if max_depth is None:
+            max_depth = self.tree_class.node_class.MAX_DEPTH
+
+        if not 0 <= shard_depth <= max_depth:
+            raise ValueError("`shard_depth` must be between 0 & `max_depth`.")
+
+        if context is None or isinstance(context, str):
+            context = multiprocessing.get_context(context)
+
+        self.center = center
+        self.width = width
+        self.height = height
+        self.shard_depth = shard_depth
+        self._bounds = QuadNode(center, width, height).bounding_box
+        self._boxes = []
+        self._conns = []
+        self._processes = []
+        kwargs = {
+            "capacity": capacity,
+            "max_depth": max_depth - shard_depth,
+            "index": index,
+        }
+
+        for cell in _partition_cells(
+            center.x, center.y, width, height, shard_depth
+        ):
+            cell_center = Point(cell[0], cell[1])
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(
+                target=_shard_worker,
+                args=(
+                    child_conn,
+                    self.tree_class,
+                    cell_center,
+                    cell[2],
+                    cell[3],
+                    kwargs,
+                ),
+                daemon=True,
+            )
+            process.start()
+            child_conn.close()
+            self._boxes.append(
+                QuadNode(cell_center, cell[2], cell[3]).bounding_box
+            )
+            self._conns.append(parent_conn)
+            self._processes.append(process)
+
+    def __repr__(self):
+        return "<ShardedQuadTree: ({}, {}) {}x{}>".format(
+            self.center.x, self.center.y, self.width, self.height
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Stops the worker processes. Their points are gone afterward.
+
+        Returns:
+            None: Nothing to see here. Please go about your business.
+        """
+        for conn in self._conns:
+            if conn.closed:
+                continue
+
+            try:
+                conn.send(("close", ()))
+            except OSError:
+                # The worker has already gone away.
+                pass
+
+            conn.close()
+
+        for process in self._processes:
+            process.join()
+
+    def _call(self, offsets, name, *args):
+        # Sends the call to every shard first, so they all work at once,
+        # then collects the results (in the same order).
+        for offset in offsets:
+            self._conns[offset].send((name, args))
+
+        return self._gather(offsets)
+
+    def _gather(self, offsets):
+        # Collects a result from each shard, re-raising any error once
+        # they've all answered (so none are left out of step).
+        results = []
+        error = None
+
+        for offset in offsets:
+            status, result = self._conns[offset].recv()
+
+            if status == "error":
+                error = result
+
+            results.append(result)
+
+        if error is not None:
+            raise error
+
+        return results
+
+    def _shard_of(self, point):
+        return _morton_key(
+            self.center.x,
+            self.center.y,
+            self.width,
+            self.height,
+            point.x,
+            point.y,
+            self.shard_depth,
+        )
+
+    def convert_to_point(self, val):
+        """
+        Converts a value to a `Point` object. See
+        `QuadTree.convert_to_point`.
+
+        Args:
+            val (Point|tuple|None): The value to convert.
+
+        Returns:
+            Point: A point object.
+        """
+        return self.tree_class.convert_to_point(self, val)
+
+    @property
+    def point_class(self):
+        """
+        The class used for points, taken from `tree_class`.
+
+        Returns:
+            type: The point class.
+        """
+        return self.tree_class.point_class
+
+    def _check_bounds(self, pnt):
+        if not self._bounds.contains(pnt):
+            raise ValueError(
+                "Point {} is not within the tree ({}).".format(
+                    pnt, self._bounds
+                )
+            )
+
+    def insert(self, point, data=None):
+        """
+        Inserts a `Point` into the shard that owns it.
+
+        Args:
+            point (Point|tuple|None): The point to insert.
+            data (any): Optional. Corresponding data for that point. Default
+                is `None`.
+
+        Returns:
+            bool: `True` if insertion succeeded, otherwise `False`.
+        """
+        pnt = self.convert_to_point(point)
+        self._check_bounds(pnt)
+        return self._call([self._shard_of(pnt)], "insert", pnt, data)[0]
+
+    def insert_many(self, points, chunk_size=10000):
+        """
+        Inserts many points, a chunk at a time. Each chunk is split up by
+        shard & the shards insert their parts at the same time.
+
+        Args:
+            points (iterable): The points to insert, as `Point` objects or
+                `(x, y)` tuples/lists. The `data` on `Point` objects is kept.
+            chunk_size (int): Optional. How many points to read at a time.
+                Default is `10000`.
+
+        Returns:
+            int: How many points were inserted.
+        """
+        points = iter(points)
+        inserted = 0
+
+        while True:
+            batches = {}
+
+            for pnt in itertools.islice(points, chunk_size):
+                pnt = self.convert_to_point(pnt)
+                self._check_bounds(pnt)
+                batches.setdefault(self._shard_of(pnt), []).append(pnt)
+
+            if not batches:
+                return inserted
+
+            offsets = sorted(batches)
+
+            for offset in offsets:
+                self._conns[offset].send(("insert_many", (batches[offset],)))
+
+            inserted += sum(self._gather(offsets))
+
+    def remove(self, point):
+        """
+        Removes a `Point` from the shard that owns it.
+
+        Args:
+            point (Point|tuple|None): The point to remove.
+
+        Returns:
+            bool: `True` if a point was removed, otherwise `False`.
+        """
+        pnt = self.convert_to_point(point)
+
+        if not self._bounds.contains(pnt):
+            return False
+
+        return self._call([self._shard_of(pnt)], "remove", pnt)[0]
+
+    def find(self, point):
+        """
+        Searches for a `Point` in the shard that would own it.
+
+        Args:
+            point (Point|tuple|None): The point to search for.
+
+        Returns:
+            Point|None: Returns the `Point` (including it's data) if found.
+                `None` if the point is not found.
+        """
+        pnt = self.convert_to_point(point)
+
+        if not self._bounds.contains(pnt):
+            return None
+
+        return self._call([self._shard_of(pnt)], "find", pnt)[0]
+
+    def __contains__(self, point):
+        return self.find(point) is not None
+
+    def __len__(self):
+        return sum(self._call(range(len(self._conns)), "len"))
+
+    def within_bb(self, bb):
+        """
+        Finds all the points within a bounding box, asking only the shards
+        it overlaps (all at once).
+
+        Args:
+            bb (BoundingBox): The bounding box to search within.
+
+        Returns:
+            list: The matching `Point` objects, shard by shard.
+        """
+        offsets = [
+            offset
+            for offset, box in enumerate(self._boxes)
+            if box.intersects(bb)
+        ]
+        points = []
+
+        for found in self._call(offsets, "within_bb", bb):
+            points.extend(found)
+
+        return points
+
+    def nearest_neighbors(self, point, count=10):
+        """
+        Returns the nearest points of a given point, sorted by distance
+        (closest first).
+
+        The nearest shard is asked first. Then only the shards that could
+        hold anything closer than what it found are asked (all at once).
+
+        Args:
+            point (Point|BoundingBox): The desired location to search
+                around.
+            count (int): Optional. The number of neighbors to return. Default
+                is `10`.
+
+        Returns:
+            list: The nearest `Point` neighbors.
+        """
+        if isinstance(point, BoundingBox):
+            query = point
+        else:
+            pnt = self.convert_to_point(point)
+
+            if not self._bounds.contains(pnt):
+                return []
+
+            query = BoundingBox(pnt.x, pnt.y, pnt.x, pnt.y)
+
+        if count <= 0:
+            return []
+
+        distances = [query.bb_compare(box) for box in self._boxes]
+        ordered = sorted(range(len(self._boxes)), key=distances.__getitem__)
+        found = self._call(ordered[:1], "nearest_neighbors", query, count)[0]
+        limit = None
+
+        if len(found) >= count:
+            limit = query.point_compare(found[-1])
+
+        offsets = [
+            offset
+            for offset in ordered[1:]
+            if limit is None or distances[offset] <= limit
+        ]
+
+        for nearest in self._call(offsets, "nearest_neighbors", query, count):
+            found.extend(nearest)
+
+        found.sort(key=query.point_compare)
+        return found[:count]
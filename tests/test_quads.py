@@ -1,12 +1,34 @@
+import asyncio
+import io
+import math
+import os
+import pickle
+import shutil
+import tempfile
+import threading
 import unittest
 
 from quads import (
+    Aggregate,
     euclidean_compare,
     euclidean_distance,
     Point,
     BoundingBox,
     QuadNode,
     QuadTree,
+    CompressedQuadNode,
+    CompressedQuadTree,
+    MappedQuadTree,
+    DurableQuadTree,
+    read_csv,
+    read_geojson,
+    write_csv,
+    write_geojson,
+    build_file,
+    ConcurrentQuadTree,
+    ReadWriteLock,
+    AsyncQuadTree,
+    ShardedQuadTree,
 )
 
 from . import test_data
@@ -91,6 +113,26 @@ class BoundingBoxTestCase(unittest.TestCase):
         self.assertFalse(bb.contains(pnt_2))
         self.assertTrue(bb.contains(pnt_3))
 
+    def test_contains_bb(self):
+        bb = BoundingBox(-10, -13, 10, 20)
+        self.assertTrue(bb.contains_bb(BoundingBox(-10, -13, 10, 20)))
+        self.assertTrue(bb.contains_bb(BoundingBox(-5, 0, 5, 5)))
+        self.assertFalse(bb.contains_bb(BoundingBox(-5, 0, 15, 5)))
+        self.assertFalse(bb.contains_bb(BoundingBox(-50, -50, 50, 50)))
+
+    def test_point_compare(self):
+        bb = BoundingBox(-10, -13, 10, 20)
+        self.assertEqual(bb.point_compare(Point(0, 0)), 0)
+        self.assertEqual(bb.point_compare(Point(10, 20)), 0)
+        self.assertEqual(bb.point_compare(Point(13, 0)), 9)
+        self.assertEqual(bb.point_compare(Point(-13, 24)), 25)
+
+    def test_bb_compare(self):
+        bb = BoundingBox(-10, -13, 10, 20)
+        self.assertEqual(bb.bb_compare(BoundingBox(0, 0, 30, 40)), 0)
+        self.assertEqual(bb.bb_compare(BoundingBox(13, 0, 30, 40)), 9)
+        self.assertEqual(bb.bb_compare(BoundingBox(-30, -40, -13, -17)), 25)
+
     def test_intersects(self):
         bb_1 = BoundingBox(-10, -13, 10, 20)
         bb_2 = BoundingBox(0, 0, 30, 40)
@@ -237,11 +279,12 @@ class QuadNodeTestCase(unittest.TestCase):
 
         node.subdivide()
 
-        # There should now be child nodes.
+        # There should now be child nodes, but only where points landed.
+        self.assertTrue(node.subdivided)
         self.assertIsNotNone(node.ul)
         self.assertIsNotNone(node.ur)
         self.assertIsNotNone(node.ll)
-        self.assertIsNotNone(node.lr)
+        self.assertIsNone(node.lr)
 
         # Check the points.
         self.assertEqual(len(node.points), 0)
@@ -269,8 +312,9 @@ class QuadNodeTestCase(unittest.TestCase):
         # Over the edge, automatically subdivide before the insert happens.
         node.insert(Point(8, 8))
         self.assertEqual(len(node.points), 0)
-        self.assertIsNotNone(node.ul)
-        self.assertEqual(len(node.ul.points), 0)
+        self.assertTrue(node.subdivided)
+        # Nothing landed in the upper-left, so it was never created.
+        self.assertIsNone(node.ul)
         self.assertIsNotNone(node.ur)
         self.assertEqual(len(node.ur.points), 3)
         self.assertIsNotNone(node.ll)
@@ -278,12 +322,101 @@ class QuadNodeTestCase(unittest.TestCase):
         self.assertIsNotNone(node.lr)
         self.assertEqual(len(node.lr.points), 1)
 
+    def test_insert_lazy_children(self):
+        node = QuadNode(Point(0, 0), 20, 20)
+
+        for i in range(20):
+            node.insert(Point(1 + i / 10, 1 + i / 10))
+
+        # Everything is clustered in the upper-right.
+        self.assertIsNone(node.ul)
+        self.assertIsNone(node.ll)
+        self.assertIsNone(node.lr)
+        self.assertEqual(len(node), 20)
+        self.assertEqual(len(node.within_bb(BoundingBox(0, 0, 5, 5))), 20)
+        self.assertEqual(len(node.within_bb(BoundingBox(-5, -5, 0.5, 5))), 0)
+        self.assertIsNone(node.find(Point(-5, -5)))
+
+        node.insert(Point(-5, -5))
+        self.assertIsNotNone(node.ll)
+        self.assertEqual(node.find(Point(-5, -5)), Point(-5, -5))
+
+    def test_quadrant(self):
+        node = QuadNode(Point(1, 2), 10, 10)
+        self.assertEqual(node.quadrant(Point(0, 2)), "ul")
+        self.assertEqual(node.quadrant(Point(1, 2)), "ur")
+        self.assertEqual(node.quadrant(Point(0, 1)), "ll")
+        self.assertEqual(node.quadrant(Point(1, 1)), "lr")
+
     def test_insert_fail(self):
         node = QuadNode(Point(0, 0), 20, 20)
 
         with self.assertRaises(ValueError):
             node.insert(Point(17, 55))
 
+    def test_remove(self):
+        node = QuadNode(Point(0, 0), 20, 20)
+        node.insert(Point(7, 5, data="dog"))
+        node.insert(Point(6, 4, data="cat"))
+        node.insert(Point(7, 5, data="again"))
+        node.insert(Point(-1, -2))
+        node.insert(Point(9, -9))
+
+        self.assertTrue(node.remove(Point(7, 5)))
+        self.assertEqual(len(node), 4)
+        self.assertEqual(node.find(Point(7, 5)).data, "again")
+
+        self.assertTrue(node.remove(Point(7, 5)))
+        self.assertIsNone(node.find(Point(7, 5)))
+
+        # Misses.
+        self.assertFalse(node.remove(Point(7, 5)))
+        self.assertFalse(node.remove(Point(250, 350)))
+
+    def test_insert_duplicates(self):
+        node = QuadNode(Point(0, 0), 20, 20)
+
+        for i in range(100):
+            node.insert(Point(3, 3, data=i))
+
+        # All identical, so there's no subdividing at all.
+        self.assertIsNone(node.ul)
+        self.assertEqual(len(node.points), 100)
+
+        # A different point splits the bucket, which stays together.
+        node.insert(Point(-3, -3))
+        self.assertEqual(len(node), 101)
+        self.assertEqual(len(node.ur.points), 100)
+        self.assertEqual(len(node.ll.points), 1)
+        self.assertEqual(node.find(Point(3, 3)).data, 0)
+
+    def test_insert_max_depth(self):
+        node = QuadNode(Point(0, 0), 20, 20, max_depth=3)
+        self.assertEqual(node.max_depth, 3)
+        self.assertEqual(node.depth, 0)
+
+        for i in range(50):
+            node.insert(Point(1 + i / 1000, 1))
+
+        self.assertEqual(len(node), 50)
+        found, searched = node.find_node(Point(1, 1))
+        self.assertEqual(len(searched), 4)
+        self.assertEqual(found.depth, 3)
+        self.assertEqual(len(found.points), 50)
+
+    def test_should_subdivide(self):
+        node = QuadNode(Point(0, 0), 20, 20, capacity=2)
+        node.points = [Point(1, 1), Point(1, 1)]
+        self.assertFalse(node.should_subdivide(Point(1, 1)))
+        self.assertTrue(node.should_subdivide(Point(2, 1)))
+
+        node.points = [Point(1, 1)]
+        self.assertFalse(node.should_subdivide(Point(2, 1)))
+
+        node = QuadNode(Point(0, 0), 20, 20, capacity=2, max_depth=0)
+        node.points = [Point(1, 1), Point(2, 2)]
+        self.assertFalse(node.should_subdivide(Point(3, 3)))
+
     def test_insert_ll(self):
         # Without this, a lower-left insert fails to be seen on coverage,
         # which is weird. Ensure that happens & things look right.
@@ -489,6 +622,31 @@ class QuadTreeTestCase(unittest.TestCase):
         self.assertEqual(tree.height, 10)
         self.assertEqual(tree.center, Point(0, 0))
 
+    def test_set_extent(self):
+        tree = QuadTree((0, 0), 10, 10, index=True)
+        tree.insert((1, 2), data="Samus")
+        tree.insert((-3, 4), data="Link")
+        snapshot = tree.snapshot()
+
+        tree.width = 100
+        tree.height = 80
+        tree.center = (20, 20)
+        self.assertEqual(str(tree), "<QuadTree: (20, 20) 100x80>")
+        self.assertTrue(tree._root.contains_point(Point(65, 55)))
+        self.assertEqual(len(tree), 2)
+        self.assertEqual(tree.find((1, 2)).data, "Samus")
+        self.assertEqual(tree.find((-3, 4)).data, "Link")
+        self.assertTrue(tree.insert((65, 55)))
+
+        # A point that wouldn't fit leaves the tree as it was.
+        with self.assertRaises(ValueError):
+            tree.width = 10
+
+        self.assertEqual(tree.width, 100)
+        self.assertEqual(len(tree), 3)
+        self.assertEqual(str(snapshot), "<QuadTree: (0, 0) 10x10>")
+        self.assertEqual(len(snapshot), 2)
+
     def test_str(self):
         tree = QuadTree((0, 0), 10, 10)
         self.assertEqual(str(tree), "<QuadTree: (0, 0) 10x10>")
@@ -737,3 +895,2181 @@ class QuadTreeTestCase(unittest.TestCase):
             count += 1
 
         self.assertEqual(count, 1000)
+
+    def test_insert_duplicates(self):
+        tree = QuadTree((0, 0), 20, 20, max_depth=5)
+
+        for i in range(2000):
+            tree.insert((1.5, -2.5), data=i)
+
+        tree.insert((1.5000001, -2.5))
+        self.assertEqual(len(tree), 2001)
+        self.assertEqual(tree.find((1.5, -2.5)).data, 0)
+
+    def test_remove(self):
+        tree = self.create_sample_tree()
+        self.assertTrue(tree.remove((10, 35)))
+        self.assertEqual(len(tree), 11)
+        self.assertIsNone(tree.find((10, 35)))
+        self.assertFalse(tree.remove((10, 35)))
+
+
+class IndexedQuadTreeTestCase(unittest.TestCase):
+    def create_sample_tree(self):
+        tree = QuadTree((0, 0), 100, 100, index=True)
+
+        for x, y in test_data.data.get("large_random", []):
+            tree.insert((x, y), data=(x, y))
+
+        return tree
+
+    def test_find(self):
+        tree = self.create_sample_tree()
+        plain = QuadTree((0, 0), 100, 100)
+
+        for x, y in test_data.data.get("large_random", []):
+            plain.insert((x, y), data=(x, y))
+
+        for x in range(-50, 51, 3):
+            for y in range(-50, 51, 3):
+                expected = plain.find((x, y))
+                found = tree.find((x, y))
+
+                if expected is None:
+                    self.assertIsNone(found)
+                else:
+                    self.assertEqual(found.data, expected.data)
+
+                self.assertEqual((x, y) in tree, expected is not None)
+                self.assertEqual(Point(x, y) in tree, expected is not None)
+
+    def test_remove_duplicates(self):
+        tree = QuadTree((0, 0), 20, 20, index=True)
+        tree.insert((1, 2), data="first")
+        tree.insert((1, 2), data="second")
+        self.assertEqual(tree.find((1, 2)).data, "first")
+
+        self.assertTrue(tree.remove((1, 2)))
+        self.assertEqual(tree.find((1, 2)).data, "second")
+
+        self.assertTrue(tree.remove(Point(1, 2)))
+        self.assertIsNone(tree.find((1, 2)))
+        self.assertFalse((1, 2) in tree)
+        self.assertFalse(tree.remove((1, 2)))
+
+
+class KeyedQuadTreeTestCase(unittest.TestCase):
+    def create_sample_tree(self, **kwargs):
+        tree = QuadTree(
+            (0, 0), 100, 100, key_func=lambda data: data["id"], **kwargs
+        )
+
+        for offset, (x, y) in enumerate(test_data.data["large_random"]):
+            tree.insert((x, y), data={"id": offset})
+
+        return tree
+
+    def test_get_by_key(self):
+        tree = self.create_sample_tree()
+
+        for offset, (x, y) in enumerate(test_data.data["large_random"]):
+            pnt = tree.get_by_key(offset)
+            self.assertEqual((pnt.x, pnt.y), (x, y))
+            self.assertEqual(pnt.data["id"], offset)
+
+        self.assertIsNone(tree.get_by_key(-1))
+
+    def test_duplicate_key(self):
+        tree = self.create_sample_tree()
+
+        with self.assertRaises(ValueError):
+            tree.insert((1, 1), data={"id": 5})
+
+    def test_no_key_index(self):
+        tree = QuadTree((0, 0), 10, 10)
+
+        with self.assertRaises(ValueError):
+            tree.get_by_key(1)
+
+    def test_remove_by_key(self):
+        tree = self.create_sample_tree(index=True)
+        data = test_data.data["large_random"]
+
+        for offset in range(0, len(data), 2):
+            self.assertTrue(tree.remove_by_key(offset))
+
+        self.assertFalse(tree.remove_by_key(0))
+        self.assertEqual(len(tree), len(data) // 2)
+        ids = sorted(pnt.data["id"] for pnt in tree)
+        self.assertEqual(ids, list(range(1, len(data), 2)))
+
+        # The coordinate index should agree with the tree.
+        for pnt in tree:
+            self.assertIsNotNone(tree.find(pnt))
+
+    def test_remove_by_coords(self):
+        tree = self.create_sample_tree()
+        x, y = test_data.data["large_random"][3]
+        found = tree.find((x, y))
+        self.assertTrue(tree.remove((x, y)))
+        self.assertIsNone(tree.get_by_key(found.data["id"]))
+
+
+def count_nodes(node):
+    count = 1
+
+    for child in (node.ul, node.ur, node.ll, node.lr):
+        if child is not None:
+            count += count_nodes(child)
+
+    return count
+
+
+class CompressedQuadTreeTestCase(unittest.TestCase):
+    def create_cluster(self, tree_class, size=2 ** 20):
+        tree = tree_class((0, 0), size, size)
+
+        for offset, (x, y) in enumerate(test_data.data["large_random"]):
+            # Squash everything into a tiny region far from the center.
+            tree.insert((1000 + x / 10000, -5000 + y / 10000), data=offset)
+
+        return tree
+
+    def test_node_class(self):
+        tree = CompressedQuadTree((0, 0), 10, 10)
+        self.assertIsInstance(tree._root, CompressedQuadNode)
+
+    def test_fewer_nodes(self):
+        plain = self.create_cluster(QuadTree)
+        compressed = self.create_cluster(CompressedQuadTree)
+        self.assertEqual(len(plain), len(compressed))
+        self.assertLess(count_nodes(compressed._root), count_nodes(plain._root))
+
+        # The search path to any point is much shorter.
+        pnt = Point(1000 + 3 / 10000, -5000 + 7 / 10000)
+        _, plain_searched = plain._root.find_node(pnt)
+        _, searched = compressed._root.find_node(pnt)
+        self.assertLess(len(searched) + 10, len(plain_searched))
+
+    def test_matches_plain(self):
+        plain = self.create_cluster(QuadTree)
+        compressed = self.create_cluster(CompressedQuadTree)
+
+        for x, y in test_data.data["large_random"][:200]:
+            coords = (1000 + x / 10000, -5000 + y / 10000)
+            self.assertEqual(
+                compressed.find(coords).data, plain.find(coords).data
+            )
+            self.assertIsNone(compressed.find((coords[0] + 1e-7, coords[1])))
+
+        bb = BoundingBox(1000 - 0.002, -5000 - 0.001, 1000 + 0.003, -5000)
+        self.assertEqual(
+            sorted(pnt.data for pnt in compressed.within_bb(bb)),
+            sorted(pnt.data for pnt in plain.within_bb(bb)),
+        )
+
+        center = (1000, -5000)
+        self.assertEqual(
+            [euclidean_compare(Point(*center), pnt) for pnt in
+             compressed.nearest_neighbors(center, count=15)],
+            [euclidean_compare(Point(*center), pnt) for pnt in
+             plain.nearest_neighbors(center, count=15)],
+        )
+
+    def test_spread_out(self):
+        tree = CompressedQuadTree((0, 0), 100, 100)
+
+        for x, y in test_data.data["large_random"]:
+            tree.insert((x, y), data=(x, y))
+
+        self.assertEqual(len(tree), 1000)
+
+        for x, y in test_data.data["large_random"]:
+            self.assertEqual(tree.find((x, y)), Point(x, y))
+
+        self.assertTrue(tree.remove(tuple(test_data.data["large_random"][0])))
+        self.assertEqual(len(tree), 999)
+
+
+class ExpandingQuadTreeTestCase(unittest.TestCase):
+    def test_fixed_by_default(self):
+        tree = QuadTree((0, 0), 10, 10)
+
+        with self.assertRaises(ValueError):
+            tree.insert((20, 20))
+
+    def test_expand(self):
+        tree = QuadTree((0, 0), 10, 10, auto_expand=True)
+        tree.insert((1, 2), data="inside")
+        old_root = tree._root
+
+        self.assertTrue(tree.insert((12, -3), data="right"))
+        self.assertEqual(tree.center, Point(5, 5))
+        self.assertEqual(tree.width, 20)
+        self.assertEqual(tree.height, 20)
+        self.assertEqual(str(tree), "<QuadTree: (5.0, 5.0) 20x20>")
+        # The old root is kept, rather than rebuilt.
+        self.assertIs(tree._root.ll, old_root)
+        self.assertEqual(tree._root.depth, -1)
+
+        # Several doublings at once, the other way.
+        self.assertTrue(tree.insert((-150, 75), data="far"))
+        self.assertTrue(tree._root.contains_point(Point(-150, 75)))
+        self.assertEqual(len(tree), 3)
+        self.assertEqual(tree.find((1, 2)).data, "inside")
+        self.assertEqual(tree.find((12, -3)).data, "right")
+        self.assertEqual(tree.find((-150, 75)).data, "far")
+        self.assertEqual(
+            [pnt.data for pnt in tree.nearest_neighbors((0, 0), count=3)],
+            ["inside", "right", "far"],
+        )
+
+    def test_expand_many(self):
+        tree = QuadTree((0, 0), 1, 1, auto_expand=True)
+
+        for x, y in test_data.data["large_random"]:
+            tree.insert((x, y))
+
+        self.assertEqual(len(tree), 1000)
+
+        for x, y in test_data.data["large_random"]:
+            self.assertTrue((x, y) in tree)
+
+        bb = BoundingBox(-20, -20, 20, 20)
+        self.assertEqual(
+            len(tree.within_bb(bb)),
+            len([
+                pnt for pnt in test_data.data["large_random"]
+                if bb.contains(Point(*pnt))
+            ]),
+        )
+
+    def test_expand_edges(self):
+        # Points on the old root's top/right edges land on the new root's
+        # split lines, so they have to be moved over when expanding.
+        for tree_class in (QuadTree, CompressedQuadTree):
+            tree = tree_class((0, 0), 10, 10, auto_expand=True)
+            tree.insert((5, 0), data="right edge")
+            tree.insert((0, 5), data="top edge")
+            tree.insert((5, 5), data="corner")
+            tree.insert((1, 2), data="inside")
+            snapshot = tree.snapshot()
+
+            self.assertTrue(tree.insert((12, -3)))
+            self.assertEqual(len(tree), 5)
+            self.assertEqual(tree._root.count, 5)
+            self.assertEqual(tree.find((5, 0)).data, "right edge")
+            self.assertEqual(tree.find((0, 5)).data, "top edge")
+            self.assertEqual(tree.find((5, 5)).data, "corner")
+            self.assertEqual(tree.find((1, 2)).data, "inside")
+            self.assertEqual(len(tree.within_bb(tree._root.bounding_box)), 5)
+
+            self.assertTrue(tree.remove((0, 5)))
+            self.assertFalse((0, 5) in tree)
+            self.assertEqual(len(tree), 4)
+
+            # The snapshot still has the pre-expansion layout.
+            self.assertEqual(len(snapshot), 4)
+            self.assertEqual(snapshot.find((5, 0)).data, "right edge")
+            self.assertEqual(snapshot.find((0, 5)).data, "top edge")
+
+        tree = QuadTree((0, 0), 1, 1, auto_expand=True)
+        points = [(0.5, 0.25), (8, 4.75), (32, 4.75), (-40, 70)]
+        self.assertEqual(tree.insert_many(points), 4)
+        self.assertEqual(len(tree), 4)
+
+        for pnt in points:
+            self.assertTrue(pnt in tree)
+
+    def test_expand_invalid(self):
+        tree = QuadTree((0, 0), 10, 10, auto_expand=True)
+
+        with self.assertRaises(ValueError):
+            tree.insert((float("inf"), 0))
+
+    def test_expand_compressed(self):
+        tree = CompressedQuadTree((0, 0), 1, 1, auto_expand=True)
+
+        for x, y in test_data.data["large_random"]:
+            tree.insert((x, y))
+
+        self.assertEqual(len(tree), 1000)
+
+        for x, y in test_data.data["large_random"]:
+            self.assertTrue((x, y) in tree)
+
+
+class FromPointsTestCase(unittest.TestCase):
+    def test_from_points(self):
+        points = [tuple(pnt) for pnt in test_data.data["large_random"]]
+        points.append(Point(60, -70, data="Samus"))
+        tree = QuadTree.from_points(points)
+
+        self.assertEqual(len(tree), 1001)
+        self.assertIn(tree._root.capacity, QuadTree.CAPACITY_CANDIDATES)
+        self.assertEqual(tree.find((60, -70)).data, "Samus")
+
+        for pnt in points:
+            self.assertTrue(pnt in tree)
+
+        # A tight square around the data.
+        self.assertAlmostEqual(tree.width, 119, places=5)
+        self.assertAlmostEqual(tree.height, 119, places=5)
+        self.assertEqual(tree.center, Point(5.5, -10.5))
+
+    def test_from_points_options(self):
+        tree = QuadTree.from_points(
+            [(1, 1), (2, 2)], capacity=7, max_depth=3, index=True
+        )
+        self.assertEqual(tree._root.capacity, 7)
+        self.assertEqual(tree._root.max_depth, 3)
+        self.assertIsNotNone(tree._index)
+
+        tree = CompressedQuadTree.from_points([(5, 5)] * 3)
+        self.assertIsInstance(tree, CompressedQuadTree)
+        self.assertEqual(len(tree), 3)
+
+    def test_from_points_far_cluster(self):
+        # A tight cluster far from the origin, where float rounding on the
+        # bounds outweighs the spread of the points.
+        points = [
+            (-3880502.782152603, 2500000.0000140416),
+            (-3880502.7819815977, 2500000.0003988235),
+            (-3880502.7818764574, 2500000.000668153),
+            (-3880502.7827001596, 2500000.0004935777),
+            (-3880502.7818336994, 2500000.000243911),
+        ]
+        tree = QuadTree.from_points(points)
+        self.assertEqual(len(tree), 5)
+
+        for pnt in points:
+            self.assertTrue(pnt in tree)
+
+    def test_from_points_empty(self):
+        tree = QuadTree.from_points([])
+        self.assertEqual(len(tree), 0)
+        self.assertEqual(tree.width, 1)
+
+    def test_estimate_capacity(self):
+        points = [Point(x, y) for x, y in test_data.data["large_random"]]
+        capacity = QuadTree.estimate_capacity(points, Point(0, 0), 100, 100)
+        self.assertIn(capacity, QuadTree.CAPACITY_CANDIDATES)
+
+        # If stepping through nodes were free, deep trees would win.
+        class CheapNodes(QuadTree):
+            NODE_COST = 0
+
+        capacity = CheapNodes.estimate_capacity(
+            points, Point(0, 0), 100, 100
+        )
+        self.assertEqual(capacity, 4)
+
+
+class AggregateQuadTreeTestCase(unittest.TestCase):
+    boxes = [
+        BoundingBox(-20, -20, 20, 20),
+        BoundingBox(-50, -50, 50, 50),
+        BoundingBox(3, -41, 17.5, 8),
+        BoundingBox(60, 60, 70, 70),
+    ]
+
+    def create_sample_tree(self, tree_class=QuadTree, **kwargs):
+        tree = tree_class((0, 0), 100, 100, **kwargs)
+        tree.register_aggregate("count", Aggregate.count())
+        tree.register_aggregate("sum", Aggregate.sum(lambda data: data))
+        tree.register_aggregate("min", Aggregate.min(lambda data: data))
+        tree.register_aggregate("max", Aggregate.max(lambda data: data))
+        tree.register_aggregate("mean", Aggregate.mean(lambda data: data))
+
+        for x, y in test_data.data["large_random"]:
+            tree.insert((x, y), data=x * 3 - y)
+
+        return tree
+
+    def assert_matches(self, tree):
+        for bb in self.boxes:
+            values = [pnt.data for pnt in tree if bb.contains(pnt)]
+
+            if not values:
+                for name in ("count", "sum", "min", "max", "mean"):
+                    self.assertIsNone(tree.aggregate_within_bb(bb, name))
+
+                continue
+
+            self.assertEqual(tree.aggregate_within_bb(bb, "count"), len(values))
+            self.assertEqual(tree.aggregate_within_bb(bb, "sum"), sum(values))
+            self.assertEqual(tree.aggregate_within_bb(bb, "min"), min(values))
+            self.assertEqual(tree.aggregate_within_bb(bb, "max"), max(values))
+            self.assertAlmostEqual(
+                tree.aggregate_within_bb(bb, "mean"),
+                sum(values) / len(values),
+            )
+
+    def test_aggregate_within_bb(self):
+        tree = self.create_sample_tree()
+        self.assertEqual(tree._root.aggregate_values["count"], 1000)
+        self.assert_matches(tree)
+
+        with self.assertRaises(ValueError):
+            tree.aggregate_within_bb(self.boxes[0], "nope")
+
+    def test_register_late(self):
+        tree = QuadTree((0, 0), 100, 100)
+
+        for x, y in test_data.data["large_random"]:
+            tree.insert((x, y), data=x * 3 - y)
+
+        tree.register_aggregate("count", Aggregate.count())
+        tree.register_aggregate("sum", Aggregate.sum(lambda data: data))
+        tree.register_aggregate("min", Aggregate.min(lambda data: data))
+        tree.register_aggregate("max", Aggregate.max(lambda data: data))
+        tree.register_aggregate("mean", Aggregate.mean(lambda data: data))
+        self.assert_matches(tree)
+
+    def test_remove(self):
+        tree = self.create_sample_tree()
+
+        for x, y in test_data.data["large_random"][:300]:
+            tree.remove((x, y))
+
+        self.assertEqual(tree._root.aggregate_values["count"], len(tree))
+        self.assert_matches(tree)
+
+        # Removing at the node level keeps them up to date too.
+        for x, y in test_data.data["large_random"][300:400]:
+            tree._root.remove(Point(x, y))
+
+        self.assert_matches(tree)
+
+    def test_variants(self):
+        self.assert_matches(self.create_sample_tree(CompressedQuadTree))
+
+        tree = QuadTree((0, 0), 1, 1, auto_expand=True)
+        tree.register_aggregate("count", Aggregate.count())
+
+        for x, y in test_data.data["large_random"]:
+            tree.insert((x, y))
+
+        self.assertEqual(
+            tree.aggregate_within_bb(self.boxes[0], "count"),
+            len(tree.within_bb(self.boxes[0])),
+        )
+
+
+class DensityGridTestCase(unittest.TestCase):
+    def brute_force(self, points, bb, rows, cols):
+        grid = [[0] * cols for _ in range(rows)]
+
+        for pnt in points:
+            if not bb.contains(pnt):
+                continue
+
+            col = min(int((pnt.x - bb.min_x) // (bb.width / cols)), cols - 1)
+            row = min(int((bb.max_y - pnt.y) // (bb.height / rows)), rows - 1)
+            grid[row][col] += 1
+
+        return grid
+
+    def test_density_grid(self):
+        tree = QuadTree((0, 0), 100, 100)
+
+        for x, y in test_data.data["large_random"]:
+            tree.insert((x, y))
+
+        self.assertEqual(tree._root.count, 1000)
+
+        for bb, rows, cols in [
+            (BoundingBox(-50, -50, 50, 50), 4, 4),
+            (BoundingBox(-50, -50, 50, 50), 7, 3),
+            (BoundingBox(-12.5, -30, 40, 20), 10, 10),
+            (BoundingBox(-100, -100, 100, 100), 1, 1),
+        ]:
+            grid = tree.density_grid(bb, rows, cols)
+            self.assertEqual(grid, self.brute_force(tree, bb, rows, cols))
+
+        self.assertEqual(
+            sum(map(sum, tree.density_grid(BoundingBox(-50, -50, 50, 50), 5, 5))),
+            1000,
+        )
+
+    def test_density_grid_after_remove(self):
+        tree = QuadTree((0, 0), 100, 100)
+
+        for x, y in test_data.data["large_random"]:
+            tree.insert((x, y))
+
+        for x, y in test_data.data["large_random"][::3]:
+            tree.remove((x, y))
+
+        self.assertEqual(tree._root.count, len(tree))
+        bb = BoundingBox(-50, -50, 50, 50)
+        self.assertEqual(
+            tree.density_grid(bb, 6, 6), self.brute_force(tree, bb, 6, 6)
+        )
+
+    def test_density_grid_small(self):
+        tree = QuadTree((0, 0), 20, 20)
+        tree.insert((-5, 5))
+        tree.insert((-6, 6))
+        tree.insert((5, -5))
+        grid = tree.density_grid(BoundingBox(-10, -10, 10, 10), 2, 2)
+        self.assertEqual(grid, [[2, 0], [0, 1]])
+
+    def test_density_grid_array(self):
+        try:
+            import numpy
+        except ImportError:
+            self.skipTest("numpy is not installed")
+
+        tree = QuadTree((0, 0), 20, 20)
+        tree.insert((-5, 5))
+        grid = tree.density_grid(BoundingBox(-10, -10, 10, 10), 2, 2, True)
+        self.assertIsInstance(grid, numpy.ndarray)
+        self.assertEqual(grid.tolist(), [[1, 0], [0, 0]])
+
+    def test_density_grid_empty_grid(self):
+        tree = QuadTree((0, 0), 20, 20)
+        tree.insert((-5, 5))
+        bb = BoundingBox(-10, -10, 10, 10)
+
+        with self.assertRaises(ValueError):
+            tree.density_grid(bb, 0, 2)
+
+        with self.assertRaises(ValueError):
+            tree.density_grid(bb, 2, 0)
+
+
+class ClusterTestCase(unittest.TestCase):
+    def create_sample_tree(self):
+        tree = QuadTree((0, 0), 100, 100)
+
+        for x, y in test_data.data["large_random"]:
+            tree.insert((x, y))
+
+        return tree
+
+    def test_centroid(self):
+        node = QuadNode(Point(0, 0), 20, 20)
+        self.assertIsNone(node.centroid())
+        node.insert(Point(1, 2))
+        node.insert(Point(3, -4))
+        self.assertEqual(node.centroid(), Point(2, -1))
+
+        node.remove(Point(3, -4))
+        self.assertEqual(node.centroid(), Point(1, 2))
+
+    def test_clusters(self):
+        tree = self.create_sample_tree()
+        clusters = tree.clusters(0, resolution=1)
+
+        # At most one item per quadrant of the root.
+        self.assertEqual(len(clusters), 4)
+        self.assertEqual(sum(clst.count for clst in clusters), 1000)
+
+        root = tree._root
+
+        for clst, node in zip(clusters, [root.ul, root.ur, root.ll, root.lr]):
+            points = list(node)
+            self.assertEqual(clst.count, len(points))
+            self.assertAlmostEqual(
+                clst.x, sum(pnt.x for pnt in points) / len(points)
+            )
+            self.assertAlmostEqual(
+                clst.y, sum(pnt.y for pnt in points) / len(points)
+            )
+
+        # Zooming in gives more, smaller clusters.
+        self.assertGreater(len(tree.clusters(2)), len(clusters))
+
+        # Deep enough, there's nothing left to cluster.
+        points = tree.clusters(30)
+        self.assertEqual(len(points), 1000)
+        self.assertTrue(all(isinstance(pnt, Point) for pnt in points))
+
+    def test_clusters_bb(self):
+        tree = self.create_sample_tree()
+        bb = BoundingBox(1, 1, 49, 49)
+        clusters = tree.clusters(1, bb=bb, resolution=0)
+        self.assertEqual(len(clusters), 1)
+        self.assertEqual(str(clusters[0])[:10], "<Cluster: ")
+        self.assertEqual(
+            clusters[0].count, len(tree.within_bb(BoundingBox(0, 0, 50, 50)))
+        )
+
+    def test_clusters_sparse(self):
+        tree = QuadTree((0, 0), 100, 100)
+        tree.insert((1, 2))
+        tree.insert((-30, 4))
+
+        # A leaf above the cluster depth comes back as raw points.
+        self.assertEqual(tree.clusters(3), [Point(1, 2), Point(-30, 4)])
+
+
+    def test_clusters_expanded(self):
+        tree = QuadTree((0, 0), 100, 100, auto_expand=True)
+
+        for x, y in test_data.data["large_random"]:
+            tree.insert((x, y))
+
+        before = tree.clusters(1, resolution=1)
+        tree.insert((150, 150))
+        self.assertEqual(tree._root.depth, -1)
+
+        # Zoom levels still line up with the original extent.
+        after = tree.clusters(1, resolution=1)
+        self.assertEqual(after[0], Point(150, 150))
+        self.assertEqual(
+            [(clst.count, clst.bounding_box.width) for clst in after[1:]],
+            [(clst.count, clst.bounding_box.width) for clst in before],
+        )
+        self.assertEqual({clst.bounding_box.width for clst in before}, {25})
+
+        # The grown level is zoom `-1`.
+        clusters = tree.clusters(-1, resolution=0)
+        self.assertEqual(len(clusters), 1)
+        self.assertEqual(clusters[0].count, 1001)
+        self.assertEqual(clusters[0].bounding_box.width, 200)
+
+
+class SampleTestCase(unittest.TestCase):
+    def create_sample_tree(self):
+        tree = QuadTree((0, 0), 100, 100)
+
+        for offset, (x, y) in enumerate(test_data.data["large_random"]):
+            tree.insert((x, y), data=offset)
+
+        return tree
+
+    def test_sample_within_bb(self):
+        tree = self.create_sample_tree()
+        bb = BoundingBox(-40, -30, 35, 45)
+        within = {pnt.data for pnt in tree.within_bb(bb)}
+
+        sample = tree.sample_within_bb(bb, 20, seed=42)
+        self.assertEqual(len(sample), 20)
+        self.assertEqual(len({pnt.data for pnt in sample}), 20)
+        self.assertTrue({pnt.data for pnt in sample} <= within)
+
+        # Repeatable with a seed.
+        again = tree.sample_within_bb(bb, 20, seed=42)
+        self.assertEqual([pnt.data for pnt in sample], [pnt.data for pnt in again])
+
+    def test_sample_small_region(self):
+        tree = self.create_sample_tree()
+        bb = BoundingBox(10, 10, 14, 14)
+        within = {pnt.data for pnt in tree.within_bb(bb)}
+
+        sample = tree.sample_within_bb(bb, 1000, seed=1)
+        self.assertEqual({pnt.data for pnt in sample}, within)
+        self.assertEqual(len(sample), len(within))
+
+        self.assertEqual(
+            tree.sample_within_bb(BoundingBox(200, 200, 300, 300), 5), []
+        )
+
+    def test_sample_uniform(self):
+        tree = self.create_sample_tree()
+        bb = BoundingBox(-50, -50, 0, 50)
+        within = {pnt.data for pnt in tree.within_bb(bb)}
+        hits = dict.fromkeys(within, 0)
+
+        for seed in range(400):
+            for pnt in tree.sample_within_bb(bb, 5, seed=seed):
+                hits[pnt.data] += 1
+
+        # 2000 draws over ~500 points. Every point should turn up, & none
+        # wildly more than the others.
+        expected = 2000 / len(within)
+        self.assertLess(max(hits.values()), expected * 4)
+        self.assertGreater(
+            len([hit for hit in hits.values() if hit]), len(within) * 0.9
+        )
+
+
+class TopKTestCase(unittest.TestCase):
+    def create_sample_tree(self):
+        tree = QuadTree((0, 0), 100, 100)
+        tree.register_aggregate(
+            "priority", Aggregate.max(lambda data: data["priority"])
+        )
+
+        for offset, (x, y) in enumerate(test_data.data["large_random"]):
+            tree.insert((x, y), data={"id": offset, "priority": (x * y) % 97})
+
+        return tree
+
+    def test_top_k_within_bb(self):
+        tree = self.create_sample_tree()
+
+        for bb in [
+            BoundingBox(-50, -50, 50, 50),
+            BoundingBox(-20, -33, 14, 8.5),
+            BoundingBox(30, 30, 32, 32),
+        ]:
+            expected = sorted(
+                (pnt.data["priority"] for pnt in tree.within_bb(bb)),
+                reverse=True,
+            )[:25]
+            found = tree.top_k_within_bb(bb, 25, "priority")
+            self.assertEqual([pnt.data["priority"] for pnt in found], expected)
+
+            for pnt in found:
+                self.assertTrue(bb.contains(pnt))
+
+    def test_top_k_after_remove(self):
+        tree = self.create_sample_tree()
+        bb = BoundingBox(-50, -50, 50, 50)
+        top = tree.top_k_within_bb(bb, 1, "priority")[0]
+        tree.remove(top)
+
+        expected = max(pnt.data["priority"] for pnt in tree)
+        found = tree.top_k_within_bb(bb, 1, "priority")
+        self.assertEqual(found[0].data["priority"], expected)
+
+    def test_top_k_needs_max(self):
+        tree = self.create_sample_tree()
+        tree.register_aggregate("total", Aggregate.sum(lambda data: 1))
+        bb = BoundingBox(-50, -50, 50, 50)
+
+        with self.assertRaises(ValueError):
+            tree.top_k_within_bb(bb, 5, "total")
+
+        with self.assertRaises(ValueError):
+            tree.top_k_within_bb(bb, 5, "nope")
+
+    def test_top_k_empty(self):
+        tree = QuadTree((0, 0), 10, 10)
+        tree.register_aggregate("priority", Aggregate.max(lambda data: data))
+        bb = BoundingBox(-5, -5, 5, 5)
+        self.assertEqual(tree.top_k_within_bb(bb, 5, "priority"), [])
+
+    def test_top_k_no_k(self):
+        tree = self.create_sample_tree()
+        bb = BoundingBox(-50, -50, 50, 50)
+        self.assertEqual(tree.top_k_within_bb(bb, 0, "priority"), [])
+        self.assertEqual(tree.top_k_within_bb(bb, -3, "priority"), [])
+
+
+class WithinBBManyTestCase(unittest.TestCase):
+    def test_within_bb_many(self):
+        tree = QuadTree((0, 0), 100, 100)
+
+        for x, y in test_data.data["large_random"]:
+            tree.insert((x, y))
+
+        boxes = [
+            BoundingBox(-50, -50, 50, 50),
+            BoundingBox(-20, -20, 20, 20),
+            BoundingBox(3.5, -41, 17, 8),
+            BoundingBox(60, 60, 70, 70),
+        ]
+
+        # A grid of "tiles", too.
+        for x in range(-50, 50, 25):
+            for y in range(-50, 50, 25):
+                boxes.append(BoundingBox(x, y, x + 25, y + 25))
+
+        results = tree.within_bb_many(boxes)
+        self.assertEqual(len(results), len(boxes))
+
+        for bb, points in zip(boxes, results):
+            expected = tree.within_bb(bb)
+            self.assertEqual(
+                [(pnt.x, pnt.y) for pnt in points],
+                [(pnt.x, pnt.y) for pnt in expected],
+            )
+
+        self.assertEqual(tree.within_bb_many([]), [])
+
+
+class SegmentRayTestCase(unittest.TestCase):
+    def create_sample_tree(self):
+        tree = QuadTree((0, 0), 100, 100)
+
+        for x, y in test_data.data["large_random"]:
+            tree.insert((x, y))
+
+        return tree
+
+    def distance_to_segment(self, pnt, p0, p1):
+        dx, dy = p1[0] - p0[0], p1[1] - p0[1]
+        t = ((pnt.x - p0[0]) * dx + (pnt.y - p0[1]) * dy) / (dx * dx + dy * dy)
+        t = max(0, min(1, t))
+        return euclidean_distance(pnt, Point(p0[0] + t * dx, p0[1] + t * dy))
+
+    def test_within_segment(self):
+        tree = self.create_sample_tree()
+
+        for p0, p1, width in [
+            ((-40, -40), (40, 30), 3),
+            ((-45, 10), (45, 10), 0.5),
+            ((10, -50), (10, 50), 0),
+            ((20, 20), (25, 22), 12),
+        ]:
+            found = tree.within_segment(p0, p1, width)
+            expected = [
+                pnt for pnt in tree
+                if self.distance_to_segment(pnt, p0, p1) <= width + 1e-9
+            ]
+            self.assertEqual(
+                sorted((pnt.x, pnt.y) for pnt in found),
+                sorted((pnt.x, pnt.y) for pnt in expected),
+            )
+
+        # A degenerate segment is just a circle.
+        found = tree.within_segment((5, 5), (5, 5), 4)
+        self.assertEqual(
+            sorted((pnt.x, pnt.y) for pnt in found),
+            sorted(
+                (pnt.x, pnt.y) for pnt in tree
+                if euclidean_distance(pnt, Point(5, 5)) <= 4
+            ),
+        )
+
+    def test_ray_cast(self):
+        tree = QuadTree((0, 0), 20, 20)
+        tree.insert((3, 3), data="first")
+        tree.insert((6, 6), data="second")
+        tree.insert((-2, -2), data="behind")
+        tree.insert((5, 0), data="off")
+
+        self.assertEqual(tree.ray_cast((0, 0), (1, 1)).data, "first")
+        self.assertEqual(tree.ray_cast((4, 4), (2, 2)).data, "second")
+        self.assertEqual(tree.ray_cast((0, 0), (-1, -1)).data, "behind")
+        self.assertIsNone(tree.ray_cast((0, 0), (0, 1)))
+        self.assertEqual(tree.ray_cast((0, 0), (1, 0)).data, "off")
+        self.assertEqual(tree.ray_cast((0, 0.5), (1, 0), width=1).data, "off")
+        self.assertIsNone(tree.ray_cast((0, 0.5), (1, 0), width=0.4))
+
+        with self.assertRaises(ValueError):
+            tree.ray_cast((0, 0), (0, 0))
+
+    def test_ray_cast_large(self):
+        tree = self.create_sample_tree()
+
+        for origin, direction, width in [
+            ((0, 0), (1, 0.3), 1),
+            ((-50, -50), (1, 1), 0.5),
+            ((30, -10), (-2, 1), 2),
+        ]:
+            length = math.sqrt(direction[0] ** 2 + direction[1] ** 2)
+            dx, dy = direction[0] / length, direction[1] / length
+            best = None
+
+            for pnt in tree:
+                t = max(0, (pnt.x - origin[0]) * dx + (pnt.y - origin[1]) * dy)
+                ray_pnt = Point(origin[0] + t * dx, origin[1] + t * dy)
+
+                if euclidean_distance(pnt, ray_pnt) <= width:
+                    if best is None or t < best[0]:
+                        best = (t, pnt)
+
+            hit = tree.ray_cast(origin, direction, width=width)
+            self.assertEqual(hit, best[1])
+
+
+class NearestToBBTestCase(unittest.TestCase):
+    def test_nearest_to_bb(self):
+        tree = QuadTree((0, 0), 100, 100)
+
+        for x, y in test_data.data["large_random"]:
+            tree.insert((x, y))
+
+        for bb, count in [
+            (BoundingBox(-3, -3, 4, 2), 10),
+            (BoundingBox(10, 10, 10.5, 10.5), 25),
+            (BoundingBox(60, -10, 80, 10), 5),
+            (BoundingBox(-5, -5, 5, 5), 1001),
+        ]:
+            found = tree.nearest_neighbors(bb, count=count)
+            expected = sorted(tree, key=bb.point_compare)[:count]
+            self.assertEqual(
+                [bb.point_compare(pnt) for pnt in found],
+                [bb.point_compare(pnt) for pnt in expected],
+            )
+
+    def test_nearest_to_bb_inside_first(self):
+        tree = QuadTree((0, 0), 20, 20)
+        tree.insert((1, 2), data="inside")
+        tree.insert((8, 8), data="far")
+        tree.insert((4, 0), data="near")
+
+        found = tree.nearest_neighbors(BoundingBox(0, 0, 2, 3), count=2)
+        self.assertEqual([pnt.data for pnt in found], ["inside", "near"])
+
+        self.assertEqual(
+            QuadTree((0, 0), 20, 20).nearest_neighbors(BoundingBox(0, 0, 1, 1)),
+            [],
+        )
+
+    def test_nearest_to_bb_no_count(self):
+        tree = QuadTree((0, 0), 20, 20)
+        tree.insert((1, 2))
+        bb = BoundingBox(0, 0, 2, 3)
+
+        self.assertEqual(tree.nearest_neighbors(bb, count=0), [])
+        self.assertEqual(tree.nearest_neighbors(bb, count=-1), [])
+
+
+class SerializationTestCase(unittest.TestCase):
+    def create_sample_tree(self, tree_class=QuadTree, **kwargs):
+        tree = tree_class((0, 0), 100, 100, **kwargs)
+
+        for offset, (x, y) in enumerate(test_data.data["large_random"]):
+            data = None if offset % 3 else {"id": offset, "name": str(offset)}
+            tree.insert((x, y), data=data)
+
+        tree.insert((0.25, -0.5), data=[1, 2, 3])
+        return tree
+
+    def roundtrip(self, tree, **kwargs):
+        buffer = io.BytesIO()
+        tree.dump(buffer)
+        buffer.seek(0)
+        return tree.__class__.load(buffer, **kwargs)
+
+    def assert_same(self, tree, loaded):
+        self.assertEqual(str(loaded), str(tree))
+        self.assertEqual(len(loaded), len(tree))
+        self.assertEqual(
+            [(pnt.x, pnt.y, pnt.data) for pnt in loaded],
+            [(pnt.x, pnt.y, pnt.data) for pnt in tree],
+        )
+        self.assertEqual(count_nodes(loaded._root), count_nodes(tree._root))
+        self.assertEqual(loaded._root.count, tree._root.count)
+        self.assertAlmostEqual(loaded._root.sum_x, tree._root.sum_x)
+        self.assertEqual(loaded.find((0.25, -0.5)).data, [1, 2, 3])
+        self.assertEqual(
+            [(type(pnt.x), type(pnt.y)) for pnt in loaded],
+            [(type(pnt.x), type(pnt.y)) for pnt in tree],
+        )
+
+        bb = BoundingBox(-20, -20, 20, 20)
+        self.assertEqual(loaded.within_bb(bb), tree.within_bb(bb))
+        self.assertEqual(
+            loaded.nearest_neighbors((5, 5)), tree.nearest_neighbors((5, 5))
+        )
+
+    def test_dump_load(self):
+        tree = self.create_sample_tree()
+        loaded = self.roundtrip(tree)
+        self.assert_same(tree, loaded)
+
+        # Still fully usable.
+        self.assertTrue(loaded.insert((49, 49)))
+        self.assertTrue(loaded.remove((49, 49)))
+
+    def test_dump_load_options(self):
+        tree = self.create_sample_tree(
+            capacity=7, max_depth=5, index=True, auto_expand=True
+        )
+        loaded = self.roundtrip(
+            tree, aggregates={"count": Aggregate.count()}
+        )
+        self.assert_same(tree, loaded)
+        self.assertEqual(loaded._root.capacity, 7)
+        self.assertEqual(loaded._root.max_depth, 5)
+        self.assertIsNotNone(loaded._index)
+        self.assertTrue(loaded.auto_expand)
+        self.assertEqual(
+            loaded.aggregate_within_bb(BoundingBox(-50, -50, 50, 50), "count"),
+            1001,
+        )
+
+        tree = QuadTree((0, 0), 100, 100, key_func=lambda data: data)
+        tree.insert((1, 2), data="a")
+        tree.insert((3, 4), data="b")
+        loaded = self.roundtrip(tree, key_func=lambda data: data)
+        self.assertEqual(loaded.get_by_key("b"), Point(3, 4))
+
+    def test_dump_load_compressed(self):
+        tree = self.create_sample_tree(CompressedQuadTree)
+        self.assert_same(tree, self.roundtrip(tree))
+
+        buffer = io.BytesIO()
+        tree.dump(buffer)
+        buffer.seek(0)
+
+        with self.assertRaises(ValueError):
+            QuadTree.load(buffer)
+
+    def test_load_bad_data(self):
+        with self.assertRaises(ValueError):
+            QuadTree.load(io.BytesIO(b"nope"))
+
+        with self.assertRaises(ValueError):
+            QuadTree.load(io.BytesIO(b"x" * 200))
+
+        buffer = io.BytesIO()
+        QuadTree((0, 0), 10, 10).dump(buffer)
+        data = bytearray(buffer.getvalue())
+        data[8] = 99
+
+        with self.assertRaises(ValueError):
+            QuadTree.load(io.BytesIO(bytes(data)))
+
+    def test_empty(self):
+        tree = QuadTree((3, 4), 10, 20)
+        loaded = self.roundtrip(tree)
+        self.assertEqual(str(loaded), "<QuadTree: (3, 4) 10x20>")
+        self.assertEqual(len(loaded), 0)
+
+    def test_pickle(self):
+        tree = self.create_sample_tree(index=True)
+        loaded = pickle.loads(pickle.dumps(tree))
+        self.assert_same(tree, loaded)
+        self.assertIsNotNone(loaded._index)
+
+        # Smaller than pickling all the objects would be.
+        self.assertLess(
+            len(pickle.dumps(tree)), len(pickle.dumps(tree._root))
+        )
+
+
+class MappedQuadTreeTestCase(unittest.TestCase):
+    def setUp(self):
+        super(MappedQuadTreeTestCase, self).setUp()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, "tree.qt")
+        self.tree = QuadTree((0, 0), 100, 100)
+
+        for offset, (x, y) in enumerate(test_data.data["large_random"]):
+            data = None if offset % 3 else {"id": offset}
+            self.tree.insert((x, y), data=data)
+
+        self.tree.insert((0.25, -0.5), data="Samus")
+
+        with open(self.path, "wb") as dump_file:
+            self.tree.dump(dump_file)
+
+        self.mapped = MappedQuadTree(self.path)
+
+    def tearDown(self):
+        self.mapped.close()
+        shutil.rmtree(self.tmp_dir)
+        super(MappedQuadTreeTestCase, self).tearDown()
+
+    def test_init(self):
+        self.assertEqual(str(self.mapped), "<MappedQuadTree: (0, 0) 100x100>")
+        self.assertEqual(len(self.mapped), len(self.tree))
+        self.assertEqual(
+            [(pnt.x, pnt.y, pnt.data) for pnt in self.mapped],
+            [(pnt.x, pnt.y, pnt.data) for pnt in self.tree],
+        )
+
+    def test_find(self):
+        for pnt in self.tree:
+            found = self.mapped.find(pnt)
+            self.assertEqual(found, pnt)
+            self.assertEqual(found.data, self.tree.find(pnt).data)
+
+        self.assertEqual(self.mapped.find((0.25, -0.5)).data, "Samus")
+        self.assertIsNone(self.mapped.find((0.25, -0.75)))
+        self.assertIsNone(self.mapped.find((500, 500)))
+        self.assertTrue((0.25, -0.5) in self.mapped)
+        self.assertFalse((0.25, -0.75) in self.mapped)
+
+    def test_within_bb(self):
+        for bb in (
+            BoundingBox(-20, -20, 20, 20),
+            BoundingBox(0, 0, 50, 50),
+            BoundingBox(-100, -100, 100, 100),
+            BoundingBox(60, 60, 70, 70),
+        ):
+            self.assertEqual(
+                [
+                    (pnt.x, pnt.y, pnt.data)
+                    for pnt in self.mapped.within_bb(bb)
+                ],
+                [(pnt.x, pnt.y, pnt.data) for pnt in self.tree.within_bb(bb)],
+            )
+
+    def test_nearest_neighbors(self):
+        for point in ((5, 5), (-49, 49), (0.25, -0.5)):
+            expected = sorted(
+                self.tree,
+                key=lambda pnt: euclidean_compare(Point(*point), pnt),
+            )[:10]
+            found = self.mapped.nearest_neighbors(point)
+            self.assertEqual(
+                [euclidean_compare(Point(*point), pnt) for pnt in found],
+                [euclidean_compare(Point(*point), pnt) for pnt in expected],
+            )
+
+        self.assertEqual(self.mapped.nearest_neighbors((500, 500)), [])
+        self.assertEqual(
+            len(self.mapped.nearest_neighbors((0, 0), count=2000)), 1001
+        )
+
+        bb = BoundingBox(-5, -5, 5, 5)
+        self.assertEqual(
+            self.mapped.nearest_neighbors(bb, count=5),
+            self.tree.nearest_neighbors(bb, count=5),
+        )
+        self.assertEqual(self.mapped.nearest_neighbors(bb, count=0), [])
+        self.assertEqual(self.mapped.nearest_neighbors((5, 5), count=0), [])
+
+    def test_compressed(self):
+        tree = CompressedQuadTree((0, 0), 2 ** 20, 2 ** 20)
+
+        for x, y in test_data.data["large_random"]:
+            tree.insert((x / 1000, y / 1000))
+
+        # A separate file, since `self.path` is still mapped.
+        path = os.path.join(self.tmp_dir, "compressed.qt")
+
+        with open(path, "wb") as dump_file:
+            tree.dump(dump_file)
+
+        with MappedQuadTree(path) as mapped:
+            for pnt in tree:
+                self.assertEqual(mapped.find(pnt), pnt)
+
+            bb = BoundingBox(-0.01, -0.01, 0.01, 0.01)
+            self.assertEqual(mapped.within_bb(bb), tree.within_bb(bb))
+
+    def test_not_a_tree(self):
+        path = os.path.join(self.tmp_dir, "junk.qt")
+
+        with open(path, "wb") as dump_file:
+            dump_file.write(b"x" * 200)
+
+        with self.assertRaises(ValueError):
+            MappedQuadTree(path)
+
+
+class DurableQuadTreeTestCase(unittest.TestCase):
+    def setUp(self):
+        super(DurableQuadTreeTestCase, self).setUp()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, "places")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+        super(DurableQuadTreeTestCase, self).tearDown()
+
+    def points(self, tree):
+        return [(pnt.x, pnt.y, pnt.data) for pnt in tree]
+
+    def test_init(self):
+        with self.assertRaises(ValueError):
+            DurableQuadTree(self.path)
+
+        tree = DurableQuadTree(self.path, tree=QuadTree((0, 0), 10, 10))
+        self.assertEqual(len(tree), 0)
+        self.assertEqual(
+            sorted(os.listdir(self.path)), ["log-0.log", "snapshot-0.qt"]
+        )
+        tree.close()
+
+    def test_recover(self):
+        tree = DurableQuadTree(
+            self.path, tree=QuadTree((0, 0), 100, 100), sync_every=10
+        )
+
+        for offset, (x, y) in enumerate(test_data.data["large_random"]):
+            tree.insert((x, y), data={"id": offset})
+
+        tree.insert((0.25, -0.5), data="Samus")
+        self.assertTrue(tree.remove((0.25, -0.5)))
+        self.assertFalse(tree.remove((0.25, -0.5)))
+        expected = self.points(tree)
+        tree.close()
+
+        recovered = DurableQuadTree(self.path)
+        self.assertEqual(self.points(recovered), expected)
+        self.assertIsNone(recovered.find((0.25, -0.5)))
+
+        # Still logging.
+        recovered.insert((1, 2), data="Link")
+        recovered.close()
+
+        recovered = DurableQuadTree(self.path)
+        self.assertEqual(recovered.find((1, 2)).data, "Link")
+        self.assertEqual(type(recovered.find((1, 2)).x), int)
+        recovered.close()
+
+    def test_torn_log(self):
+        tree = DurableQuadTree(self.path, tree=QuadTree((0, 0), 10, 10))
+        tree.insert((1, 2), data="Samus")
+        tree.insert((3, 4), data="Link")
+        tree.close()
+
+        log_path = os.path.join(self.path, "log-0.log")
+
+        with open(log_path, "rb") as log_file:
+            data = log_file.read()
+
+        # Half of the last record made it to disk.
+        with open(log_path, "wb") as log_file:
+            log_file.write(data[: len(data) - 5])
+
+        recovered = DurableQuadTree(self.path)
+        self.assertEqual(self.points(recovered), [(1, 2, "Samus")])
+        recovered.insert((4, 4))
+        recovered.close()
+
+        recovered = DurableQuadTree(self.path)
+        self.assertEqual(
+            self.points(recovered), [(1, 2, "Samus"), (4, 4, None)]
+        )
+        recovered.close()
+
+    def test_snapshot(self):
+        tree = DurableQuadTree(
+            self.path, tree=QuadTree((0, 0), 10, 10), snapshot_every=3
+        )
+
+        for x in range(-4, 5):
+            tree.insert((x, x), data=x)
+
+        self.assertEqual(tree.generation, 3)
+        self.assertEqual(
+            sorted(os.listdir(self.path)), ["log-3.log", "snapshot-3.qt"]
+        )
+        tree.insert((1, -1))
+        tree.snapshot()
+        tree.remove((0, 0))
+        expected = self.points(tree)
+        tree.close()
+
+        recovered = DurableQuadTree(self.path)
+        self.assertEqual(recovered.generation, 4)
+        self.assertEqual(self.points(recovered), expected)
+        recovered.close()
+
+    def test_failed_change(self):
+        tree = DurableQuadTree(
+            self.path, tree=QuadTree((0, 0), 10, 10), sync_every=1
+        )
+        tree.insert((1, 2), data="Samus")
+        log_path = os.path.join(self.path, "log-0.log")
+        log_size = os.path.getsize(log_path)
+
+        # Data that can't be logged, points out of bounds & removals that
+        # don't happen all leave both the tree & the log alone.
+        with self.assertRaises(TypeError):
+            tree.insert((3, 4), data=threading.Lock())
+
+        with self.assertRaises(ValueError):
+            tree.insert((30, 40), data="Link")
+
+        self.assertFalse(tree.remove((5, 5)))
+        self.assertIsNone(tree.find((3, 4)))
+        self.assertEqual(len(tree), 1)
+        tree.sync()
+        self.assertEqual(os.path.getsize(log_path), log_size)
+
+        tree.insert((3, 4), data="Link")
+        expected = self.points(tree)
+        tree.close()
+
+        recovered = DurableQuadTree(self.path)
+        self.assertEqual(self.points(recovered), expected)
+        recovered.close()
+
+    def test_leftover_temp_file(self):
+        tree = DurableQuadTree(self.path, tree=QuadTree((0, 0), 10, 10))
+        tree.insert((1, 2), data="Samus")
+        tree.close()
+
+        # As left behind by a crash part-way through a snapshot.
+        with open(os.path.join(self.path, "snapshot-1.qt.tmp"), "wb") as fp:
+            fp.write(b"partial")
+
+        recovered = DurableQuadTree(self.path)
+        self.assertEqual(
+            sorted(os.listdir(self.path)), ["log-0.log", "snapshot-0.qt"]
+        )
+        self.assertEqual(recovered.find((1, 2)).data, "Samus")
+        recovered.close()
+
+    def test_snapshot_failed(self):
+        tree = DurableQuadTree(self.path, tree=QuadTree((0, 0), 10, 10))
+        tree.insert((1, 2), data="Samus")
+
+        def dump(snap_file):
+            snap_file.write(b"partial")
+            raise OSError("No space left on device")
+
+        tree.tree.dump = dump
+
+        with self.assertRaises(OSError):
+            tree.snapshot()
+
+        # The partial snapshot is gone & the old log is still in use.
+        self.assertEqual(tree.generation, 0)
+        self.assertEqual(
+            sorted(os.listdir(self.path)), ["log-0.log", "snapshot-0.qt"]
+        )
+        del tree.tree.dump
+        tree.insert((3, 4), data="Link")
+        expected = self.points(tree)
+        tree.close()
+
+        recovered = DurableQuadTree(self.path)
+        self.assertEqual(self.points(recovered), expected)
+        recovered.close()
+
+    def test_keys(self):
+        tree = DurableQuadTree(
+            self.path,
+            tree=CompressedQuadTree(
+                (0, 0), 10, 10, key_func=lambda data: data["id"]
+            ),
+        )
+        tree.insert((1, 2), data={"id": "samus"})
+        tree.insert((3, 4), data={"id": "link"})
+        self.assertTrue(tree.remove_by_key("samus"))
+        self.assertFalse(tree.remove_by_key("samus"))
+        tree.close()
+
+        recovered = DurableQuadTree(
+            self.path, key_func=lambda data: data["id"]
+        )
+        self.assertTrue(isinstance(recovered.tree, CompressedQuadTree))
+        self.assertEqual(self.points(recovered), [(3, 4, {"id": "link"})])
+        self.assertEqual(recovered.tree.get_by_key("link"), Point(3, 4))
+        recovered.close()
+
+
+class StreamingTestCase(unittest.TestCase):
+    def test_read_csv(self):
+        csv_file = io.StringIO("name,lat,lng\nSamus,1.5,-2\nLink,3,4\n")
+        points = read_csv(csv_file, x_field="lng", y_field="lat")
+        self.assertFalse(isinstance(points, list))
+        self.assertEqual(
+            [(pnt.x, pnt.y, pnt.data) for pnt in points],
+            [(-2.0, 1.5, {"name": "Samus"}), (4.0, 3.0, {"name": "Link"})],
+        )
+
+        points = read_csv(io.StringIO("x;y\n1;2\n"), delimiter=";")
+        self.assertEqual(
+            [(pnt.x, pnt.y, pnt.data) for pnt in points], [(1, 2, None)]
+        )
+
+    def test_read_geojson(self):
+        geojson_file = io.StringIO(
+            '{"type": "Feature", "properties": {"name": "Samus"}, '
+            '"geometry": {"type": "Point", "coordinates": [1, 2]}}\n'
+            "\n"
+            '{"type": "Point", "coordinates": [3.5, 4, 100]}\n'
+        )
+        self.assertEqual(
+            [(pnt.x, pnt.y, pnt.data) for pnt in read_geojson(geojson_file)],
+            [(1, 2, {"name": "Samus"}), (3.5, 4, None)],
+        )
+
+        with self.assertRaises(ValueError):
+            list(
+                read_geojson(
+                    io.StringIO('{"type": "LineString", "coordinates": []}')
+                )
+            )
+
+    def test_write_csv(self):
+        tree = QuadTree((0, 0), 10, 10)
+        tree.insert((1, 2), data={"name": "Samus", "game": "Metroid"})
+        tree.insert((-3, 4), data="Link")
+        csv_file = io.StringIO()
+        self.assertEqual(
+            write_csv(tree, csv_file, fields=["name"], lineterminator="\n"),
+            2,
+        )
+        self.assertEqual(csv_file.getvalue(), "x,y,name\n1,2,Samus\n-3,4,\n")
+
+        csv_file.seek(0)
+        self.assertEqual(
+            [(pnt.x, pnt.y, pnt.data) for pnt in read_csv(csv_file)],
+            [(1, 2, {"name": "Samus"}), (-3, 4, {"name": ""})],
+        )
+
+    def test_write_geojson(self):
+        tree = QuadTree((0, 0), 10, 10)
+        tree.insert((1, 2), data={"name": "Samus"})
+        tree.insert((-3, 4), data="Link")
+        tree.insert((3, -4))
+        geojson_file = io.StringIO()
+        bb = BoundingBox(-5, 0, 5, 5)
+        self.assertEqual(
+            write_geojson(tree.iter_within_bb(bb), geojson_file), 2
+        )
+        geojson_file.seek(0)
+        self.assertEqual(
+            [(pnt.x, pnt.y, pnt.data) for pnt in read_geojson(geojson_file)],
+            [(1, 2, {"name": "Samus"}), (-3, 4, {"data": "Link"})],
+        )
+
+    def test_iter_within_bb(self):
+        tree = QuadTree((0, 0), 100, 100)
+
+        for x, y in test_data.data["large_random"]:
+            tree.insert((x, y))
+
+        for bb in (
+            BoundingBox(-20, -20, 20, 20),
+            BoundingBox(-100, -100, 100, 100),
+            BoundingBox(60, 60, 70, 70),
+        ):
+            points = tree.iter_within_bb(bb)
+            self.assertFalse(isinstance(points, list))
+            self.assertEqual(list(points), tree.within_bb(bb))
+
+    def test_insert_many(self):
+        tree = QuadTree((0, 0), 100, 100)
+
+        def points():
+            for offset, (x, y) in enumerate(test_data.data["large_random"]):
+                yield Point(x, y, data=offset)
+
+        self.assertEqual(tree.insert_many(points(), chunk_size=64), 1000)
+        self.assertEqual(len(tree), 1000)
+        self.assertEqual(tree.insert_many([(1, 2), [3, 4]]), 2)
+        self.assertEqual(tree.insert_many([]), 0)
+        self.assertEqual(
+            sorted(pnt.data for pnt in tree if pnt.data is not None),
+            list(range(1000)),
+        )
+
+        with self.assertRaises(ValueError):
+            tree.insert_many([(1, 2), (500, 500)])
+
+    def test_insert_many_bulk(self):
+        points = [
+            Point(x, y, data={"id": offset, "pri": offset % 17})
+            for offset, (x, y) in enumerate(test_data.data["large_random"])
+        ]
+        points.extend(Point(3, 3, data={"id": -n, "pri": 0}) for n in (1, 2))
+        kwargs = {
+            "capacity": 4,
+            "index": True,
+            "key_func": lambda data: data["id"],
+        }
+        bulk = QuadTree((0, 0), 100, 100, **kwargs)
+        one_by_one = QuadTree((0, 0), 100, 100, **kwargs)
+
+        for tree in (bulk, one_by_one):
+            tree.register_aggregate(
+                "priority", Aggregate.max(lambda data: data["pri"])
+            )
+
+        for pnt in points:
+            one_by_one.insert((pnt.x, pnt.y), data=pnt.data)
+
+        snapshot = bulk.snapshot()
+        self.assertEqual(bulk.insert_many(points, chunk_size=300), 1002)
+
+        # The same tree as inserting them one at a time.
+        self.assertEqual(
+            describe_nodes(bulk._root), describe_nodes(one_by_one._root)
+        )
+        self.assertEqual(
+            bulk._root.aggregate_values, one_by_one._root.aggregate_values
+        )
+        self.assertEqual(bulk.find((3, 3)).data["id"], -1)
+        self.assertEqual(bulk.get_by_key(500).data["id"], 500)
+        self.assertEqual(len(snapshot), 0)
+
+        # A bad point anywhere in a chunk keeps all of the chunk out.
+        with self.assertRaises(ValueError):
+            bulk.insert_many([Point(1, 2, data={"id": "new"}), points[0]])
+
+        with self.assertRaises(ValueError):
+            bulk.insert_many([Point(1, 2, data={"id": "new"}), (500, 500)])
+
+        self.assertEqual(len(bulk), 1002)
+        self.assertIsNone(bulk.get_by_key("new"))
+
+    def test_insert_many_expanding(self):
+        tree = QuadTree((0, 0), 10, 10, auto_expand=True)
+        self.assertEqual(
+            tree.insert_many([(1, 2), (-300, 40), (120, -7)], chunk_size=2), 3
+        )
+        self.assertEqual(len(tree), 3)
+        self.assertEqual(
+            len(tree.within_bb(BoundingBox(-1000, -1000, 1000, 1000))), 3
+        )
+
+
+class CoordinatesTestCase(unittest.TestCase):
+    def setUp(self):
+        super(CoordinatesTestCase, self).setUp()
+        self.tree = QuadTree((0, 0), 100, 100)
+
+        for x, y in test_data.data["large_random"]:
+            self.tree.insert((x, y))
+
+        self.tree.insert((0.25, -0.5))
+
+    def test_coordinates(self):
+        xs, ys = self.tree.coordinates()
+        self.assertEqual(memoryview(xs).format, "d")
+        self.assertEqual(
+            list(zip(xs, ys)), [(pnt.x, pnt.y) for pnt in self.tree]
+        )
+
+        bb = BoundingBox(-20, -20, 20, 20)
+        xs, ys = self.tree.coordinates(bb=bb)
+        self.assertEqual(
+            list(zip(xs, ys)),
+            [(pnt.x, pnt.y) for pnt in self.tree.within_bb(bb)],
+        )
+
+    def test_node_offsets(self):
+        xs, ys = self.tree.coordinates()
+        nodes, offsets = self.tree.node_offsets()
+        self.assertEqual(len(offsets), 2 * len(nodes))
+        self.assertEqual(len(nodes), count_nodes(self.tree._root))
+        self.assertIs(nodes[0], self.tree._root)
+        self.assertEqual((offsets[0], offsets[1]), (0, 1001))
+
+        for offset, node in enumerate(nodes):
+            start, end = offsets[2 * offset], offsets[2 * offset + 1]
+            self.assertEqual(
+                sorted(zip(xs[start:end], ys[start:end])),
+                sorted((pnt.x, pnt.y) for pnt in node),
+            )
+
+    def test_mapped(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        path = os.path.join(tmp_dir, "tree.qt")
+
+        with open(path, "wb") as dump_file:
+            self.tree.dump(dump_file)
+
+        expected_xs, expected_ys = self.tree.coordinates()
+        _, expected_offsets = self.tree.node_offsets()
+        bb = BoundingBox(-20, -20, 20, 20)
+
+        with MappedQuadTree(path) as mapped:
+            xs, ys = mapped.coordinates()
+            self.assertTrue(isinstance(xs, memoryview))
+            self.assertEqual(list(xs), list(expected_xs))
+            self.assertEqual(list(ys), list(expected_ys))
+            self.assertEqual(mapped.node_offsets(), expected_offsets)
+            self.assertEqual(
+                mapped.coordinates(bb=bb), self.tree.coordinates(bb=bb)
+            )
+            del xs, ys
+
+    def test_to_numpy(self):
+        try:
+            import numpy
+        except ImportError:
+            self.skipTest("numpy is not installed")
+
+        xs, ys = self.tree.to_numpy()
+        self.assertEqual(xs.dtype, numpy.float64)
+        self.assertEqual(
+            list(zip(xs, ys)), [(pnt.x, pnt.y) for pnt in self.tree]
+        )
+
+
+def describe_nodes(node):
+    # The shape of a tree, for comparing trees built different ways.
+    stack = [node]
+    nodes = []
+
+    while stack:
+        node = stack.pop()
+        nodes.append(
+            (
+                node.center.x,
+                node.center.y,
+                node.width,
+                node.height,
+                node.depth,
+                node.subdivided,
+                node.count,
+                sorted((pnt.x, pnt.y, repr(pnt.data)) for pnt in node.points),
+            )
+        )
+
+        for child in (node.lr, node.ll, node.ur, node.ul):
+            if child is not None:
+                stack.append(child)
+
+    return nodes
+
+
+class BuildFileTestCase(unittest.TestCase):
+    def setUp(self):
+        super(BuildFileTestCase, self).setUp()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, "tree.qt")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+        super(BuildFileTestCase, self).tearDown()
+
+    def create_points(self):
+        points = []
+
+        for offset, (x, y) in enumerate(test_data.data["large_random"]):
+            data = None if offset % 3 else {"id": offset}
+            points.append(Point(x, y, data=data))
+
+        # Some duplicates & non-integer coordinates too.
+        for offset in range(10):
+            points.append(Point(0.25, -0.5, data=offset))
+
+        return points
+
+    def assert_same_as_inserting(self, points, **kwargs):
+        tree = QuadTree((0, 0), 100, 100, **kwargs)
+
+        for pnt in points:
+            tree.insert((pnt.x, pnt.y), data=pnt.data)
+
+        with open(self.path, "rb") as tree_file:
+            loaded = QuadTree.load(tree_file)
+
+        self.assertEqual(
+            describe_nodes(loaded._root), describe_nodes(tree._root)
+        )
+        self.assertEqual(
+            [pnt.data for pnt in loaded.nearest_neighbors((0.25, -0.5), 10)],
+            list(range(10)),
+        )
+
+    def test_build_file(self):
+        points = self.create_points()
+        self.assertEqual(
+            build_file(iter(points), self.path, (0, 0), 100, 100), len(points)
+        )
+        self.assert_same_as_inserting(points)
+
+    def test_many_runs(self):
+        # More runs than get merged at once, so this takes extra passes.
+        points = self.create_points()
+        build_file(
+            points,
+            self.path,
+            (0, 0),
+            100,
+            100,
+            capacity=2,
+            max_depth=6,
+            chunk_size=7,
+            temp_dir=self.tmp_dir,
+        )
+        self.assertEqual(os.listdir(self.tmp_dir), ["tree.qt"])
+        self.assert_same_as_inserting(points, capacity=2, max_depth=6)
+
+    def test_mapped(self):
+        points = self.create_points()
+        build_file(points, self.path, (0, 0), 100, 100, index=True)
+        bb = BoundingBox(-20, -20, 20, 20)
+
+        with open(self.path, "rb") as tree_file:
+            loaded = QuadTree.load(tree_file)
+
+        self.assertIsNotNone(loaded._index)
+
+        with MappedQuadTree(self.path) as mapped:
+            self.assertEqual(len(mapped), len(points))
+            self.assertEqual(
+                sorted((pnt.x, pnt.y) for pnt in mapped.within_bb(bb)),
+                sorted((pnt.x, pnt.y) for pnt in points if bb.contains(pnt)),
+            )
+            self.assertEqual(mapped.find((0.25, -0.5)).data, 0)
+
+    def test_empty(self):
+        self.assertEqual(build_file([], self.path, (3, 4), 10, 20), 0)
+
+        with MappedQuadTree(self.path) as mapped:
+            self.assertEqual(str(mapped), "<MappedQuadTree: (3, 4) 10x20>")
+            self.assertEqual(len(mapped), 0)
+
+    def test_out_of_bounds(self):
+        with self.assertRaises(ValueError):
+            build_file([(1, 2), (500, 500)], self.path, (0, 0), 100, 100)
+
+
+class SnapshotTestCase(unittest.TestCase):
+    def create_tree(self, tree_class=QuadTree, **kwargs):
+        tree = tree_class((0, 0), 100, 100, **kwargs)
+
+        for offset, (x, y) in enumerate(test_data.data["large_random"]):
+            tree.insert((x, y), data={"id": offset})
+
+        return tree
+
+    def describe(self, tree):
+        return describe_nodes(tree._root)
+
+    def test_snapshot(self):
+        tree = self.create_tree()
+        before = self.describe(tree)
+        view = tree.snapshot()
+        self.assertTrue(view.read_only)
+        self.assertFalse(tree.read_only)
+        self.assertIs(view._root, tree._root)
+
+        # Only the path down to the new point is copied.
+        tree.insert((40.5, 40.5), data={"id": "new"})
+        self.assertIsNot(view._root, tree._root)
+        self.assertIs(view._root.ll, tree._root.ll)
+        self.assertIsNot(view._root.ur, tree._root.ur)
+
+        for x, y in test_data.data["large_random"][:300]:
+            tree.remove((x, y))
+
+        for offset in range(200):
+            tree.insert((offset / 5 - 20, offset / 7), data={"id": offset})
+
+        self.assertEqual(self.describe(view), before)
+        self.assertEqual(len(view), 1000)
+        self.assertEqual(len(tree), 901)
+        self.assertIsNone(view.find((40.5, 40.5)))
+        self.assertEqual(tree.find((40.5, 40.5)).data, {"id": "new"})
+
+        # The tree itself is still consistent.
+        self.assertEqual(tree._root.count, len(list(tree)))
+        expected = QuadTree((0, 0), 100, 100)
+
+        for pnt in tree:
+            expected.insert((pnt.x, pnt.y))
+
+        self.assertEqual(
+            sorted((pnt.x, pnt.y) for pnt in tree),
+            sorted((pnt.x, pnt.y) for pnt in expected),
+        )
+
+    def test_several_snapshots(self):
+        tree = QuadTree((0, 0), 10, 10)
+        inserted = []
+        views = []
+
+        for offset in range(20):
+            views.append(tree.snapshot())
+            inserted.append((offset / 4 - 2.5, offset / 5 - 2))
+            tree.insert(inserted[-1])
+
+        for offset, view in enumerate(views):
+            self.assertEqual(len(view), offset)
+            self.assertEqual(
+                sorted((pnt.x, pnt.y) for pnt in view),
+                sorted(inserted[:offset]),
+            )
+
+    def test_read_only(self):
+        tree = self.create_tree(key_func=lambda data: data["id"])
+        view = tree.snapshot()
+
+        with self.assertRaises(ValueError):
+            view.insert((1, 2))
+
+        with self.assertRaises(ValueError):
+            view.remove((1, 2))
+
+        with self.assertRaises(ValueError):
+            view.remove_by_key(5)
+
+        with self.assertRaises(ValueError):
+            view.register_aggregate("count", Aggregate.count())
+
+        # Queries still work, without the indexes.
+        self.assertEqual(view.get_by_key(5), tree.get_by_key(5))
+        self.assertIsNone(view.get_by_key("nope"))
+        self.assertEqual(view.snapshot()._root, tree._root)
+
+    def test_keys(self):
+        tree = self.create_tree(index=True, key_func=lambda data: data["id"])
+        view = tree.snapshot()
+
+        for offset in range(0, 1000, 2):
+            self.assertTrue(tree.remove_by_key(offset))
+
+        self.assertEqual(len(tree), 500)
+        self.assertIsNone(tree.get_by_key(0))
+        self.assertEqual(len(view), 1000)
+        self.assertEqual(view.get_by_key(0).data, {"id": 0})
+
+        pnt = test_data.data["large_random"][0]
+        self.assertTrue(pnt in view)
+
+    def test_aggregates(self):
+        tree = self.create_tree()
+        tree.register_aggregate("count", Aggregate.count())
+        view = tree.snapshot()
+        tree.insert((1, 1), data={"id": "new"})
+        tree.register_aggregate("total", Aggregate.sum(lambda data: 1))
+        bb = BoundingBox(-50, -50, 50, 50)
+        self.assertEqual(view.aggregate_within_bb(bb, "count"), 1000)
+        self.assertEqual(tree.aggregate_within_bb(bb, "count"), 1001)
+        self.assertEqual(tree.aggregate_within_bb(bb, "total"), 1001)
+        self.assertNotIn("total", view._root.aggregates)
+
+    def test_compressed_expanding(self):
+        tree = CompressedQuadTree((0, 0), 2 ** 20, 2 ** 20, auto_expand=True)
+
+        for x, y in test_data.data["large_random"]:
+            tree.insert((x / 1000, y / 1000))
+
+        before = self.describe(tree)
+        view = tree.snapshot()
+
+        for x, y in test_data.data["large_random"][:100]:
+            tree.insert((x / 1000 + 0.0001, y / 1000))
+            tree.remove((x / 1000, y / 1000))
+
+        tree.insert((2 ** 21, 2 ** 21))
+        self.assertEqual(self.describe(view), before)
+        self.assertEqual(len(tree), 1001)
+        self.assertEqual(tree._root.count, len(list(tree)))
+
+
+class ConcurrentQuadTreeTestCase(unittest.TestCase):
+    def test_init(self):
+        tree = ConcurrentQuadTree((0, 0), 100, 100, lock_depth=2)
+        self.assertEqual(str(tree), "<ConcurrentQuadTree: (0, 0) 100x100>")
+        self.assertEqual(len(tree._partitions), 16)
+        self.assertEqual(len(tree), 0)
+
+        with self.assertRaises(ValueError):
+            ConcurrentQuadTree((0, 0), 100, 100, max_depth=3, lock_depth=4)
+
+    def test_same_as_quadtree(self):
+        for lock_depth in (0, 1, 2):
+            tree = ConcurrentQuadTree((0, 0), 100, 100, lock_depth=lock_depth)
+            plain = QuadTree((0, 0), 100, 100)
+
+            for offset, (x, y) in enumerate(test_data.data["large_random"]):
+                tree.insert((x, y), data=offset)
+                plain.insert((x, y), data=offset)
+
+            self.assertEqual(len(tree), 1000)
+            self.assertEqual(
+                sorted((pnt.x, pnt.y, pnt.data) for pnt in tree),
+                sorted((pnt.x, pnt.y, pnt.data) for pnt in plain),
+            )
+            self.assertEqual(tree.find((40, 40)), Point(40, 40))
+            self.assertTrue((40, 40) in tree)
+            self.assertIsNone(tree.find((40.5, 40)))
+            self.assertIsNone(tree.find((400, 40)))
+
+            bb = BoundingBox(-20, -20, 20, 20)
+            self.assertEqual(
+                sorted((pnt.x, pnt.y) for pnt in tree.within_bb(bb)),
+                sorted((pnt.x, pnt.y) for pnt in plain.within_bb(bb)),
+            )
+
+            for query in (
+                BoundingBox(0, 0, 0, 0),
+                BoundingBox(49, -49, 49, -49),
+                BoundingBox(10, 10, 20, 20),
+            ):
+                self.assertEqual(
+                    [
+                        query.point_compare(pnt)
+                        for pnt in tree.nearest_neighbors(query, count=15)
+                    ],
+                    [
+                        query.point_compare(pnt)
+                        for pnt in plain.nearest_neighbors(query, count=15)
+                    ],
+                )
+
+            self.assertEqual(
+                [
+                    euclidean_compare(Point(3, 4), pnt)
+                    for pnt in tree.nearest_neighbors((3, 4), count=15)
+                ],
+                [
+                    euclidean_compare(Point(3, 4), pnt)
+                    for pnt in plain.nearest_neighbors((3, 4), count=15)
+                ],
+            )
+
+            self.assertEqual(tree.nearest_neighbors((500, 500)), [])
+            self.assertEqual(tree.nearest_neighbors((3, 4), count=0), [])
+            self.assertEqual(
+                tree.nearest_neighbors(BoundingBox(0, 0, 1, 1), count=0), []
+            )
+            self.assertTrue(tree.remove((40, 40)))
+            self.assertFalse(tree.remove((400, 40)))
+            self.assertEqual(len(tree), 999)
+
+        with self.assertRaises(ValueError):
+            tree.insert((500, 500))
+
+    def test_read_write_lock(self):
+        lock = ReadWriteLock()
+        events = []
+
+        with lock.reading():
+            with lock.reading():
+                events.append("two readers")
+
+        def write():
+            with lock.writing():
+                events.append("writer")
+
+        with lock.reading():
+            writer = threading.Thread(target=write)
+            writer.start()
+            writer.join(0.05)
+            # Still waiting for the reader.
+            self.assertEqual(events, ["two readers"])
+
+        writer.join()
+        self.assertEqual(events, ["two readers", "writer"])
+
+    def test_stress(self):
+        tree = ConcurrentQuadTree((0, 0), 100, 100, capacity=4)
+        points = [
+            (x, y, offset)
+            for offset, (x, y) in enumerate(test_data.data["large_random"])
+        ]
+        errors = []
+        done = threading.Event()
+
+        def write(chunk):
+            try:
+                for x, y, offset in chunk:
+                    self.assertTrue(tree.insert((x, y), data=offset))
+            except Exception as exc:  # pragma: no cover
+                errors.append(exc)
+
+        def read():
+            bb = BoundingBox(-25, -25, 25, 25)
+
+            try:
+                while not done.is_set():
+                    seen = [pnt.data for pnt in tree]
+                    self.assertEqual(len(seen), len(set(seen)))
+                    self.assertLessEqual(len(tree.within_bb(bb)), 1000)
+                    tree.nearest_neighbors((1, 1), count=5)
+            except Exception as exc:  # pragma: no cover
+                errors.append(exc)
+
+        writers = [
+            threading.Thread(target=write, args=(points[offset::8],))
+            for offset in range(8)
+        ]
+        readers = [threading.Thread(target=read) for _ in range(4)]
+
+        for thread in readers + writers:
+            thread.start()
+
+        for thread in writers:
+            thread.join()
+
+        done.set()
+
+        for thread in readers:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(tree), 1000)
+        self.assertEqual(sorted(pnt.data for pnt in tree), list(range(1000)))
+
+        # Removing concurrently, too.
+        def remove(chunk):
+            for x, y, _ in chunk:
+                tree.remove((x, y))
+
+        removers = [
+            threading.Thread(target=remove, args=(points[offset::4],))
+            for offset in range(4)
+        ]
+
+        for thread in removers:
+            thread.start()
+
+        for thread in removers:
+            thread.join()
+
+        self.assertEqual(len(tree), 0)
+        self.assertEqual(list(tree), [])
+
+
+class AsyncQuadTreeTestCase(unittest.TestCase):
+    def setUp(self):
+        super(AsyncQuadTreeTestCase, self).setUp()
+        self.plain = QuadTree((0, 0), 100, 100)
+
+        for offset, (x, y) in enumerate(test_data.data["large_random"]):
+            self.plain.insert((x, y), data=offset)
+
+        self.tree = AsyncQuadTree(self.plain, yield_every=10)
+
+    def test_init(self):
+        with self.assertRaises(ValueError):
+            AsyncQuadTree(self.plain, yield_every=0)
+
+    def test_queries(self):
+        bb = BoundingBox(-20, -20, 20, 20)
+
+        async def run():
+            return await asyncio.gather(
+                self.tree.find((40, 40)),
+                self.tree.within_bb(bb),
+                self.tree.nearest_neighbors((5, 5), count=3),
+            )
+
+        found, within, nearest = asyncio.run(run())
+        self.assertEqual(found, Point(40, 40))
+        self.assertEqual(within, self.plain.within_bb(bb))
+        self.assertEqual(nearest, self.plain.nearest_neighbors((5, 5), 3))
+
+    def test_iter_within_bb(self):
+        bb = BoundingBox(-20, -20, 20, 20)
+        ticks = []
+
+        async def tick():
+            while True:
+                ticks.append(1)
+                await asyncio.sleep(0)
+
+        async def run():
+            ticker = asyncio.ensure_future(tick())
+            await asyncio.sleep(0)
+            points = [pnt async for pnt in self.tree.iter_within_bb(bb)]
+            ticker.cancel()
+            return points
+
+        points = asyncio.run(run())
+        self.assertEqual(points, self.plain.within_bb(bb))
+        # The event loop got to run other tasks along the way.
+        self.assertGreater(len(ticks), 5)
+
+    def test_aiter(self):
+        async def run():
+            points = []
+
+            async for pnt in self.tree:
+                # Changes made mid-iteration aren't seen.
+                if not points:
+                    self.plain.insert((1.5, 1.5), data="new")
+
+                points.append(pnt)
+
+            return points
+
+        points = asyncio.run(run())
+        self.assertEqual(len(points), 1000)
+        self.assertEqual(
+            sorted(pnt.data for pnt in points), list(range(1000))
+        )
+        self.assertEqual(len(self.plain), 1001)
+
+    def test_reuses_snapshot(self):
+        bb = BoundingBox(-20, -20, 20, 20)
+
+        async def run():
+            await self.tree.find((40, 40))
+            await self.tree.within_bb(bb)
+            await self.tree.nearest_neighbors((5, 5), count=3)
+
+        asyncio.run(run())
+        # One snapshot served all three, so only one epoch went by.
+        self.assertEqual(self.plain._epoch, 1)
+        view = self.tree._view
+
+        self.plain.insert((1.5, 1.5), data="new")
+        # The write only copied nodes the once, not per query.
+        self.assertIsNot(self.plain._root, view._root)
+        root = self.plain._root
+        self.plain.insert((2.5, 2.5), data="newer")
+        self.assertIs(self.plain._root, root)
+
+        async def find():
+            return await self.tree.find((2.5, 2.5))
+
+        self.assertEqual(asyncio.run(find()).data, "newer")
+        self.assertEqual(self.plain._epoch, 2)
+
+
+class ShardedQuadTreeTestCase(unittest.TestCase):
+    def setUp(self):
+        super(ShardedQuadTreeTestCase, self).setUp()
+        self.tree = ShardedQuadTree((0, 0), 100, 100, capacity=8)
+        self.addCleanup(self.tree.close)
+        self.plain = QuadTree((0, 0), 100, 100, capacity=8)
+        points = []
+
+        for offset, (x, y) in enumerate(test_data.data["large_random"]):
+            points.append(Point(x, y, data=offset))
+            self.plain.insert((x, y), data=offset)
+
+        self.assertEqual(self.tree.insert_many(points, chunk_size=300), 1000)
+
+    def test_init(self):
+        self.assertEqual(str(self.tree), "<ShardedQuadTree: (0, 0) 100x100>")
+        self.assertEqual(len(self.tree._processes), 4)
+        self.assertEqual(len(self.tree), 1000)
+
+        with self.assertRaises(ValueError):
+            ShardedQuadTree((0, 0), 10, 10, max_depth=2, shard_depth=3)
+
+    def test_insert_find_remove(self):
+        self.assertTrue(self.tree.insert((1.5, -2.5), data={"name": "Samus"}))
+        self.assertEqual(self.tree.find((1.5, -2.5)).data, {"name": "Samus"})
+        self.assertTrue((1.5, -2.5) in self.tree)
+        self.assertEqual(self.tree.find((40, 40)), Point(40, 40))
+        self.assertIsNone(self.tree.find((40.5, 40)))
+        self.assertIsNone(self.tree.find((400, 40)))
+
+        self.assertTrue(self.tree.remove((1.5, -2.5)))
+        self.assertFalse(self.tree.remove((1.5, -2.5)))
+        self.assertFalse(self.tree.remove((400, 40)))
+        self.assertEqual(len(self.tree), 1000)
+
+        with self.assertRaises(ValueError):
+            self.tree.insert((500, 500))
+
+        with self.assertRaises(ValueError):
+            self.tree.insert_many([(1, 1), (500, 500)])
+
+    def test_within_bb(self):
+        for bb in (
+            BoundingBox(-20, -20, 20, 20),
+            BoundingBox(10, 10, 30, 30),
+            BoundingBox(-100, -100, 100, 100),
+        ):
+            self.assertEqual(
+                sorted(pnt.data for pnt in self.tree.within_bb(bb)),
+                sorted(pnt.data for pnt in self.plain.within_bb(bb)),
+            )
+
+    def test_nearest_neighbors(self):
+        for query in (
+            BoundingBox(0, 0, 0, 0),
+            BoundingBox(30, -30, 30, -30),
+            BoundingBox(-5, 10, 5, 20),
+        ):
+            self.assertEqual(
+                [
+                    query.point_compare(pnt)
+                    for pnt in self.tree.nearest_neighbors(query, count=12)
+                ],
+                [
+                    query.point_compare(pnt)
+                    for pnt in self.plain.nearest_neighbors(query, count=12)
+                ],
+            )
+
+        nearest = self.tree.nearest_neighbors((3, 4), count=5)
+        self.assertEqual(
+            [euclidean_compare(Point(3, 4), pnt) for pnt in nearest],
+            [
+                euclidean_compare(Point(3, 4), pnt)
+                for pnt in self.plain.nearest_neighbors((3, 4), count=5)
+            ],
+        )
+        self.assertEqual(len(self.tree.nearest_neighbors((0, 0), 2000)), 1000)
+        self.assertEqual(self.tree.nearest_neighbors((500, 500)), [])
+        self.assertEqual(self.tree.nearest_neighbors((3, 4), count=0), [])
+        self.assertEqual(
+            self.tree.nearest_neighbors(BoundingBox(0, 0, 1, 1), count=0), []
+        )
+
+    def test_convert_to_point(self):
+        self.assertEqual(self.tree.convert_to_point((5, 6)), Point(5, 6))
+        self.assertEqual(self.tree.convert_to_point(None), Point(0, 0))
+
+        with self.assertRaises(ValueError):
+            self.tree.convert_to_point("Samus")